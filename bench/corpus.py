@@ -0,0 +1,124 @@
+"""
+Synthetic tweet corpora for benchmarks. Statuses are generated as raw
+streaming API JSON from a seeded random generator, so a corpus is the
+same on every run and every commit.
+"""
+import json
+import random
+
+from typing import List
+
+from twitlib.status import LazyStatus
+
+# Snowflake id of the first generated status, ids advance by ~10ms
+BASE_ID = 1200000000000000000
+ID_STEP = 10 << 22
+
+WORDS = (
+    'the', 'quick', 'brown', 'fox', 'jumps', 'over', 'lazy', 'dog', 'stream',
+    'tweet', 'mirror', 'photo', 'today', 'news', 'game', 'follow', 'retweet',
+)
+
+# Named corpora: max media per status, max hashtags per status, retweet ratio
+PRESETS = {
+    'text': dict(media=0, hashtags=2, retweets=0.1),
+    'media': dict(media=4, hashtags=2, retweets=0.1),
+    'trending': dict(media=1, hashtags=8, retweets=0.7),
+}
+
+def generate(
+        count: int,
+        media: int = 0,
+        hashtags: int = 2,
+        retweets: float = 0.1,
+        media_url: str = 'https://pbs.twimg.com/media',
+        seed: int = 0) -> List[dict]:
+    """
+    Generate raw status dicts.
+
+    Args
+    ===
+        count : int
+    Number of statuses
+
+        media : int
+    Maximum media items per status, each status has 0 to `media` items
+
+        hashtags : int
+    Maximum hashtags per status
+
+        retweets : float in [0, 1]
+    Fraction of statuses that are retweets, which embed the original status
+
+        media_url : str
+    Base URL of media items, e.g. a local HTTP stand-in
+
+        seed : int
+    Random seed
+
+    Return: list of dicts in the streaming API layout
+    """
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        status = _status(rng, BASE_ID + i * ID_STEP, media, hashtags, media_url)
+        if rng.random() < retweets:
+            original = _status(rng, BASE_ID - (i + 1) * ID_STEP, media, hashtags, media_url)
+            status['retweeted_status'] = original
+            status['text'] = 'RT @%s: %s' % (original['user']['screen_name'], original['text'])
+            status['entities'] = original['entities']
+        result.append(status)
+    return result
+
+def preset(name: str, count: int, media_url: str = 'https://pbs.twimg.com/media', seed: int = 0) -> List[dict]:
+    """Generate one of the PRESETS corpora"""
+    return generate(count, media_url=media_url, seed=seed, **PRESETS[name])
+
+def lines(corpus: List[dict]) -> List[bytes]:
+    """Encode a corpus as lines of the streaming API"""
+    return [json.dumps(data, separators=(',', ':')).encode('utf-8') for data in corpus]
+
+def statuses(corpus: List[dict]) -> List[LazyStatus]:
+    """Build fresh statuses from a corpus, with no cached attributes"""
+    return [LazyStatus(data) for data in corpus]
+
+def _status(rng: random.Random, status_id: int, media: int, hashtags: int, media_url: str) -> dict:
+    user_id = rng.randrange(1, 100000)
+    tags = ['tag%i' % rng.randrange(1000) for _ in range(rng.randint(0, hashtags))]
+    words = [rng.choice(WORDS) for _ in range(rng.randint(5, 25))]
+    text = ' '.join(words + ['#' + t for t in tags])
+
+    items = []
+    for j in range(rng.randint(0, media)):
+        media_id = status_id + j
+        items.append({
+            'id': media_id,
+            'id_str': str(media_id),
+            'type': 'photo',
+            'media_url_https': '%s/%i.jpg' % (media_url, media_id),
+            'url': 'https://t.co/%i' % media_id,
+        })
+
+    entities = {
+        'hashtags': [{'text': t, 'indices': [0, len(t) + 1]} for t in tags],
+        'urls': [],
+        'user_mentions': [],
+    }
+    if items:
+        entities['media'] = items
+
+    return {
+        'id': status_id,
+        'id_str': str(status_id),
+        'created_at': 'Wed Oct 10 20:19:24 +0000 2018',
+        'text': text,
+        'lang': 'en',
+        'user': {
+            'id': user_id,
+            'screen_name': 'user%i' % user_id,
+            'followers_count': rng.randrange(10 ** rng.randint(1, 7)),
+        },
+        'entities': entities,
+        'favorite_count': rng.randrange(100),
+        'retweet_count': rng.randrange(100),
+    }
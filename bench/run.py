@@ -0,0 +1,301 @@
+"""
+Benchmarks of the Dispatcher -> WorkerThread pipeline. Each stage is run
+over synthetic corpora (see bench.corpus) in a fresh process, and reports
+statuses per second, p50/p99 latency per status and the peak RSS of the
+process. Media downloads are served by a local HTTP stand-in, so no
+network access is needed.
+
+Run from the repository root:
+
+    python -m bench.run --output results.json
+    python -m bench.run --corpus media --stages download --count 500
+    python -m bench.run --compare base.json head.json
+
+`make bench` writes results named after the current commit to
+bench/results/, and `make bench-compare base=<commit> head=<commit>`
+compares two of them.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import Callable, Dict, List
+
+from bench import corpus as corpora
+
+import twitlib.codec as codec
+import twitlib.download as download
+from twitlib.filters import compile_filters
+from twitlib.segments import SegmentWriter
+from twitlib.streaming import Dispatcher, WorkerThread, WriterThread, MirrorThread, MediaDownloaderThread
+
+#######################################################################
+#               STAGES
+#######################################################################
+
+# Each stage takes a corpus and a scratch directory, and returns the
+# seconds spent on each status.
+
+def bench_decode(corpus: List[dict], workdir: str) -> List[float]:
+    """codec.decode_status() of streaming API lines"""
+    return _timed(corpora.lines(corpus), codec.decode_status)
+
+def bench_dispatch(corpus: List[dict], workdir: str) -> List[float]:
+    """Dispatcher.on_status() with each worker class's default filters"""
+    threads = [WriterThread, MediaDownloaderThread, MirrorThread]
+    for thread_cls in threads:
+        thread_cls.configure_queue()
+
+    dispatcher = Dispatcher(threads=threads, filters={
+        WriterThread: [WriterThread.default_filter],
+        MediaDownloaderThread: [MediaDownloaderThread.default_filter],
+        MirrorThread: [MirrorThread.default_filter],
+    })
+    return _timed(corpora.statuses(corpus), dispatcher.on_status)
+
+def bench_validate(corpus: List[dict], workdir: str) -> List[float]:
+    """WorkerThread.validate_status() with the writer and mirror filters"""
+    # Compiled once, as workers do when their filters are set
+    chain = compile_filters([WriterThread.default_filter, MirrorThread.default_filter])
+    return _timed(corpora.statuses(corpus), lambda s: WorkerThread.validate_status(s, chain))
+
+def bench_format(corpus: List[dict], workdir: str) -> List[float]:
+    """WorkerThread.format_filename() of the default writer format"""
+    return _timed(
+            corpora.statuses(corpus),
+            lambda s: WorkerThread.format_filename(s, 'status_{id}.json', workdir)
+    )
+
+def bench_write(corpus: List[dict], workdir: str) -> List[float]:
+    """WriterThread.write_status(), one UTF-32 JSON file per status"""
+    return _timed(
+            corpora.statuses(corpus),
+            lambda s: WriterThread.write_status(s, os.path.join(workdir, 'status_%i.json' % s.id))
+    )
+
+def bench_write_raw(corpus: List[dict], workdir: str) -> List[float]:
+    """WriterThread.write_raw(), one raw JSON file per status"""
+    statuses = [codec.decode_status(line) for line in corpora.lines(corpus)]
+    return _timed(
+            statuses,
+            lambda s: WriterThread.write_raw(s, os.path.join(workdir, 'status_%i.json' % s.id))
+    )
+
+def bench_segment(corpus: List[dict], workdir: str) -> List[float]:
+    """SegmentWriter.write() of raw JSON lines"""
+    statuses = [codec.decode_status(line) for line in corpora.lines(corpus)]
+    writer = SegmentWriter(workdir, thread='bench')
+    try:
+        return _timed(statuses, writer.write)
+    finally:
+        writer.close()
+
+def bench_download(corpus: List[dict], workdir: str) -> List[float]:
+    """MediaDownloaderThread.download_media() from a local HTTP server"""
+    return _timed(
+            corpora.statuses(corpus),
+            lambda s: MediaDownloaderThread.download_media(s, os.path.join(workdir, 'media_%i' % s.id))
+    )
+
+STAGES = OrderedDict([
+    ('decode', bench_decode),
+    ('dispatch', bench_dispatch),
+    ('validate', bench_validate),
+    ('format', bench_format),
+    ('write', bench_write),
+    ('write_raw', bench_write_raw),
+    ('segment', bench_segment),
+    ('download', bench_download),
+])
+
+def _timed(items: list, func: Callable) -> List[float]:
+    clock = time.perf_counter
+    latencies = []
+    for item in items:
+        start = clock()
+        func(item)
+        latencies.append(clock() - start)
+    return latencies
+
+#######################################################################
+#               HARNESS
+#######################################################################
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """Serves `size` bytes for every path, standing in for pbs.twimg.com"""
+
+    size = 64 * 1024
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'\xff' * self.size
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def run_stage(stage: str, preset: str, count: int, seed: int, media_bytes: int) -> Dict[str, float]:
+    """Run one stage over one corpus, meant to be called in a fresh process"""
+    logging.getLogger('twitlib').setLevel(logging.WARNING)
+
+    MediaHandler.size = media_bytes
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    media_url = 'http://127.0.0.1:%i/media' % server.server_address[1]
+
+    corpus = corpora.preset(preset, count, media_url=media_url, seed=seed)
+    start_rss = _peak_rss_mb()
+    with tempfile.TemporaryDirectory(prefix='twitlib_bench_') as workdir:
+        start = time.perf_counter()
+        latencies = STAGES[stage](corpus, workdir)
+        elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    latencies.sort()
+    return {
+        'count': len(latencies),
+        'seconds': elapsed,
+        'per_sec': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+        'p50_ms': 1000 * _percentile(latencies, 0.50),
+        'p99_ms': 1000 * _percentile(latencies, 0.99),
+        'peak_rss_mb': _peak_rss_mb(),
+        'rss_growth_mb': _peak_rss_mb() - start_rss,
+    }
+
+def run(presets: List[str], stages: List[str], count: int, seed: int, media_bytes: int) -> dict:
+    """Run stages over corpora, each in its own process so peak RSS is per stage"""
+    results = OrderedDict()
+    for preset in presets:
+        results[preset] = OrderedDict()
+        for stage in stages:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                summary = pool.submit(run_stage, stage, preset, count, seed, media_bytes).result()
+            results[preset][stage] = summary
+            print('%-9s %-10s %10.0f/s  p50 %8.3fms  p99 %8.3fms  rss %7.1fMB' % (
+                    preset, stage, summary['per_sec'], summary['p50_ms'],
+                    summary['p99_ms'], summary['peak_rss_mb']
+            ))
+
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'count': count,
+        'seed': seed,
+        'media_bytes': media_bytes,
+        'results': results,
+    }
+
+def compare(base: dict, head: dict, threshold: float = 5.0) -> List[str]:
+    """
+    Compare two result files, printing the change per stage. Throughput
+    drops or p99 increases beyond `threshold` percent are flagged.
+
+    Return: Descriptions of the flagged regressions
+    """
+    print('base %s, head %s' % (base.get('commit'), head.get('commit')))
+    print('%-9s %-10s %12s %12s %8s %10s %10s %8s' % (
+            'corpus', 'stage', 'base/s', 'head/s', 'change', 'base p99', 'head p99', 'change'))
+
+    regressions = []
+    for preset, stages in head['results'].items():
+        for stage, new in stages.items():
+            old = base['results'].get(preset, {}).get(stage)
+            if old is None:
+                continue
+
+            rate = _change(old['per_sec'], new['per_sec'])
+            p99 = _change(old['p99_ms'], new['p99_ms'])
+            flag = ''
+            if rate < -threshold or p99 > threshold:
+                flag = '  <-- regression'
+                regressions.append('%s/%s' % (preset, stage))
+            print('%-9s %-10s %12.0f %12.0f %+7.1f%% %9.3fms %9.3fms %+7.1f%%%s' % (
+                    preset, stage, old['per_sec'], new['per_sec'], rate,
+                    old['p99_ms'], new['p99_ms'], p99, flag
+            ))
+    return regressions
+
+def _change(old: float, new: float) -> float:
+    return 100 * (new - old) / old if old else 0.0
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Nearest rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _commit() -> str:
+    try:
+        out = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+        )
+        return out.stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=2000, help='statuses per corpus')
+    parser.add_argument('--corpus', default=','.join(corpora.PRESETS),
+            help='comma separated corpora, of %s' % ', '.join(corpora.PRESETS))
+    parser.add_argument('--stages', default=','.join(STAGES),
+            help='comma separated stages, of %s' % ', '.join(STAGES))
+    parser.add_argument('--seed', type=int, default=0, help='corpus random seed')
+    parser.add_argument('--media-bytes', type=int, default=64 * 1024, help='size of served media')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'), help='compare two result files')
+    parser.add_argument('--threshold', type=float, default=5.0, help='percent change flagged by --compare')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            head = json.load(f)
+        regressions = compare(base, head, args.threshold)
+        return 1 if regressions else 0
+
+    presets = args.corpus.split(',')
+    stages = args.stages.split(',')
+    for name in presets:
+        if name not in corpora.PRESETS:
+            parser.error('unknown corpus %s' % name)
+    for name in stages:
+        if name not in STAGES:
+            parser.error('unknown stage %s' % name)
+
+    result = run(presets, stages, args.count, args.seed, args.media_bytes)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print('Wrote %s' % args.output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,6 +24,18 @@ flags.DEFINE_list(
     'List of hashtags to follow'
 )
 
+flags.DEFINE_list(
+    'replay',
+    [],
+    'Replay archived status files or directories instead of streaming'
+)
+
+flags.DEFINE_float(
+    'replay_speed',
+    0,
+    'Replay at this multiple of the recorded rate, 0 for as fast as possible'
+)
+
 flags.DEFINE_bool(
     'mirror',
     False,
@@ -72,6 +84,32 @@ flags.DEFINE_string(
     'Filename format for downloaded tweets'
 )
 
+flags.DEFINE_enum(
+    'write_mode',
+    'file',
+    ['file', 'segment'],
+    'Write one file per tweet, or append tweets to rotating JSON Lines segments'
+)
+
+flags.DEFINE_bool(
+    'raw_json',
+    False,
+    'Write tweets as compact UTF-8 JSON, untouched where possible, instead of indented UTF-32'
+)
+
+flags.DEFINE_enum(
+    'codec',
+    'json',
+    ['json', 'orjson', 'msgspec', 'ujson', 'auto'],
+    'JSON codec used to write tweets, auto for the fastest installed'
+)
+
+flags.DEFINE_string(
+    'shard',
+    None,
+    "Split output over subdirectories by 'id', 'date', 'user' or a format like '{user.screen_name}'"
+)
+
 flags.DEFINE_string(
     'media_format',
     os.environ.get('TWITLIB_MEDIA_FMT', 'media_{id}'),
@@ -84,6 +122,103 @@ flags.DEFINE_integer(
     'Number of worker threads for each type of operation'
 )
 
+flags.DEFINE_integer(
+    'max_workers',
+    os.environ.get('TWITLIB_MAX_WORKERS', 0),
+    'Upper bound when scaling worker threads for each type of operation, 0 for no scaling'
+)
+
+flags.DEFINE_string(
+    'media_cache',
+    os.environ.get('TWITLIB_MEDIA_CACHE', None),
+    'Directory for a media cache shared by the downloader and mirror threads'
+)
+
+flags.DEFINE_integer(
+    'media_workers',
+    os.environ.get('TWITLIB_MEDIA_WORKERS', 0),
+    'Threads shared by all workers for parallel media downloads, 0 to size from --workers'
+)
+
+flags.DEFINE_integer(
+    'media_max_bytes',
+    os.environ.get('TWITLIB_MEDIA_MAX_BYTES', None),
+    'Skip media larger than this many bytes'
+)
+
+flags.DEFINE_integer(
+    'queue_size',
+    os.environ.get('TWITLIB_QUEUE_SIZE', 0),
+    'Maximum statuses held in each worker queue, 0 for no limit'
+)
+
+flags.DEFINE_enum(
+    'overflow',
+    'block',
+    ['block', 'drop_newest', 'drop_oldest', 'spill'],
+    'Action taken when a status arrives at a full worker queue'
+)
+
+flags.DEFINE_float(
+    'priority_aging',
+    os.environ.get('TWITLIB_PRIORITY_AGING', 0),
+    'Serve own tweets, big accounts and media first in the worker queues, a unit of priority being worth this many seconds of waiting. 0 for FIFO queues'
+)
+
+flags.DEFINE_float(
+    'dedup_window',
+    3600,
+    'Seconds that status ids are remembered to drop duplicates, 0 to disable'
+)
+
+flags.DEFINE_string(
+    'dedup_path',
+    None,
+    'File that seen status ids are kept in across restarts'
+)
+
+flags.DEFINE_integer(
+    'metrics_port',
+    None,
+    'Serve metrics in the Prometheus text format on this port'
+)
+
+flags.DEFINE_float(
+    'metrics_interval',
+    0,
+    'Log all metrics every this many seconds, 0 to disable'
+)
+
+flags.DEFINE_string(
+    'trace_path',
+    None,
+    'Append per-status latency traces of a sample of statuses to this file'
+)
+
+flags.DEFINE_float(
+    'trace_rate',
+    0.01,
+    'Fraction of statuses traced when --trace_path is given'
+)
+
+flags.DEFINE_float(
+    'post_rate',
+    os.environ.get('TWITLIB_POST_RATE', 0),
+    'Mirror posts allowed per hour, queued by priority in a rate limited scheduler. 0 posts from the mirror threads directly'
+)
+
+flags.DEFINE_float(
+    'drain_timeout',
+    os.environ.get('TWITLIB_DRAIN_TIMEOUT', 30),
+    'Seconds to wait for queued statuses to be processed when stopping'
+)
+
+flags.DEFINE_string(
+    'spool_dir',
+    os.environ.get('TWITLIB_SPOOL_DIR', None),
+    'Log queued statuses to this directory and resume unfinished ones on restart'
+)
+
 flags.register_validator(
     'dir',
     lambda v : os.path.isdir(v),
@@ -96,6 +231,18 @@ flags.register_validator(
     message='--temp-dir must exist.'
 )
 
+flags.register_validator(
+    'media_workers',
+    lambda v : v >= 0,
+    message='--media_workers must be a non-negative integer.'
+)
+
+flags.register_validator(
+    'max_workers',
+    lambda v : v >= 0,
+    message='--max_workers must be a non-negative integer.'
+)
+
 flags.register_validator(
     'workers',
     lambda v : v > 0 and v < 10,
@@ -1,5 +1,6 @@
 #!python3
 import os
+import signal
 import sys
 
 import twitter
@@ -10,8 +11,18 @@ from flags import FLAGS
 from logging import Formatter
 
 from twitlib.util import *
-from twitlib.streaming import WriterThread, Dispatcher, MirrorThread, MediaDownloaderThread
-from twitlib.filters import is_rt_game, tweeted_by, has_hashtag
+import twitlib.codec as codec
+import twitlib.download as download
+import twitlib.metrics as metrics
+import twitlib.tracing as tracing
+from twitlib.dedup import ExactIndex
+from twitlib.pipeline import Pipeline
+from twitlib.pool import WorkerPool
+from twitlib.replay import Replayer
+from twitlib.scheduler import PostScheduler
+from twitlib.streaming import WriterThread, Dispatcher, MirrorThread, MediaDownloaderThread, StreamRunner
+from twitlib.filters import is_rt_game, tweeted_by, has_hashtag, has_media
+from twitlib.queues import weighted, log_followers
 from get_access_token import get_access_token
 
 
@@ -40,6 +51,12 @@ api = Api(
 
 twitter_id = os.environ.get('TWITTER_ID', None)
 
+# Seen status ids, kept across stream reconnects. Set in main()
+seen_ids = None
+
+# Rate limited poster shared by mirror threads. Set in main()
+scheduler = None
+
 def mock_api():
     """
     Mocks PostUpdate so no posts are sent to Twitter. Will print
@@ -65,7 +82,11 @@ def spawn_writer(index):
                 dirname=FLAGS.dir,
                 dry_run=FLAGS.dry_run,
                 format=FLAGS.write_format,
-                name='WT-%i' % index
+                mode=FLAGS.write_mode,
+                raw_json=FLAGS.raw_json,
+                shard=FLAGS.shard,
+                name='WT-%i' % index,
+                filters=[]
         )
 
 def spawn_downloader(index):
@@ -73,7 +94,9 @@ def spawn_downloader(index):
                 dirname=FLAGS.dir,
                 dry_run=FLAGS.dry_run,
                 format=FLAGS.media_format,
-                name='DT-%i' % index
+                shard=FLAGS.shard,
+                name='DT-%i' % index,
+                filters=[]
         )
 
 def spawn_mirror(index):
@@ -81,8 +104,9 @@ def spawn_mirror(index):
                 api=api,
                 temp_dir=os.path.join(FLAGS.dir, 'tmp'),
                 dry_run=FLAGS.dry_run,
+                scheduler=scheduler,
                 name='MT-%i' % index,
-                filters=mirror_filters()
+                filters=[]
         )
 
 def get_dispatcher():
@@ -93,29 +117,32 @@ def get_dispatcher():
         threads.append(MirrorThread)
     if FLAGS.writer:
         threads.append(WriterThread)
-    return Dispatcher(threads=threads)
 
-def stream(**kwargs):
+    # Filter once in the dispatcher, the writer default is shared by the downloader
+    filters = {
+        WriterThread: [WriterThread.default_filter],
+        MediaDownloaderThread: [WriterThread.default_filter],
+        MirrorThread: mirror_filters(),
+    }
+    return Dispatcher(threads=threads, filters=filters, dedup=seen_ids)
+
+def start_pools():
     logging.info('Starting workers, dry_run=%s', FLAGS.dry_run)
 
-    # Spin up thread pool
-    threads = []
-    for i in range(FLAGS.workers):
-        if FLAGS.download:
-            spawn_downloader().start()
-        if FLAGS.mirror:
-            spawn_mirror().start()
-        if FLAGS.writer:
-            spawn_writer().start()
-
-    # Connect listener to stream and filter
-    listener = get_dispatcher()
-    for line in api.GetStreamFilter(**kwargs):
-        status = twitter.Status.NewFromJsonDict(line)
-        if not status.id:
-            logging.debug('Got empty status')
-        else:
-            listener.on_status(status)
+    spawners = []
+    if FLAGS.download:
+        spawners.append((MediaDownloaderThread, spawn_downloader))
+    if FLAGS.mirror:
+        spawners.append((MirrorThread, spawn_mirror))
+    if FLAGS.writer:
+        spawners.append((WriterThread, spawn_writer))
+
+    # Pools outlive stream reconnects, growing up to --max_workers under load
+    max_workers = max(FLAGS.max_workers, FLAGS.workers)
+    return [
+        WorkerPool(thread_cls, factory=spawn, min_workers=FLAGS.workers, max_workers=max_workers).start()
+        for thread_cls, spawn in spawners
+    ]
 
 def authenticate():
     logging.info('Starting authentication flow')
@@ -138,25 +165,100 @@ def main(argv):
     user = api.VerifyCredentials()
     logging.info('User: %s', user.__repr__())
 
-    while True:
-        logging.info('Starting stream')
+    # Each status downloads its first media item in the worker thread, the
+    # rest (up to 3 more) go to the shared pool
+    media_workers = FLAGS.media_workers
+    if not media_workers:
+        media_workers = 3 * FLAGS.workers * (FLAGS.download + FLAGS.mirror) or 1
+    download.configure(
+            pool_size=media_workers + FLAGS.workers * 2,
+            max_workers=media_workers,
+            max_bytes=FLAGS.media_max_bytes
+    )
+
+    if FLAGS.media_cache:
+        download.configure_cache(FLAGS.media_cache)
+
+    codec.configure(FLAGS.codec)
+
+    if FLAGS.metrics_port is not None:
+        metrics.REGISTRY.serve(FLAGS.metrics_port)
+    if FLAGS.metrics_interval:
+        metrics.REGISTRY.start_dump(FLAGS.metrics_interval)
+    if FLAGS.trace_path:
+        tracing.configure(FLAGS.trace_path, FLAGS.trace_rate)
 
-        # Track keywords/hashtags
-        if FLAGS.track:
-            logging.info('track=%s', FLAGS.track)
-            stream(track=FLAGS.track)
+    # Drop tweets redelivered when the stream reconnects
+    global seen_ids
+    if FLAGS.dedup_window:
+        seen_ids = ExactIndex(window=FLAGS.dedup_window, path=FLAGS.dedup_path)
+
+    # TWITTER_ID's own tweets jump the queues, then tweets of big accounts
+    own = lambda status : bool(twitter_id) and tweeted_by(status, int(twitter_id))
+    priority = None
+    if FLAGS.priority_aging:
+        priority = weighted((own, 10), (log_followers, 1), (has_media, 0.5))
+
+    # Bound the job queues once, before any workers start. Queues persist
+    # across stream reconnects.
+    for thread_cls in (MediaDownloaderThread, MirrorThread, WriterThread):
+        thread_cls.configure_queue(
+                FLAGS.queue_size,
+                overflow=FLAGS.overflow,
+                spill_dir=FLAGS.temp_dir,
+                spool_dir=FLAGS.spool_dir,
+                priority=priority,
+                aging=FLAGS.priority_aging or 60
+        )
+    # Mirrors of TWITTER_ID's own tweets jump the queue when rate limited
+    global scheduler
+    if FLAGS.mirror and FLAGS.post_rate:
+        # The scheduler waits out rate limits itself, instead of the posting
+        # thread and mirror workers sleeping inside python-twitter
+        api.sleep_on_rate_limit = False
+        scheduler = PostScheduler(api, rate=FLAGS.post_rate / 3600, priority=lambda s : int(own(s)))
 
-        # Follow a user ID
-        elif FLAGS.follow:
-            logging.info('follow=%s', FLAGS.follow)
-            stream(follow=FLAGS.follow)
+    pipeline = Pipeline(get_dispatcher(), start_pools())
 
-        # Drop to IPython REPL if no flags
+    # Drain the queues on Ctrl-C or when stopped by a deploy
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        if FLAGS.replay:
+            # Archived statuses instead of the stream, e.g. to try new filters
+            replayer = Replayer(pipeline.dispatcher, speed=FLAGS.replay_speed or None)
+            replayer.replay(FLAGS.replay)
         else:
-            logging.info('Nothing to stream, dropping to REPL.')
-            import IPython
-            IPython.embed()
-            sys.exit()
+            run_stream(pipeline.dispatcher)
+    except (KeyboardInterrupt, SystemExit):
+        logging.info('Stopping')
+
+    logging.info('Draining queues for up to %ss', FLAGS.drain_timeout)
+    stuck = pipeline.shutdown(FLAGS.drain_timeout)
+    if stuck:
+        logging.warning('Workers still running: %s', [w.name for w in stuck])
+    if scheduler is not None:
+        scheduler.close(FLAGS.drain_timeout)
+
+def run_stream(listener):
+    # Reconnects with backoff, feeding the same dispatcher and workers
+    runner = StreamRunner(api, listener)
+
+    # Track keywords/hashtags
+    if FLAGS.track:
+        logging.info('Starting stream, track=%s', FLAGS.track)
+        runner.filter(track=FLAGS.track)
+
+    # Follow a user ID
+    elif FLAGS.follow:
+        logging.info('Starting stream, follow=%s', FLAGS.follow)
+        runner.filter(follow=FLAGS.follow)
+
+    # Drop to IPython REPL if no flags
+    else:
+        logging.info('Nothing to stream, dropping to REPL.')
+        import IPython
+        IPython.embed()
+        sys.exit()
 
 if __name__ == '__main__':
   app.run(main)
@@ -84,6 +84,12 @@ flags.DEFINE_integer(
     'Number of worker threads for each type of operation'
 )
 
+flags.DEFINE_float(
+    'post_rate',
+    os.environ.get('TWITLIB_POST_RATE', 100),
+    'Mirror posts allowed per hour'
+)
+
 flags.register_validator(
     'dir',
     lambda v : os.path.isdir(v),
@@ -96,6 +102,12 @@ flags.register_validator(
     message='--temp-dir must exist.'
 )
 
+flags.register_validator(
+    'post_rate',
+    lambda v : v > 0,
+    message='--post_rate must be positive.'
+)
+
 flags.register_validator(
     'workers',
     lambda v : v > 0 and v < 10,
@@ -10,7 +10,8 @@ from logging import Formatter
 from unittest import mock
 
 from twitlib.util import *
-from twitlib.streaming import Dispatcher, MirrorThread
+from twitlib.scheduler import PostScheduler
+from twitlib.streaming import Dispatcher, MirrorThread, StreamRunner
 from twitlib.filters import tweeted_by, has_hashtag
 
 # Logging
@@ -31,7 +32,8 @@ api = Api(
     consumer_secret,
     access_token,
     access_token_secret,
-    sleep_on_rate_limit=True,
+    # Rate limits are waited out by the PostScheduler, see main()
+    sleep_on_rate_limit=False,
     tweet_mode='extended',
     input_encoding='utf-32'
 )
@@ -39,6 +41,9 @@ api = Api(
 HASHTAG='DUP'
 twitter_id = int(os.environ.get('TWITTER_ID', -1))
 
+# Rate limited poster shared by mirror threads. Set in main()
+scheduler = None
+
 
 def mock_api():
     api.PostUpdate = mock.Mock(
@@ -63,25 +68,20 @@ def spawn_mirror(index):
                 temp_dir=os.path.join(FLAGS.dir, 'tmp'),
                 dry_run=FLAGS.dry_run,
                 name='MT-%i' % index,
-                filters=mirror_filters()
+                filters=mirror_filters(),
+                scheduler=scheduler
         )
 
 def stream(**kwargs):
     logging.info('Starting workers, dry_run=%s', FLAGS.dry_run)
 
-    # Spin up thread pool
-    threads = []
+    # Spin up thread pool once, it outlives reconnects
     for i in range(FLAGS.workers):
         spawn_mirror(i).start()
 
-    # Connect listener to stream and filter
+    # Connect listener to stream and filter, reconnecting with backoff
     listener = Dispatcher(threads=[MirrorThread])
-    for line in api.GetStreamFilter(**kwargs):
-        status = twitter.Status.NewFromJsonDict(line)
-        if not status.id:
-            logging.debug('Got empty status')
-        else:
-            listener.on_status(status)
+    StreamRunner(api, listener).filter(**kwargs)
 
 def main(argv):
     del argv
@@ -94,25 +94,25 @@ def main(argv):
         logging.info('Mocking API calls')
         mock_api()
 
-    while True:
-        logging.info('Starting stream')
-
-        # Track keywords/hashtags
-        if FLAGS.track:
-            logging.info('track=%s', FLAGS.track)
-            stream(track=FLAGS.track)
-
-        # Follow a user ID
-        elif FLAGS.follow:
-            logging.info('follow=%s', FLAGS.follow)
-            stream(follow=FLAGS.follow)
-
-        # Drop to IPython REPL if no flags
-        else:
-            logging.info('Nothing to stream, dropping to REPL.')
-            import IPython
-            IPython.embed()
-            sys.exit()
+    global scheduler
+    scheduler = PostScheduler(api, rate=FLAGS.post_rate / 3600)
+
+    # Track keywords/hashtags
+    if FLAGS.track:
+        logging.info('Starting stream, track=%s', FLAGS.track)
+        stream(track=FLAGS.track)
+
+    # Follow a user ID
+    elif FLAGS.follow:
+        logging.info('Starting stream, follow=%s', FLAGS.follow)
+        stream(follow=FLAGS.follow)
+
+    # Drop to IPython REPL if no flags
+    else:
+        logging.info('Nothing to stream, dropping to REPL.')
+        import IPython
+        IPython.embed()
+        sys.exit()
 
 if __name__ == '__main__':
   app.run(main)
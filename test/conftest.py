@@ -2,6 +2,7 @@ import pytest
 import logging
 
 from twitter import Api
+import twitlib.download as download
 from test.mocks import *
 from test.patches import *
 from test.injectors import *
@@ -46,3 +47,9 @@ def remove_media(inject_media):
 @pytest.fixture(autouse=True)
 def use_logs(caplog):
     caplog.set_level(logging.DEBUG)
+
+@pytest.fixture(autouse=True)
+def stop_downloads():
+    """Stop the shared media threads so they don't outlive the test"""
+    yield
+    download.shutdown()
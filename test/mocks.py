@@ -24,6 +24,7 @@ from twitlib.streaming import \
 def mock_open(mocker, status):
     m = mocker.mock_open()
     mocker.patch('twitlib.streaming.open', m)
+    mocker.patch('twitlib.download.open', m)
     return m
 
 @pytest.fixture(autouse=True)
@@ -10,6 +10,10 @@ def patch_io(mocker, mock_open):
     mocker.patch('os.path.exists', return_value=True, autospec=True)
     mocker.patch('json.dump', autospec=True)
     mocker.patch('requests.get', autospec=True)
+    mocker.patch('twitlib.download.session', autospec=True)
+    mocker.patch('os.replace', autospec=True)
+    mocker.patch('os.remove', autospec=True)
+    mocker.patch('twitlib.util._made_dirs', set())
 
 @pytest.fixture
 def format_patcher(self, mocker, output_file):
@@ -0,0 +1,188 @@
+import pytest
+import asyncio
+import os
+from twitter import Status
+
+import twitlib.aio as aio
+import twitlib.download as download
+from twitlib.aio import AsyncWorker, AsyncWriter, AsyncMediaDownloader, AsyncMirror, AsyncDispatcher
+from twitlib.streaming import WriterThread
+
+def make_status(i, media=0):
+    entities = {'media' : [
+        {'media_url_https' : 'https://host.com/%i_%i.jpg' % (i, m)}
+        for m in range(media)
+    ]}
+    return Status.NewFromJsonDict({'id' : i, 'text' : 'tweet %i' % i, 'entities' : entities})
+
+class RecordingWorker(AsyncWorker):
+
+    def __init__(self, **kwargs):
+        self.seen = []
+        super().__init__(**kwargs)
+
+    async def process_status(self, status):
+        self.seen.append(status.id)
+        await asyncio.sleep(0)
+        return status.id
+
+class RejectingWorker(RecordingWorker):
+    pass
+
+@pytest.fixture
+def loop():
+    result = asyncio.new_event_loop()
+    asyncio.set_event_loop(result)
+    for cls in (RecordingWorker, RejectingWorker, AsyncWriter, AsyncMediaDownloader, AsyncMirror):
+        cls.configure_queue()
+    yield result
+    result.close()
+    asyncio.set_event_loop(None)
+
+@pytest.fixture
+def fake_fetch(mocker):
+    def side_effect(url, filepath):
+        if 'fail' in url:
+            raise IOError('failed')
+        return filepath
+    return mocker.patch.object(download, 'fetch', side_effect=side_effect)
+
+class TestAsyncWorker():
+
+    def test_per_class_queue(self, loop):
+        assert(RecordingWorker.queue() is not RejectingWorker.queue())
+        assert(RecordingWorker.queue() is RecordingWorker.queue())
+
+    def test_configure_queue(self, loop):
+        RecordingWorker.configure_queue(5)
+        assert(RecordingWorker.queue().maxsize == 5)
+        with pytest.raises(ValueError):
+            RecordingWorker.configure_queue(-1)
+
+    def test_unexpected_kwarg(self):
+        with pytest.raises(TypeError):
+            RecordingWorker(bogus=1)
+
+    def test_runs_until_sentinel(self, loop):
+        worker = RecordingWorker()
+
+        async def main():
+            task = worker.start()
+            for i in range(3):
+                await RecordingWorker.enqueue(make_status(i))
+            await RecordingWorker.enqueue(None)
+            await task
+
+        loop.run_until_complete(main())
+        assert(worker.seen == [0, 1, 2])
+        assert(RecordingWorker.queue()._unfinished_tasks == 0)
+
+    def test_loops(self, loop):
+        worker = RecordingWorker(loops=2)
+
+        async def main():
+            for i in range(3):
+                await RecordingWorker.enqueue(make_status(i))
+            await worker.run()
+
+        loop.run_until_complete(main())
+        assert(worker.seen == [0, 1])
+
+    def test_many_concurrent(self, loop):
+        workers = [RecordingWorker() for i in range(100)]
+
+        async def main():
+            tasks = [w.start() for w in workers]
+            for i in range(500):
+                await RecordingWorker.enqueue(make_status(i))
+            for w in workers:
+                await RecordingWorker.enqueue(None)
+            await asyncio.gather(*tasks)
+
+        loop.run_until_complete(main())
+        assert(sorted(i for w in workers for i in w.seen) == list(range(500)))
+
+class TestAsyncDispatcher():
+
+    def test_fan_out(self, loop):
+        d = AsyncDispatcher(workers=[RecordingWorker, RejectingWorker])
+        loop.run_until_complete(d.on_status(make_status(1)))
+        assert(RecordingWorker.queue().qsize() == 1)
+        assert(RejectingWorker.queue().qsize() == 1)
+
+    def test_filters(self, loop):
+        filters = {RejectingWorker : [lambda s : False]}
+        d = AsyncDispatcher(workers=[RecordingWorker, RejectingWorker], filters=filters)
+        loop.run_until_complete(d.on_status(make_status(1)))
+        assert(RecordingWorker.queue().qsize() == 1)
+        assert(RejectingWorker.queue().qsize() == 0)
+
+    def test_join(self, loop):
+        worker = RecordingWorker()
+        d = AsyncDispatcher(workers=[RecordingWorker])
+
+        async def main():
+            task = worker.start()
+            for i in range(3):
+                await d.on_status(make_status(i))
+            await d.join()
+            assert(worker.seen == [0, 1, 2])
+            await RecordingWorker.enqueue(None)
+            await task
+
+        loop.run_until_complete(main())
+
+class TestFetch():
+
+    @pytest.fixture(autouse=True)
+    def no_aiohttp(self, mocker):
+        mocker.patch.object(aio, 'aiohttp', None)
+
+    def test_fallback(self, loop, fake_fetch):
+        result = loop.run_until_complete(aio.fetch('https://host.com/a.jpg', 'a.jpg'))
+        assert(result == 'a.jpg')
+        fake_fetch.assert_called_once_with('https://host.com/a.jpg', 'a.jpg')
+
+    def test_fetch_all_skips_failures(self, loop, fake_fetch):
+        urls = ['https://host.com/a.jpg', 'https://host.com/fail.jpg', 'https://host.com/b.jpg']
+        paths = ['a.jpg', 'fail.jpg', 'b.jpg']
+        result = loop.run_until_complete(aio.fetch_all(urls, paths))
+        assert(result == ['a.jpg', 'b.jpg'])
+
+    def test_session_requires_aiohttp(self, loop):
+        with pytest.raises(RuntimeError):
+            aio.session()
+
+@pytest.mark.usefixtures('fake_fetch')
+class TestAsyncWorkers():
+
+    @pytest.fixture(autouse=True)
+    def no_aiohttp(self, mocker):
+        mocker.patch.object(aio, 'aiohttp', None)
+
+    def test_writer(self, mocker, loop):
+        m = mocker.patch.object(WriterThread, 'write_status', return_value='status_1.json')
+        writer = AsyncWriter(dirname='out')
+        status = make_status(1)
+        result = loop.run_until_complete(writer.process_status(status))
+        assert(result == 'status_1.json')
+        m.assert_called_once_with(status, os.path.join('out', 'status_1.json'))
+
+    def test_downloader(self, loop):
+        downloader = AsyncMediaDownloader(dirname='out')
+        result = loop.run_until_complete(downloader.process_status(make_status(1, media=2)))
+        assert(result == [os.path.join('out', 'media_1', '1_%i.jpg' % m) for m in range(2)])
+
+    def test_mirror(self, loop, api):
+        mirror = AsyncMirror(api=api, temp_dir='tmp')
+        loop.run_until_complete(mirror.process_status(make_status(1, media=1)))
+        _, kwargs = api.PostUpdate.call_args
+        assert(kwargs['status'] == 'tweet 1')
+        assert(kwargs['media'] == [os.path.join('tmp', '1_0.jpg')])
+
+    def test_mirror_incomplete(self, loop, api, fake_fetch):
+        fake_fetch.side_effect = IOError('failed')
+        mirror = AsyncMirror(api=api, temp_dir='tmp')
+        result = loop.run_until_complete(mirror.process_status(make_status(1, media=1)))
+        assert(result is None)
+        api.PostUpdate.assert_not_called()
@@ -0,0 +1,92 @@
+import pytest
+from twitter import Status
+
+import twitlib.codec as codec
+from twitlib.status import LazyStatus
+
+LINE = '{"id":1,"text":"tweet é","user":{"id":2,"screen_name":"poster"}}'.encode('utf-8')
+
+@pytest.fixture(autouse=True)
+def reset():
+    yield
+    codec.configure()
+
+class TestConfigure():
+
+    def test_default_stdlib(self):
+        assert(isinstance(codec.get(), codec.StdlibCodec))
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            codec.configure('bogus')
+
+    def test_auto(self):
+        assert(codec.configure('auto').name == codec.available()[0])
+
+    def test_stdlib_available(self):
+        assert(codec.available()[-1] == 'json')
+
+    @pytest.mark.parametrize('name', ['orjson', 'msgspec', 'ujson'])
+    def test_missing_backend(self, name):
+        if name in codec.available():
+            pytest.skip('%s is installed' % name)
+        with pytest.raises(ImportError):
+            codec.configure(name)
+
+@pytest.mark.parametrize('name', list(codec.CODECS))
+class TestCodecs():
+
+    @pytest.fixture(autouse=True)
+    def select(self, name):
+        if name not in codec.available():
+            pytest.skip('%s is not installed' % name)
+        codec.configure(name)
+
+    def test_dumps_compact_utf8(self, name):
+        assert(codec.dumps({'a' : 'é', 'b' : [1]}) == '{"a":"é","b":[1]}'.encode('utf-8'))
+
+    def test_loads(self, name):
+        assert(codec.loads(LINE)['text'] == 'tweet é')
+        assert(codec.loads(LINE.decode('utf-8'))['id'] == 1)
+
+class TestDecode():
+
+    def test_keep_alive(self):
+        assert(codec.decode_line(b'\r\n') is None)
+        assert(codec.decode_status(b'\r\n') is None)
+
+    def test_non_status(self):
+        assert(codec.decode_status(b'{"limit":{"track":10}}') is None)
+
+    def test_message(self):
+        assert(codec.decode_message(b'{"limit":{"track":10}}') == {'limit' : {'track' : 10}})
+        assert(codec.decode_message(b'\r\n') is None)
+        assert(isinstance(codec.decode_message(LINE), LazyStatus))
+
+    def test_lazy_status(self):
+        status = codec.decode_status(LINE + b'\r\n')
+        assert(isinstance(status, LazyStatus))
+        assert(status.user.screen_name == 'poster')
+
+    def test_eager_status(self):
+        status = codec.decode_status(LINE, lazy=False)
+        assert(type(status) == Status)
+        assert(status.text == 'tweet é')
+
+    def test_str_line(self):
+        status = codec.decode_status(LINE.decode('utf-8'))
+        assert(codec.encode_status(status) == LINE)
+
+class TestEncode():
+
+    def test_raw_untouched(self):
+        line = b'{ "id" : 1 }'
+        assert(codec.encode_status(codec.decode_status(line)) == line)
+
+    def test_raw_dict(self):
+        status = Status.NewFromJsonDict({'id' : 1, 'text' : 'é'})
+        assert(codec.encode_status(status) == '{"id":1,"text":"é"}'.encode('utf-8'))
+
+    def test_as_dict(self):
+        status = Status(id=1, text='a')
+        assert(codec.loads(codec.encode_status(status)) == {'id' : 1, 'text' : 'a'})
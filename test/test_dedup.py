@@ -0,0 +1,123 @@
+import pytest
+import os
+
+from twitlib.dedup import ExactIndex, BloomIndex, RECORD
+
+# Imported before the autouse patch_io fixture replaces these
+from os import replace as real_replace, makedirs as real_makedirs
+from os.path import exists as real_exists
+
+@pytest.fixture(autouse=True)
+def real_io(mocker):
+    mocker.patch('os.replace', new=real_replace)
+    mocker.patch('os.path.exists', new=real_exists)
+    mocker.patch('os.makedirs', new=real_makedirs)
+
+@pytest.fixture(params=[ExactIndex, BloomIndex])
+def index_cls(request):
+    if request.param is BloomIndex:
+        return lambda **kwargs : BloomIndex(capacity=1000, **kwargs)
+    return request.param
+
+class TestDedupIndex():
+
+    def test_seen(self, index_cls):
+        index = index_cls(window=10)
+        assert(not index.seen(1, now=0))
+        assert(index.seen(1, now=1))
+        assert(not index.seen(2, now=1))
+        assert(index.seen(2, now=2))
+
+    def test_expires(self, index_cls):
+        index = index_cls(window=10)
+        index.seen(1, now=0)
+        assert(not index.seen(1, now=25))
+
+    def test_invalid_window(self, index_cls):
+        with pytest.raises(ValueError):
+            index_cls(window=0)
+
+    def test_persisted(self, index_cls, tmpdir):
+        path = str(tmpdir.join('dedup', 'seen.bin'))
+        index = index_cls(path=path)
+        index.seen(1)
+        index.seen(2)
+        index.close()
+
+        index = index_cls(path=path)
+        assert(index.seen(1))
+        assert(index.seen(2))
+        assert(not index.seen(3))
+
+    def test_persisted_expired(self, index_cls, tmpdir):
+        path = str(tmpdir.join('seen.bin'))
+        index = index_cls(window=10, path=path)
+        index.seen(1, now=0)
+        index.close()
+
+        index = index_cls(window=10, path=path)
+        assert(not index.seen(1))
+        assert(os.path.getsize(path) == RECORD.size)
+
+    def test_incomplete_record(self, index_cls, tmpdir):
+        path = str(tmpdir.join('seen.bin'))
+        index = index_cls(path=path)
+        index.seen(1)
+        index.close()
+        with open(path, 'ab') as f:
+            f.write(b'\x00\x01')
+
+        index = index_cls(path=path)
+        assert(index.seen(1))
+
+    def test_compaction(self, index_cls, tmpdir):
+        path = str(tmpdir.join('seen.bin'))
+        index = index_cls(window=10, path=path)
+        for i in range(1100):
+            index.seen(i, now=0)
+        for i in range(1100):
+            index.seen(5000 + i, now=100)
+        assert(os.path.getsize(path) == 1100 * RECORD.size)
+
+class TestExactIndex():
+
+    def test_max_ids(self):
+        index = ExactIndex(max_ids=2)
+        for i in range(3):
+            index.seen(i)
+        assert(len(index) == 2)
+        assert(0 not in index)
+
+    def test_invalid_max_ids(self):
+        with pytest.raises(ValueError):
+            ExactIndex(max_ids=0)
+
+class TestBloomIndex():
+
+    def test_sizing(self):
+        index = BloomIndex(capacity=1000, error_rate=0.01)
+        assert(index.bits == 9586)
+        assert(index.hashes == 7)
+
+    def test_false_positive_rate(self):
+        index = BloomIndex(capacity=10000, error_rate=0.01)
+        for i in range(10000):
+            index.seen(i)
+        false_positives = sum(index.seen(i) for i in range(10000, 20000))
+        assert(false_positives < 200)
+
+    def test_remembered_one_window(self):
+        index = BloomIndex(window=10, capacity=1000)
+        index.seen(1, now=0)
+        assert(index.seen(1, now=15))
+
+    def test_rotates_at_capacity(self):
+        index = BloomIndex(window=10, capacity=100)
+        for i in range(250):
+            index.seen(i, now=0)
+        assert(not index.seen(0, now=0))
+
+    @pytest.mark.parametrize('kwargs', [{'capacity' : 0}, {'error_rate' : 1}])
+    def test_invalid(self, kwargs):
+        with pytest.raises(ValueError):
+            BloomIndex(**kwargs)
@@ -0,0 +1,275 @@
+import pytest
+import os
+import requests
+import threading
+import time
+
+import twitlib.download as download
+
+# Imported before the autouse patch_io fixture replaces these
+from twitlib.download import session as real_session
+from os import replace as real_replace, remove as real_remove, makedirs as real_makedirs
+from os.path import exists as real_exists
+
+class TestSession():
+
+    @pytest.fixture(autouse=True)
+    def reset(self):
+        download.configure()
+        yield
+        download.configure()
+
+    def test_shared(self):
+        assert(real_session() is real_session())
+
+    def test_configure_rebuilds(self):
+        before = real_session()
+        download.configure(pool_size=2)
+        assert(real_session() is not before)
+
+    def test_pool_settings(self):
+        download.configure(pool_size=7, retries=5)
+        adapter = real_session().get_adapter('https://host.com')
+        assert(adapter._pool_maxsize == 7)
+        assert(adapter.max_retries.total == 5)
+
+    def test_executor_shared(self):
+        assert(download.executor() is download.executor())
+
+    def test_shutdown(self):
+        pool = download.executor()
+        assert(pool.submit(lambda: 1).result(timeout=1) == 1)
+        download.shutdown()
+        assert(not any(t.is_alive() for t in pool._threads))
+        assert(download.executor() is not pool)
+
+class TestFetch():
+
+    @pytest.fixture
+    def chunks(self):
+        return [b'con', b'tent']
+
+    @pytest.fixture
+    def response(self, mocker, chunks):
+        r = mocker.MagicMock(name='response')
+        r.headers = {'Content-Length' : str(sum(map(len, chunks)))}
+        r.iter_content.return_value = chunks
+        download.session().get.return_value = r
+        return r
+
+    @pytest.fixture
+    def max_bytes(self):
+        download.configure(max_bytes=4)
+        yield 4
+        download.configure()
+
+    @pytest.fixture
+    def urls(self):
+        return ['https://host.com/file%i.jpg' % i for i in range(3)]
+
+    @pytest.fixture
+    def paths(self, urls):
+        return [os.path.basename(u) for u in urls]
+
+    def test_streams_chunks(self, mocker, response, mock_open, chunks):
+        download.fetch('https://host.com/file.jpg', 'file.jpg')
+        expected = [mocker.call(c) for c in chunks]
+        assert(mock_open().write.call_args_list == expected)
+        response.iter_content.assert_called_once_with(chunk_size=download.CHUNK_SIZE)
+
+    def test_request_args(self, response, mock_open):
+        download.fetch('https://host.com/file.jpg', 'file.jpg')
+        _, kwargs = download.session().get.call_args
+        assert(kwargs['stream'])
+        assert(kwargs['timeout'] == download.TIMEOUT)
+
+    def test_atomic_rename(self, response, mock_open):
+        result = download.fetch('https://host.com/file.jpg', 'file.jpg')
+        temp_path = mock_open.call_args[0][0]
+        assert(temp_path != 'file.jpg')
+        os.replace.assert_called_once_with(temp_path, 'file.jpg')
+        assert(result == 'file.jpg')
+
+    def test_validates_status(self, response, mock_open):
+        response.raise_for_status.side_effect = requests.HTTPError('404')
+        with pytest.raises(requests.HTTPError):
+            download.fetch('https://host.com/file.jpg', 'file.jpg')
+        mock_open.assert_not_called()
+        response.close.assert_called_once()
+
+    def test_content_length_cap(self, response, mock_open, max_bytes):
+        with pytest.raises(IOError):
+            download.fetch('https://host.com/file.jpg', 'file.jpg')
+        mock_open.assert_not_called()
+
+    def test_streamed_size_cap(self, response, mock_open, max_bytes):
+        del response.headers['Content-Length']
+        with pytest.raises(IOError):
+            download.fetch('https://host.com/file.jpg', 'file.jpg')
+        os.remove.assert_called_once()
+        os.replace.assert_not_called()
+
+    def test_fetch_all_order(self, response, mock_open, urls, paths):
+        result = download.fetch_all(urls, paths)
+        assert(result == paths)
+
+    def test_fetch_all_skips_failures(self, mocker, urls, paths):
+        mocker.patch.object(download, 'fetch', side_effect=requests.HTTPError('404'))
+        result = download.fetch_all(urls[:1], paths[:1])
+        assert(result == [])
+
+    def test_fetch_all_parallel(self, mocker, urls, paths):
+        m = mocker.patch.object(download, 'executor')
+        m.return_value.map.return_value = iter(paths[1:])
+        mocker.patch.object(download, '_try_fetch', return_value=paths[0])
+        result = download.fetch_all(urls, paths)
+        m.return_value.map.assert_called_once_with(download._try_fetch, urls[1:], paths[1:])
+        download._try_fetch.assert_called_once_with(urls[0], paths[0])
+        assert(result == paths)
+
+    def test_fetch_all_single_in_caller(self, mocker, urls, paths):
+        m = mocker.patch.object(download, 'executor')
+        mocker.patch.object(download, '_try_fetch', return_value=paths[0])
+        assert(download.fetch_all(urls[:1], paths[:1]) == paths[:1])
+        m.assert_not_called()
+
+class TestMediaCache():
+
+    @pytest.fixture(autouse=True)
+    def real_io(self, mocker):
+        mocker.patch('os.replace', new=real_replace)
+        mocker.patch('os.remove', new=real_remove)
+        mocker.patch('os.path.exists', new=real_exists)
+        mocker.patch('os.makedirs', new=real_makedirs)
+
+    @pytest.fixture
+    def contents(self):
+        """Content served for each URL"""
+        return {
+            'https://host.com/a.jpg' : b'aaaa',
+            'https://host.com/b.jpg' : b'bbbb',
+            'https://mirror.com/a.jpg' : b'aaaa',
+        }
+
+    @pytest.fixture
+    def fake_fetch(self, mocker, contents):
+        def side_effect(url, filepath, hasher=None):
+            time.sleep(0.01)
+            with open(filepath, 'wb') as f:
+                f.write(contents[url])
+            if hasher is not None:
+                hasher.update(contents[url])
+            return filepath
+        return mocker.patch.object(download, 'fetch', side_effect=side_effect)
+
+    @pytest.fixture
+    def media_cache(self, tmpdir):
+        return download.MediaCache(str(tmpdir.join('cache')), max_bytes=100)
+
+    def test_hit(self, media_cache, fake_fetch):
+        first = media_cache.get('https://host.com/a.jpg')
+        second = media_cache.get('https://host.com/a.jpg')
+        assert(first == second)
+        assert(fake_fetch.call_count == 1)
+        assert(media_cache.hits == 1)
+
+    def test_content_addressed(self, media_cache, fake_fetch):
+        first = media_cache.get('https://host.com/a.jpg')
+        second = media_cache.get('https://mirror.com/a.jpg')
+        assert(first == second)
+        assert(media_cache.size == 4)
+        assert(len(os.listdir(media_cache.dirname)) == 1)
+
+    def test_coalesces_inflight(self, media_cache, fake_fetch):
+        results = []
+        def target():
+            results.append(media_cache.get('https://host.com/b.jpg'))
+        threads = [threading.Thread(target=target) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert(fake_fetch.call_count == 1)
+        assert(len(set(results)) == 1)
+
+    def test_evicts_lru(self, tmpdir, fake_fetch):
+        media_cache = download.MediaCache(str(tmpdir), max_bytes=4)
+        a = media_cache.get('https://host.com/a.jpg')
+        media_cache.get('https://host.com/b.jpg')
+        assert(not os.path.exists(a))
+        assert(media_cache.size == 4)
+
+        media_cache.get('https://host.com/a.jpg')
+        assert(fake_fetch.call_count == 3)
+
+    def test_indexes_existing(self, tmpdir, fake_fetch):
+        dirname = str(tmpdir.join('cache'))
+        download.MediaCache(dirname).get('https://host.com/a.jpg')
+
+        media_cache = download.MediaCache(dirname, max_bytes=100)
+        assert(media_cache.size == 4)
+
+        # Known content from an unknown URL is not stored twice
+        media_cache.get('https://mirror.com/a.jpg')
+        assert(media_cache.size == 4)
+        assert(len(os.listdir(dirname)) == 1)
+
+    def test_evicts_existing(self, tmpdir, fake_fetch):
+        dirname = str(tmpdir.join('cache'))
+        old = download.MediaCache(dirname)
+        a = old.get('https://host.com/a.jpg')
+        b = old.get('https://host.com/b.jpg')
+        os.utime(a, (0, 0))
+
+        media_cache = download.MediaCache(dirname, max_bytes=4)
+        assert(media_cache.size == 4)
+        assert(not os.path.exists(a))
+        assert(os.path.exists(b))
+
+    def test_removes_partial(self, tmpdir, fake_fetch):
+        dirname = tmpdir.mkdir('cache')
+        dirname.join('download.1234.1').write(b'aa')
+        os.utime(str(dirname.join('download.1234.1')), (0, 0))
+        dirname.join('notes.txt').write(b'aa')
+        media_cache = download.MediaCache(str(dirname))
+        assert(os.listdir(str(dirname)) == ['notes.txt'])
+        assert(media_cache.size == 0)
+
+    def test_keeps_inflight_partial(self, tmpdir, fake_fetch):
+        """A recent partial download may belong to another process sharing the cache"""
+        dirname = tmpdir.mkdir('cache')
+        dirname.join('download.1234.1').write(b'aa')
+        download.MediaCache(str(dirname))
+        assert(os.listdir(str(dirname)) == ['download.1234.1'])
+
+    def test_partial_named_by_process(self, media_cache, fake_fetch):
+        media_cache.get('https://host.com/a.jpg')
+        temp_path = fake_fetch.call_args[0][1]
+        assert(os.path.basename(temp_path).startswith('download.%i.' % os.getpid()))
+
+    def test_fetch_links(self, tmpdir, media_cache, fake_fetch):
+        dst = str(tmpdir.join('out.jpg'))
+        result = media_cache.fetch('https://host.com/a.jpg', dst)
+        assert(result == dst)
+        with open(dst, 'rb') as f:
+            assert(f.read() == b'aaaa')
+
+    def test_error_propagates(self, media_cache, fake_fetch):
+        side_effect = fake_fetch.side_effect
+        fake_fetch.side_effect = requests.HTTPError('404')
+        with pytest.raises(requests.HTTPError):
+            media_cache.get('https://host.com/a.jpg')
+
+        # Failed downloads are not cached
+        fake_fetch.side_effect = side_effect
+        assert(media_cache.get('https://host.com/a.jpg') is not None)
+
+    def test_fetch_all_uses_cache(self, mocker, tmpdir):
+        download.configure_cache(str(tmpdir))
+        try:
+            m = mocker.patch.object(download.cache(), 'fetch', return_value='out.jpg')
+            result = download.fetch_all(['https://host.com/a.jpg'], ['out.jpg'])
+            m.assert_called_once_with('https://host.com/a.jpg', 'out.jpg')
+            assert(result == ['out.jpg'])
+        finally:
+            download.configure_cache(None)
@@ -1,4 +1,5 @@
 import pytest
+import functools
 import twitlib.filters as filters
 from twitter import User, Media, Hashtag
 
@@ -161,3 +162,91 @@ class TestHasHashtag():
         inject_hashtag([target_hashtag])
         has_hashtag = filters.has_hashtag(status, text, ignore_case=False)
         assert(not has_hashtag)
+
+class TestFilterChain():
+
+    @pytest.fixture
+    def funcs(self, mocker):
+        return [
+                mocker.Mock(spec=lambda s : 1, return_value=True, name='first'),
+                mocker.Mock(spec=lambda s : 1, return_value=False, name='second'),
+                mocker.Mock(spec=lambda s : 1, return_value=False, name='third'),
+        ]
+
+    def test_short_circuit(self, status, funcs):
+        chain = filters.FilterChain(funcs)
+        assert(not chain(status))
+        funcs[0].assert_called_once_with(status)
+        funcs[1].assert_called_once_with(status)
+        funcs[2].assert_not_called()
+
+    def test_all_pass(self, status, funcs):
+        chain = filters.FilterChain(funcs[:1])
+        assert(chain(status))
+
+    def test_empty(self, status):
+        assert(filters.FilterChain([])(status))
+
+    def test_failures(self, status, funcs):
+        chain = filters.FilterChain(funcs)
+        assert(chain.failures(status) == funcs[1:])
+
+    def test_cost_order(self, funcs):
+        filters.cost(10)(funcs[0])
+        chain = filters.FilterChain(funcs)
+        assert(chain.order == (funcs[1], funcs[2], funcs[0]))
+        assert(chain.funcs == tuple(funcs))
+
+    def test_builtin_costs(self):
+        chain = filters.FilterChain([filters.has_hashtag, filters.has_media])
+        assert(chain.order == (filters.has_media, filters.has_hashtag))
+
+    def test_partial_cost(self):
+        tagged = functools.partial(filters.has_hashtag, tag_name='x')
+        chain = filters.FilterChain([tagged, filters.is_retweet])
+        assert(chain.order == (filters.is_retweet, tagged))
+
+    def test_partial_own_cost(self):
+        tagged = filters.cost(0)(functools.partial(filters.has_hashtag, tag_name='x'))
+        chain = filters.FilterChain([filters.is_retweet, tagged])
+        assert(chain.order == (tagged, filters.is_retweet))
+
+    def test_adaptive_reorder(self, status, funcs):
+        chain = filters.FilterChain(funcs, adaptive=True, interval=2)
+        chain(status)
+        chain(status)
+        # first never rejects, so it moves behind the rejecting filters
+        assert(chain.order[-1] == funcs[0])
+
+    def test_compile_cached(self, funcs):
+        assert(filters.compile_filters(funcs) is filters.compile_filters(list(funcs)))
+
+    def test_compile_adaptive_not_shared(self, funcs):
+        chain = filters.compile_filters(funcs, adaptive=True)
+        assert(chain is not filters.compile_filters(funcs, adaptive=True))
+
+    def test_compile_chain(self, funcs):
+        chain = filters.FilterChain(funcs)
+        assert(filters.compile_filters(chain) is chain)
+
+class TestFilterChainMemo():
+
+    @pytest.fixture
+    def shared(self, mocker):
+        return mocker.Mock(spec=lambda s : 1, return_value=True, name='shared')
+
+    @pytest.mark.parametrize('adaptive', [False, True])
+    def test_memo_shared(self, status, shared, adaptive):
+        memo = {}
+        first = filters.FilterChain([shared], adaptive=adaptive)
+        second = filters.FilterChain([shared], adaptive=adaptive)
+        assert(first(status, memo))
+        assert(second(status, memo))
+        shared.assert_called_once_with(status)
+
+    def test_memo_stores_rejection(self, mocker, status):
+        reject = mocker.Mock(spec=lambda s : 1, return_value=0)
+        memo = {}
+        assert(not filters.FilterChain([reject])(status, memo))
+        assert(not filters.FilterChain([reject])(status, memo))
+        reject.assert_called_once_with(status)
@@ -0,0 +1,142 @@
+import pytest
+import logging
+import urllib.request
+from twitter import Status
+
+import twitlib.metrics as metrics
+from twitlib.metrics import Registry
+from twitlib.streaming import Dispatcher, WorkerThread, WriterThread
+
+class TestRegistry():
+
+    @pytest.fixture
+    def registry(self):
+        return Registry()
+
+    def test_get_or_create(self, registry):
+        assert(registry.counter('c', worker='a') is registry.counter('c', worker='a'))
+        assert(registry.counter('c', worker='a') is not registry.counter('c', worker='b'))
+
+    def test_kind_mismatch(self, registry):
+        registry.counter('c')
+        with pytest.raises(ValueError):
+            registry.gauge('c')
+
+    def test_counter(self, registry):
+        c = registry.counter('c')
+        c.inc()
+        c.inc(2)
+        assert(registry.snapshot() == {'c' : 3})
+
+    def test_gauge_func(self, registry):
+        registry.gauge('g', lambda : 5, worker='a')
+        assert(registry.snapshot() == {'g{worker="a"}' : 5})
+
+    def test_histogram(self, registry):
+        h = registry.histogram('h', buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            h.observe(value)
+        value = h.value()
+        assert(value['count'] == 4)
+        assert(value['sum'] == pytest.approx(2.65))
+        assert(value['buckets'] == {0.1 : 2, 1 : 3, float('inf') : 4})
+
+    def test_timer(self, registry):
+        h = registry.histogram('h')
+        with h.time():
+            pass
+        assert(h.value()['count'] == 1)
+
+    def test_reset(self, registry):
+        c = registry.counter('c')
+        c.inc()
+        registry.reset()
+        assert(c.value() == 0)
+        assert(registry.counter('c') is c)
+
+    def test_render(self, registry):
+        registry.counter('c', worker='a"b').inc()
+        registry.histogram('h', buckets=(1,)).observe(0.5)
+        expected = '\n'.join([
+            '# TYPE c counter',
+            'c{worker="a\\"b"} 1',
+            '# TYPE h histogram',
+            'h_bucket{le="1"} 1',
+            'h_bucket{le="+Inf"} 1',
+            'h_sum 0.5',
+            'h_count 1',
+        ]) + '\n'
+        assert(registry.render() == expected)
+
+    def test_dump(self, registry, caplog):
+        registry.counter('c').inc()
+        with caplog.at_level(logging.INFO, logger='twitlib'):
+            registry.dump()
+        assert('"c": 1' in caplog.text)
+
+    def test_start_dump_invalid(self, registry):
+        with pytest.raises(ValueError):
+            registry.start_dump(0)
+
+    def test_serve(self, registry):
+        registry.counter('c').inc()
+        server = registry.serve(port=0, host='127.0.0.1')
+        try:
+            url = 'http://127.0.0.1:%i/metrics' % server.server_address[1]
+            body = urllib.request.urlopen(url, timeout=5).read().decode('utf-8')
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert(body == registry.render())
+
+@pytest.mark.usefixtures('mock_queue')
+class TestInstrumentation():
+
+    @pytest.fixture
+    def status(self):
+        return Status.NewFromJsonDict({'id' : 1})
+
+    def test_dispatcher(self, mocker, status):
+        enqueued = metrics.counter('twitlib_enqueued_total', worker='WriterThread')
+        rejected = metrics.counter('twitlib_filter_rejections_total', stage='dispatcher', worker='WorkerThread')
+        before = (enqueued.value(), rejected.value())
+
+        d = Dispatcher(threads=[WriterThread, WorkerThread], filters={WorkerThread : [lambda s : False]})
+        d.on_status(status)
+        assert((enqueued.value(), rejected.value()) == (before[0] + 1, before[1] + 1))
+
+    def test_queue_depth(self, mocker):
+        Dispatcher(threads=[WriterThread])
+        mocker.patch.object(WriterThread.QUEUE, 'qsize', return_value=7)
+        assert(metrics.REGISTRY.snapshot()['twitlib_queue_depth{worker="WriterThread"}'] == 7)
+
+    def test_queue_depth_no_queue(self, caplog):
+        class Queueless():
+            """Dispatcher target without a class job queue, like ProcessPoolWorker"""
+            __name__ = 'Queueless'
+            def enqueue(self, status):
+                pass
+
+        Dispatcher(threads=[Queueless()])
+        metrics.REGISTRY.render()
+        assert('twitlib_queue_depth{worker="Queueless"}' not in metrics.REGISTRY.snapshot())
+        assert(not [r for r in caplog.records if r.levelno >= logging.ERROR])
+
+    def test_worker(self, mocker, status):
+        worker = WriterThread(loops=1)
+        mocker.patch.object(worker, 'process_status')
+        mocker.patch.object(WriterThread, 'dequeue', return_value=status)
+        processed = metrics.counter('twitlib_processed_total', worker='WriterThread')
+        latency = metrics.histogram('twitlib_process_seconds', worker='WriterThread')
+        before = (processed.value(), latency.value()['count'])
+
+        worker.run()
+        assert(processed.value() == before[0] + 1)
+        assert(latency.value()['count'] == before[1] + 1)
+
+    def test_validate_status(self, status):
+        rejected = metrics.counter('twitlib_filter_rejections_total', stage='worker')
+        before = rejected.value()
+        WorkerThread.validate_status(status, [lambda s : False])
+        WorkerThread.validate_status(status, [lambda s : True])
+        assert(rejected.value() == before + 1)
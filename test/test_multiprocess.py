@@ -0,0 +1,70 @@
+import pytest
+import os
+from twitter import Status
+
+from twitlib.multiprocess import ProcessPoolWorker
+from twitlib.streaming import WorkerThread, Dispatcher
+
+class EchoThread(WorkerThread):
+    """Returns details of each status and the process it was handled in"""
+
+    def process_status(self, status):
+        if status.text == 'raise':
+            raise ValueError(status.text)
+        return status.id, status.hashtags[0].text, self.name, os.getpid()
+
+def make_status(i, text='text'):
+    return Status.NewFromJsonDict({
+        'id' : i,
+        'text' : text,
+        'entities' : {'hashtags' : [{'text' : 'tag%i' % i}]},
+    })
+
+@pytest.fixture
+def mock_queue():
+    """
+    Opt out of the autouse queue.Queue patch, which ProcessPoolExecutor
+    relies on to pass work to and from pool processes
+    """
+    return None
+
+@pytest.mark.timeout(10)
+class TestProcessPoolWorker():
+
+    @pytest.fixture
+    def pool(self):
+        result = ProcessPoolWorker(EchoThread, processes=2, max_pending=4)
+        yield result
+        result.close()
+
+    def test_runs_process_status(self, pool):
+        status_id, tag, name, pid = pool.enqueue(make_status(1)).result()
+        assert(status_id == 1)
+        assert(tag == 'tag1')
+        assert(pid != os.getpid())
+
+    def test_worker_named_by_process(self, pool):
+        status_id, tag, name, pid = pool.enqueue(make_status(1)).result()
+        assert(name == 'EchoThread-%i' % pid)
+
+    def test_many(self, pool):
+        futures = [pool.enqueue(make_status(i)) for i in range(10)]
+        actual = [f.result()[0] for f in futures]
+        assert(actual == list(range(10)))
+
+    def test_exception(self, pool):
+        future = pool.enqueue(make_status(1, text='raise'))
+        with pytest.raises(ValueError):
+            future.result()
+        assert(pool.enqueue(make_status(2)).result()[0] == 2)
+
+    def test_dispatcher_compatible(self, mocker, pool):
+        m = mocker.patch.object(pool, 'enqueue')
+        status = make_status(1)
+        Dispatcher(threads=[pool]).on_status(status)
+        m.assert_called_once_with(status)
+
+    def test_sentinel_closes(self, mocker, pool):
+        m = mocker.patch.object(pool, 'close')
+        assert(pool.enqueue(None) is None)
+        m.assert_called_once_with(wait=False)
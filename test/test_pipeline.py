@@ -0,0 +1,136 @@
+import pytest
+from threading import Event
+from unittest.mock import MagicMock
+from twitter import Status
+
+from twitlib.dedup import DedupIndex
+from twitlib.pipeline import Pipeline
+from twitlib.pool import WorkerPool
+from twitlib.streaming import Dispatcher, WorkerThread
+
+@pytest.fixture
+def mock_queue():
+    """Opt out of the autouse queue.Queue patch, draining needs a real queue"""
+    return None
+
+class RecordingThread(WorkerThread):
+
+    QUEUE = None
+    processed = None
+    closed = None
+    release = None
+
+    def __init__(self, **kwargs):
+        super().__init__(filters=[], **kwargs)
+
+    def process_status(self, status):
+        RecordingThread.release.wait(5)
+        RecordingThread.processed.append(status.id)
+
+    def close(self):
+        RecordingThread.closed.append(list(RecordingThread.processed))
+
+@pytest.fixture(autouse=True)
+def queue():
+    RecordingThread.configure_queue()
+    RecordingThread.processed = []
+    RecordingThread.closed = []
+    RecordingThread.release = Event()
+    RecordingThread.release.set()
+    yield RecordingThread.QUEUE
+    RecordingThread.release.set()
+
+@pytest.fixture
+def dispatcher():
+    return Dispatcher(threads=[RecordingThread])
+
+def feed(dispatcher, n):
+    for i in range(n):
+        dispatcher.on_status(Status.NewFromJsonDict({'id' : i}))
+
+def test_drain(dispatcher):
+    RecordingThread.release.clear()
+    workers = [RecordingThread(), RecordingThread()]
+    pipeline = Pipeline(dispatcher, workers).start()
+    feed(dispatcher, 10)
+    RecordingThread.release.set()
+
+    assert(pipeline.drain(timeout=5) == [])
+    assert(sorted(RecordingThread.processed) == list(range(10)))
+    assert(not any(w.is_alive() for w in workers))
+    assert(len(RecordingThread.closed) == 2)
+
+def test_intake_closed(dispatcher):
+    pipeline = Pipeline(dispatcher, [RecordingThread()]).start()
+    pipeline.drain(timeout=5)
+    assert(dispatcher.closed)
+
+    feed(dispatcher, 1)
+    assert(RecordingThread.QUEUE.qsize() == 0)
+
+def test_batches_flushed(dispatcher):
+    RecordingThread.release.clear()
+    worker = RecordingThread(batch_size=4, batch_linger=0.01)
+    pipeline = Pipeline(dispatcher, [worker]).start()
+    feed(dispatcher, 6)
+    RecordingThread.release.set()
+
+    assert(pipeline.drain(timeout=5) == [])
+    assert(RecordingThread.closed == [list(range(6))])
+
+def test_timeout(dispatcher):
+    RecordingThread.release.clear()
+    worker = RecordingThread()
+    pipeline = Pipeline(dispatcher, [worker]).start()
+    feed(dispatcher, 2)
+
+    assert(pipeline.drain(timeout=0.05) == [worker])
+    RecordingThread.release.set()
+    worker.join(5)
+    assert(RecordingThread.processed == [0, 1])
+
+def test_pool(dispatcher):
+    pool = WorkerPool(RecordingThread, min_workers=2, max_workers=2, interval=60)
+    pipeline = Pipeline(dispatcher, [pool]).start()
+    feed(dispatcher, 5)
+
+    assert(pipeline.drain(timeout=5) == [])
+    assert(sorted(RecordingThread.processed) == list(range(5)))
+    assert(pool.size == 0)
+
+def test_start_skips_started(dispatcher):
+    worker = RecordingThread()
+    worker.start()
+    Pipeline(dispatcher, [worker]).start().drain(timeout=5)
+    assert(not worker.is_alive())
+
+def test_unconsumed_class_ignored():
+    class IdleThread(RecordingThread):
+        QUEUE = None
+
+    IdleThread.configure_queue()
+    dispatcher = Dispatcher(threads=[RecordingThread, IdleThread])
+    pipeline = Pipeline(dispatcher, [RecordingThread()]).start()
+    feed(dispatcher, 3)
+
+    assert(pipeline.drain(timeout=5) == [])
+    assert(IdleThread.QUEUE.qsize() == 3)
+
+def test_shutdown_closes(dispatcher):
+    index = MagicMock(spec=DedupIndex)
+    index.seen.return_value = False
+    dispatcher.dedup = index
+    RecordingThread.QUEUE._spool = MagicMock()
+
+    Pipeline(dispatcher, [RecordingThread()]).start().shutdown(timeout=5)
+    assert(index.close.called)
+    assert(RecordingThread.QUEUE.spool.close.called)
+
+def test_shutdown_keeps_stuck_spool(dispatcher):
+    RecordingThread.release.clear()
+    RecordingThread.QUEUE._spool = MagicMock()
+    pipeline = Pipeline(dispatcher, [RecordingThread()]).start()
+    feed(dispatcher, 1)
+
+    assert(len(pipeline.shutdown(timeout=0.05)) == 1)
+    assert(not RecordingThread.QUEUE.spool.close.called)
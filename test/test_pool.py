@@ -0,0 +1,144 @@
+import pytest
+import time
+from queue import Queue
+from threading import Event
+from twitter import Status
+
+import twitlib.metrics as metrics
+from twitlib.pool import WorkerPool
+from twitlib.queues import StatusQueue
+from twitlib.streaming import WorkerThread
+
+@pytest.fixture
+def mock_queue():
+    """Opt out of the autouse queue.Queue patch, pools need a real queue"""
+    return None
+
+class SlowThread(WorkerThread):
+
+    QUEUE = None
+    release = None
+
+    def __init__(self, **kwargs):
+        super().__init__(filters=[], **kwargs)
+
+    def process_status(self, status):
+        SlowThread.release.wait(5)
+
+@pytest.fixture(autouse=True)
+def queue():
+    SlowThread.configure_queue()
+    SlowThread.release = Event()
+    yield SlowThread.QUEUE
+    SlowThread.release.set()
+
+@pytest.fixture
+def pool():
+    result = WorkerPool(SlowThread, min_workers=1, max_workers=4, backlog=2, idle_checks=2, interval=60)
+    yield result
+    SlowThread.release.set()
+    result.stop(timeout=5)
+
+def fill(n):
+    for i in range(n):
+        SlowThread.enqueue(Status.NewFromJsonDict({'id' : i}))
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+@pytest.mark.timeout(10)
+class TestWorkerPool():
+
+    @pytest.mark.parametrize('kwargs', [
+        {'min_workers' : -1},
+        {'min_workers' : 2, 'max_workers' : 1},
+        {'max_workers' : 0},
+        {'backlog' : 0},
+        {'idle_checks' : 0},
+        {'interval' : 0},
+    ])
+    def test_invalid(self, kwargs):
+        with pytest.raises(ValueError):
+            WorkerPool(SlowThread, **kwargs)
+
+    def test_start(self, pool):
+        pool.start()
+        assert(pool.size == 1)
+        assert(pool.workers[0].name == 'SlowThread-0')
+
+    def test_grows_with_backlog(self, pool):
+        pool.start()
+        fill(7)
+        assert(pool.check() == 4)
+        assert(len(pool.workers) == 4)
+
+    def test_grows_within_max(self, pool):
+        pool.start()
+        fill(100)
+        assert(pool.check() == 4)
+
+    def test_grows_on_latency(self, pool):
+        pool = WorkerPool(SlowThread, max_workers=4, backlog=100, latency_target=0.1, interval=60)
+        metrics.histogram('twitlib_process_seconds', worker='SlowThread').observe(1)
+        pool.start()
+        fill(1)
+        try:
+            assert(pool.check() == 2)
+        finally:
+            SlowThread.release.set()
+            pool.stop(timeout=5)
+
+    def test_shrinks_when_idle(self, pool):
+        pool.scale_to(3)
+        assert(pool.check() == 3)
+        assert(pool.check() == 2)
+        assert(wait_for(lambda : len(pool.workers) == 2))
+
+    def test_keeps_min(self, pool):
+        pool.scale_to(1)
+        for _ in range(5):
+            assert(pool.check() == 1)
+
+    def test_replaces_dead(self, pool):
+        pool.scale_to(1)
+        SlowThread.enqueue(None)
+        assert(wait_for(lambda : len(pool.workers) == 0))
+        assert(pool.check() == 1)
+
+    def test_crash_not_retired(self, mocker, pool):
+        crashed = mocker.MagicMock(spec=SlowThread, stopped=False)
+        crashed.is_alive.return_value = False
+        running = mocker.MagicMock(spec=SlowThread)
+        running.is_alive.return_value = True
+        pool._workers = [crashed, running]
+        pool._retiring = 1
+
+        # The pending sentinel will still retire the running worker
+        assert(pool.size == 0)
+        assert(pool.workers == [running])
+
+    def test_stopped_worker_retired(self, pool):
+        pool.scale_to(2)
+        pool.scale_to(1)
+        assert(wait_for(lambda : len(pool.workers) == 1))
+        assert(pool.size == 1)
+        assert(pool._retiring == 0)
+
+    def test_stop_drains(self, pool):
+        pool.start()
+        fill(3)
+        SlowThread.release.set()
+        assert(pool.stop(timeout=5) == [])
+        assert(SlowThread.QUEUE.qsize() == 0)
+        assert(pool.size == 0)
+
+    def test_stop_reports_stuck(self, pool):
+        pool.start()
+        fill(1)
+        assert(wait_for(lambda : SlowThread.QUEUE.qsize() == 0))
+        stuck = pool.stop(timeout=0.05)
+        assert(len(stuck) == 1)
+        SlowThread.release.set()
@@ -0,0 +1,206 @@
+import pytest
+import os
+import queue
+from twitter import Status
+
+import twitlib.queues as queues
+from twitlib.queues import StatusQueue, weighted, log_followers
+from twitlib.streaming import WorkerThread, WriterThread
+
+# Captured before os.makedirs is patched by the autouse patch_io fixture
+real_makedirs = os.makedirs
+
+def make_status(i):
+    return Status.NewFromJsonDict({
+        'id' : i,
+        'text' : 'tweet %i' % i,
+        'entities' : {'hashtags' : [{'text' : 'tag%i' % i}]},
+    })
+
+def drain(q):
+    result = []
+    while not q.empty():
+        item = q.get()
+        result.append(item.id if item is not None else None)
+        q.task_done()
+    return result
+
+class TestStatusQueue():
+
+    @pytest.fixture
+    def statuses(self):
+        return [make_status(i) for i in range(5)]
+
+    def test_invalid_policy(self):
+        with pytest.raises(ValueError):
+            StatusQueue(1, overflow='bogus')
+
+    def test_block_timeout(self, statuses):
+        q = StatusQueue(1)
+        q.put(statuses[0])
+        with pytest.raises(queue.Full):
+            q.put(statuses[1], timeout=0.01)
+
+    def test_drop_newest(self, statuses):
+        q = StatusQueue(2, overflow='drop_newest')
+        for s in statuses:
+            q.put(s)
+        assert(q.dropped == 3)
+        assert(drain(q) == [0, 1])
+
+    def test_drop_oldest(self, statuses):
+        q = StatusQueue(2, overflow='drop_oldest')
+        for s in statuses:
+            q.put(s)
+        assert(q.dropped == 3)
+        assert(drain(q) == [3, 4])
+
+    def test_drop_oldest_keeps_sentinel(self, statuses):
+        q = StatusQueue(2, overflow='drop_oldest')
+        q.put(None)
+        for s in statuses:
+            q.put(s)
+        assert(drain(q) == [None, 4])
+
+    def test_spill_preserves_order(self, statuses, tmpdir):
+        q = StatusQueue(2, overflow='spill', spill_dir=str(tmpdir))
+        for s in statuses:
+            q.put(s)
+        assert(q.spilled == 3)
+        assert(q.qsize() == 2)
+        assert(drain(q) == [0, 1, 2, 3, 4])
+        assert(q.pending_spill == 0)
+
+    def test_spill_round_trip(self, statuses, tmpdir):
+        q = StatusQueue(1, overflow='spill', spill_dir=str(tmpdir))
+        q.put(statuses[0])
+        q.put(statuses[1])
+        q.get()
+        actual = q.get()
+        assert(actual.hashtags[0].text == 'tag1')
+
+    def test_spill_creates_dir(self, statuses, tmpdir):
+        spill_dir = str(tmpdir.join('spill'))
+        os.makedirs.side_effect = real_makedirs
+        q = StatusQueue(1, overflow='spill', spill_dir=spill_dir)
+        q.put(statuses[0])
+        os.makedirs.assert_not_called()
+        q.put(statuses[1])
+        os.makedirs.assert_called_once_with(spill_dir, exist_ok=True)
+        assert(drain(q) == [0, 1])
+
+    def test_task_accounting(self, statuses, tmpdir):
+        q = StatusQueue(1, overflow='spill', spill_dir=str(tmpdir))
+        for s in statuses:
+            q.put(s)
+        drain(q)
+        assert(q.unfinished_tasks == 0)
+
+def by_id(status):
+    """Priority of the test statuses, higher ids first"""
+    return status.id
+
+class TestPriorityQueue():
+
+    @pytest.fixture
+    def clock(self, mocker):
+        """Monotonic clock advanced by hand"""
+        now = [1000.0]
+        mocker.patch.object(queues.time, 'monotonic', side_effect=lambda: now[0])
+        return now
+
+    @pytest.fixture
+    def statuses(self):
+        return [make_status(i) for i in range(5)]
+
+    def test_priority_order(self, clock, statuses):
+        q = StatusQueue(priority=by_id)
+        for s in statuses:
+            q.put(s)
+        assert(drain(q) == [4, 3, 2, 1, 0])
+
+    def test_equal_priority_fifo(self, clock, statuses):
+        q = StatusQueue(priority=lambda s: 1)
+        for s in statuses:
+            q.put(s)
+        assert(drain(q) == [0, 1, 2, 3, 4])
+
+    def test_aging(self, clock, statuses):
+        q = StatusQueue(priority=by_id, aging=10)
+        q.put(statuses[0])
+        clock[0] += 15
+        q.put(statuses[1])
+        clock[0] += 1
+        q.put(statuses[2])
+        # 0 waited longer than one unit of priority is worth, 1 did not
+        assert(drain(q) == [2, 0, 1])
+
+    def test_sentinel_last(self, clock, statuses):
+        q = StatusQueue(priority=by_id)
+        q.put(statuses[0])
+        q.put(None)
+        clock[0] += 1e6
+        q.put(statuses[1])
+        assert(drain(q) == [0, 1, None])
+
+    def test_priority_error(self, clock, statuses):
+        def failing(status):
+            if status.id == 1:
+                raise KeyError('user')
+            return status.id
+        q = StatusQueue(priority=failing)
+        for s in statuses[:3]:
+            q.put(s)
+        assert(drain(q) == [2, 0, 1])
+
+    def test_drop_oldest_drops_last(self, clock, statuses):
+        q = StatusQueue(2, overflow='drop_oldest', priority=by_id)
+        q.put(None)
+        for s in statuses:
+            q.put(s)
+        assert(q.dropped == 4)
+        assert(drain(q) == [4, None])
+
+    def test_spill(self, clock, statuses, tmpdir):
+        q = StatusQueue(2, overflow='spill', spill_dir=str(tmpdir), priority=by_id)
+        for s in statuses:
+            q.put(s)
+        assert(sorted(drain(q)) == [0, 1, 2, 3, 4])
+        assert(q.unfinished_tasks == 0)
+
+    def test_invalid_aging(self):
+        with pytest.raises(ValueError):
+            StatusQueue(priority=by_id, aging=0)
+
+class TestPriorityFuncs():
+
+    def test_weighted(self):
+        priority = weighted((lambda s: s.id == 1, 10), (lambda s: True, 0.5), (lambda s: None, 3))
+        assert(priority(make_status(1)) == 10.5)
+        assert(priority(make_status(2)) == 0.5)
+
+    def test_log_followers(self):
+        status = Status.NewFromJsonDict({'id' : 1, 'user' : {'id' : 2, 'followers_count' : 999}})
+        assert(log_followers(status) == pytest.approx(3))
+        assert(log_followers(make_status(1)) == 0)
+
+class TestConfigureQueue():
+
+    @pytest.fixture(autouse=True)
+    def restore_queue(self, mocker):
+        mocker.patch.object(WriterThread, 'QUEUE', WriterThread.QUEUE)
+
+    def test_replaces_queue(self):
+        WriterThread.configure_queue(10, overflow='drop_newest')
+        assert(isinstance(WriterThread.QUEUE, StatusQueue))
+        assert(WriterThread.QUEUE.maxsize == 10)
+        assert(WriterThread.QUEUE.overflow == 'drop_newest')
+
+    def test_priority(self):
+        WriterThread.configure_queue(priority=by_id, aging=5)
+        assert(WriterThread.QUEUE.priority is by_id)
+        assert(WriterThread.QUEUE.aging == 5)
+
+    def test_per_class(self):
+        WriterThread.configure_queue(10)
+        assert(WorkerThread.QUEUE is not WriterThread.QUEUE)
@@ -0,0 +1,148 @@
+import pytest
+import json
+import os
+from twitter import Status
+
+import twitlib.codec as codec
+import twitlib.util as util
+from twitlib.replay import Replayer, find_files, read_file, status_time
+from twitlib.status import LazyStatus
+
+# Snowflake ids one second apart
+FIRST_ID = 1000000000000000000
+SECOND_ID = FIRST_ID + (1000 << 22)
+
+def make_status(i):
+    return Status.NewFromJsonDict({'id' : i, 'text' : 'tweet %i' % i, 'hashtags' : []})
+
+def write_utf32(path, status):
+    with open(path, 'w', encoding='utf-32') as f:
+        f.write(json.dumps(status.AsDict(), indent=2, sort_keys=True))
+
+def write_raw(path, status):
+    with open(path, 'wb') as f:
+        f.write(codec.encode_status(status))
+
+@pytest.fixture
+def archive(tmpdir):
+    """Directory of statuses 1 to 12 in each file format"""
+    root = tmpdir.mkdir('archive')
+    files = root.mkdir('files')
+    for i in (1, 2, 10):
+        write_utf32(str(files.join('status_%i.json' % i)), make_status(i))
+    write_raw(str(files.join('status_11.json')), make_status(11))
+    files.join('media.jpg').write(b'jpeg')
+
+    segments = root.mkdir('segments')
+    lines = [codec.encode_status(make_status(i)) for i in (3, 4)]
+    segments.join('segment_1.jsonl').write(b'\n'.join(lines) + b'\n')
+    segments.join('segment_2.jsonl').write(codec.encode_status(make_status(12)) + b'\n\n')
+    return str(root)
+
+@pytest.fixture
+def listener(mocker):
+    return mocker.MagicMock(name='listener')
+
+def replayed_ids(listener):
+    return [args[0].id for args, kwargs in listener.on_status.call_args_list]
+
+class TestReadFile():
+
+    def test_utf32(self, tmpdir):
+        path = str(tmpdir.join('status_1.json'))
+        write_utf32(path, make_status(1))
+        status, = read_file(path)
+        assert(status.id == 1)
+        assert(status.text == 'tweet 1')
+
+    def test_raw(self, tmpdir):
+        path = str(tmpdir.join('status_1.json'))
+        write_raw(path, make_status(1))
+        status, = read_file(path)
+        assert(isinstance(status, LazyStatus))
+        assert(status.text == 'tweet 1')
+
+    def test_segment(self, tmpdir):
+        path = tmpdir.join('segment.jsonl')
+        path.write(b'\n'.join([
+                codec.encode_status(make_status(1)),
+                b'',
+                b'{"id":',
+                codec.encode_status(make_status(2)),
+        ]))
+        assert([s.id for s in read_file(str(path), lazy=False)] == [1, 2])
+
+class TestFindFiles():
+
+    def test_natural_order(self, archive):
+        names = [os.path.relpath(p, archive) for p in find_files(archive)]
+        assert(names == [
+                os.path.join('files', 'status_1.json'),
+                os.path.join('files', 'status_2.json'),
+                os.path.join('files', 'status_10.json'),
+                os.path.join('files', 'status_11.json'),
+                os.path.join('segments', 'segment_1.jsonl'),
+                os.path.join('segments', 'segment_2.jsonl'),
+        ])
+
+    def test_patterns(self, archive):
+        assert(len(list(find_files(archive, patterns=['*.jsonl']))) == 2)
+
+    def test_files_given(self, archive):
+        path = os.path.join(archive, 'files', 'media.jpg')
+        assert(list(find_files([path])) == [path])
+
+class TestReplayer():
+
+    @pytest.mark.parametrize('readers,read_ahead', [(1, 1), (4, 16)])
+    def test_replay(self, archive, listener, readers, read_ahead):
+        replayer = Replayer(listener, readers=readers, read_ahead=read_ahead)
+        assert(replayer.replay(archive) == 7)
+        assert(replayed_ids(listener) == [1, 2, 10, 11, 3, 4, 12])
+
+    def test_unreadable_skipped(self, tmpdir, listener):
+        tmpdir.join('a.json').write(b'{"id":')
+        write_raw(str(tmpdir.join('b.json')), make_status(2))
+        assert(Replayer(listener).replay(str(tmpdir)) == 1)
+
+    def test_stop(self, archive, listener):
+        replayer = Replayer(listener)
+        listener.on_status.side_effect = lambda status: replayer.stop()
+        assert(replayer.replay(archive) == 1)
+
+    def test_paced(self, mocker, tmpdir, listener):
+        write_raw(str(tmpdir.join('a.json')), make_status(FIRST_ID))
+        write_raw(str(tmpdir.join('b.json')), make_status(SECOND_ID))
+        replayer = Replayer(listener, speed=10)
+        wait = mocker.patch.object(replayer._stop, 'wait')
+
+        replayer.replay(str(tmpdir))
+        delay, = wait.call_args[0]
+        assert(0 < delay <= 0.1)
+
+    def test_unpaced(self, mocker, tmpdir, listener):
+        write_raw(str(tmpdir.join('a.json')), make_status(FIRST_ID))
+        write_raw(str(tmpdir.join('b.json')), make_status(SECOND_ID))
+        replayer = Replayer(listener)
+        wait = mocker.patch.object(replayer._stop, 'wait')
+
+        replayer.replay(str(tmpdir))
+        wait.assert_not_called()
+
+    @pytest.mark.parametrize('kwargs', [{'speed' : 0}, {'readers' : 0}, {'read_ahead' : 0}])
+    def test_invalid(self, listener, kwargs):
+        with pytest.raises(ValueError):
+            Replayer(listener, **kwargs)
+
+class TestStatusTime():
+
+    def test_snowflake(self):
+        expected = ((FIRST_ID >> 22) + util.SNOWFLAKE_EPOCH_MS) / 1000
+        assert(status_time(make_status(FIRST_ID)) == expected)
+
+    def test_created_at(self):
+        status = Status.NewFromJsonDict({'id' : 1, 'created_at' : 'Wed Oct 10 20:19:24 +0000 2018'})
+        assert(status_time(status) == 1539202764)
+
+    def test_unknown(self):
+        assert(status_time(make_status(1)) is None)
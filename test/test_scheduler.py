@@ -0,0 +1,190 @@
+import pytest
+import time
+import twitter
+
+from concurrent.futures import CancelledError
+from threading import Event
+
+from twitlib.scheduler import PostScheduler, TokenBucket, UPDATE_PATH
+
+def use_rate_limit(api):
+    """Give the mock Api the rate limit state python-twitter keeps from response headers"""
+    api.base_url = 'https://api.twitter.com/1.1'
+    api.rate_limit = twitter.ratelimit.RateLimit()
+
+class TestTokenBucket():
+
+    def test_burst(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        now = bucket._updated
+        assert(bucket.take(now) == 0)
+        assert(bucket.take(now) == 0)
+        assert(bucket.take(now) == pytest.approx(1))
+
+    def test_refill(self):
+        bucket = TokenBucket(rate=2, capacity=1)
+        now = bucket._updated
+        bucket.take(now)
+        assert(bucket.take(now + 0.25) == pytest.approx(0.25))
+        assert(bucket.take(now + 0.5) == 0)
+
+    def test_capacity(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        now = bucket._updated
+        bucket._refill(now + 100)
+        assert(bucket._tokens == 2)
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=1, capacity=5)
+        now = bucket._updated
+        bucket.pause(10, now)
+        assert(bucket.take(now + 5) == pytest.approx(6))
+        assert(bucket.take(now + 11) == 0)
+
+    def test_limit(self):
+        bucket = TokenBucket(rate=1, capacity=5)
+        now = bucket._updated
+        bucket.limit(2, 100, now)
+        assert(bucket.take(now) == 0)
+        assert(bucket.take(now) == 0)
+        assert(bucket.take(now) == pytest.approx(1))
+
+    def test_limit_exhausted(self):
+        bucket = TokenBucket(rate=1, capacity=5)
+        now = bucket._updated
+        bucket.limit(0, 30, now)
+        assert(bucket.take(now) == pytest.approx(31))
+
+    @pytest.mark.parametrize('kwargs', [{'rate' : 0}, {'rate' : 1, 'capacity' : 0.5}])
+    def test_invalid(self, kwargs):
+        with pytest.raises(ValueError):
+            TokenBucket(**kwargs)
+
+class TestPostScheduler():
+
+    @pytest.fixture
+    def scheduler(self, api):
+        result = PostScheduler(api, rate=1000, burst=1)
+        yield result
+        result.close(timeout=1)
+
+    def test_posts(self, scheduler, api):
+        future = scheduler.submit('text', [1, 2])
+        assert(future.result(timeout=1) == api.PostUpdate.return_value)
+        api.PostUpdate.assert_called_once_with(status='text', media=[1, 2])
+
+    def test_no_media(self, scheduler, api):
+        scheduler.submit('text').result(timeout=1)
+        api.PostUpdate.assert_called_once_with(status='text', media=None)
+
+    def test_priority_order(self, scheduler, api):
+        with scheduler._cond:
+            scheduler.bucket.pause(0.05)
+            futures = [
+                    scheduler.submit('low', priority=0),
+                    scheduler.submit('high', priority=2),
+                    scheduler.submit('mid', priority=1),
+                    scheduler.submit('low again', priority=0),
+            ]
+        for f in futures:
+            f.result(timeout=1)
+        posted = [kwargs['status'] for args, kwargs in api.PostUpdate.call_args_list]
+        assert(posted == ['high', 'mid', 'low', 'low again'])
+
+    def test_priority_func(self, api, status):
+        scheduler = PostScheduler(api, rate=1000, priority=lambda s: 5)
+        with scheduler._cond:
+            scheduler.bucket.pause(0.05)
+            scheduler.submit('other', priority=1)
+            scheduler.submit('status', status=status)
+        scheduler.close(timeout=1)
+        posted = [kwargs['status'] for args, kwargs in api.PostUpdate.call_args_list]
+        assert(posted == ['status', 'other'])
+
+    def test_rate_limit_retried(self, mocker, api):
+        limited = twitter.TwitterError([{'code' : 88, 'message' : 'Rate limit exceeded'}])
+        api.PostUpdate.side_effect = [limited, 'posted']
+        scheduler = PostScheduler(api, rate=1000, retry_after=0.01)
+
+        assert(scheduler.submit('text').result(timeout=1) == 'posted')
+        assert(api.PostUpdate.call_count == 2)
+        scheduler.close()
+
+    def test_rate_limit_reset(self, api):
+        limited = twitter.TwitterError([{'code' : 185, 'message' : 'Over daily status update limit'}])
+        use_rate_limit(api)
+        api.PostUpdate.side_effect = [limited, 'posted']
+        api.rate_limit.set_limit(api.base_url + UPDATE_PATH, 300, 0, int(time.time()) + 1)
+        scheduler = PostScheduler(api, rate=1000, retry_after=60)
+
+        # Paused until the reported reset, not for retry_after
+        assert(scheduler.submit('text').result(timeout=5) == 'posted')
+        scheduler.close()
+
+    def test_quota(self, api):
+        use_rate_limit(api)
+        scheduler = PostScheduler(api, rate=1000, burst=5)
+        assert(scheduler.quota() is None)
+
+        api.rate_limit.set_limit(api.base_url + UPDATE_PATH, 300, 0, int(time.time()) + 60)
+        scheduler.submit('text').result(timeout=1)
+        remaining, reset_in = scheduler.quota()
+        assert(remaining == 0)
+        assert(0 < reset_in <= 60)
+        with scheduler._cond:
+            assert(scheduler.bucket.take() > 50)
+        scheduler.close(timeout=0.01)
+
+    def test_error(self, scheduler, api):
+        api.PostUpdate.side_effect = twitter.TwitterError([{'code' : 187, 'message' : 'Duplicate'}])
+        with pytest.raises(twitter.TwitterError):
+            scheduler.submit('text').result(timeout=1)
+
+    def test_close_cancels(self, api):
+        scheduler = PostScheduler(api, rate=1e-6, burst=1)
+        scheduler.submit('first').result(timeout=1)
+        waiting = scheduler.submit('second')
+
+        assert(scheduler.close(timeout=0.05) == 1)
+        with pytest.raises(CancelledError):
+            waiting.result()
+        assert(api.PostUpdate.call_count == 1)
+
+    def test_cancel_while_posting(self, api):
+        scheduler = PostScheduler(api, rate=1000)
+        posting = Event()
+        release = Event()
+        def post_update(**kwargs):
+            posting.set()
+            release.wait(1)
+            return 'posted'
+        api.PostUpdate.side_effect = post_update
+
+        future = scheduler.submit('text')
+        assert(posting.wait(1))
+        assert(not future.cancel())
+        release.set()
+        assert(future.result(timeout=1) == 'posted')
+        scheduler.close()
+
+    def test_close_cancels_rate_limited(self, api):
+        api.PostUpdate.side_effect = twitter.TwitterError([{'code' : 88, 'message' : 'Rate limit exceeded'}])
+        scheduler = PostScheduler(api, rate=1000, retry_after=60)
+        future = scheduler.submit('text')
+        deadline = time.monotonic() + 1
+        while not (api.PostUpdate.called and scheduler.pending) and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+        assert(scheduler.close(timeout=0.05) == 1)
+        with pytest.raises(CancelledError):
+            future.result(timeout=1)
+
+    def test_submit_after_close(self, scheduler):
+        scheduler.close()
+        with pytest.raises(RuntimeError):
+            scheduler.submit('text')
+
+    @pytest.mark.parametrize('kwargs', [{'max_pending' : -1}, {'retry_after' : 0}])
+    def test_invalid(self, api, kwargs):
+        with pytest.raises(ValueError):
+            PostScheduler(api, **kwargs)
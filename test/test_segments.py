@@ -0,0 +1,109 @@
+import pytest
+import json
+import os
+import time
+from twitter import Status
+
+import twitlib.segments as segments
+from twitlib.segments import SegmentWriter
+
+def make_status(i):
+    return Status.NewFromJsonDict({'id' : i, 'text' : 'tweet é %i' % i})
+
+def read_lines(path):
+    with open(path, 'rb') as f:
+        return [json.loads(line.decode('utf-8')) for line in f]
+
+class TestSegmentWriter():
+
+    @pytest.fixture
+    def writer(self, tmpdir):
+        result = SegmentWriter(dirname=str(tmpdir), thread='WT-0')
+        yield result
+        result.close()
+
+    @pytest.fixture
+    def statuses(self):
+        return [make_status(i) for i in range(4)]
+
+    def test_appends_json_lines(self, writer, statuses):
+        for s in statuses:
+            path = writer.write(s)
+        writer.flush()
+        actual = [d['id'] for d in read_lines(path)]
+        assert(actual == [0, 1, 2, 3])
+
+    def test_compact_utf8(self, writer, statuses):
+        path = writer.write(statuses[0])
+        writer.close()
+        with open(path, 'rb') as f:
+            content = f.read()
+        assert(content == b'{"id":0,"text":"tweet \xc3\xa9 0"}\n')
+
+    def test_filename_format(self, writer, statuses):
+        path = writer.write(statuses[0])
+        name = os.path.basename(path)
+        assert(name.startswith('segment_WT-0_'))
+        assert(name.endswith('_0.jsonl'))
+
+    def test_size_rotation(self, writer, statuses):
+        writer.max_bytes = 1
+        paths = writer.write_many(statuses)
+        assert(len(set(paths)) == len(statuses))
+
+    def test_time_rotation(self, writer, statuses):
+        writer.max_seconds = 0
+        paths = writer.write_many(statuses[:2])
+        assert(paths[0] != paths[1])
+
+    def test_no_rotation(self, writer, statuses):
+        paths = writer.write_many(statuses)
+        assert(len(set(paths)) == 1)
+
+    def test_fsync_interval(self, mocker, writer, statuses):
+        m = mocker.patch('os.fsync')
+        writer.fsync_interval = 0
+        writer.write_many(statuses)
+        m.assert_called_once()
+
+    def test_fsync_disabled(self, mocker, writer, statuses):
+        m = mocker.patch('os.fsync')
+        writer.fsync_interval = None
+        writer.write_many(statuses)
+        writer.close()
+        m.assert_not_called()
+
+    def test_close(self, writer, statuses):
+        writer.write(statuses[0])
+        writer.close()
+        assert(writer.path is None)
+
+    def test_timed_flush(self, writer, statuses):
+        writer.fsync_interval = 0.05
+        path = writer.write(statuses[0])
+        path = writer.write(statuses[1])
+        time.sleep(0.3)
+        assert([d['id'] for d in read_lines(path)] == [0, 1])
+
+    def test_timed_flush_without_fsync(self, mocker, writer, statuses):
+        mocker.patch('twitlib.segments.FLUSH_INTERVAL', 0.05)
+        m = mocker.patch('os.fsync')
+        writer.fsync_interval = None
+        path = writer.write(statuses[0])
+        time.sleep(0.3)
+        assert([d['id'] for d in read_lines(path)] == [0])
+        m.assert_not_called()
+
+    def test_close_cancels_timer(self, writer, statuses):
+        writer.fsync_interval = 60
+        writer.write(statuses[0])
+        writer.write(statuses[1])
+        assert(writer._timer is not None)
+        writer.close()
+        assert(writer._timer is None)
+
+    def test_closed_at_exit(self, writer, statuses):
+        path = writer.write(statuses[0])
+        segments._close_all()
+        assert(writer.path is None)
+        assert([d['id'] for d in read_lines(path)] == [0])
@@ -0,0 +1,200 @@
+import pytest
+import os
+import threading
+from twitter import Status
+
+from twitlib.queues import StatusQueue
+from twitlib.spool import Spool
+from twitlib.streaming import WriterThread
+
+# Imported before the autouse patch_io fixture replaces these
+from os import replace as real_replace, makedirs as real_makedirs
+from os.path import exists as real_exists
+
+def make_status(i):
+    return Status.NewFromJsonDict({'id' : i, 'text' : 'tweet %i' % i})
+
+@pytest.fixture(autouse=True)
+def real_io(mocker):
+    mocker.patch('os.replace', new=real_replace)
+    mocker.patch('os.path.exists', new=real_exists)
+    mocker.patch('os.makedirs', new=real_makedirs)
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('spool', 'test.spool'))
+
+@pytest.fixture
+def statuses():
+    return [make_status(i) for i in range(4)]
+
+class TestSpool():
+
+    def test_pending(self, path, statuses):
+        spool = Spool(path)
+        for s in statuses:
+            spool.append(s)
+        spool.ack(1)
+        assert([s.id for s in spool.pending()] == [0, 2, 3])
+        assert(len(spool) == 3)
+
+    def test_reopen(self, path, statuses):
+        spool = Spool(path)
+        for s in statuses:
+            spool.append(s)
+        spool.ack(0)
+        spool.close()
+
+        spool = Spool(path)
+        assert([s.id for s in spool.pending()] == [1, 2, 3])
+        assert(spool.pending()[0].text == 'tweet 1')
+
+    def test_duplicate_ids(self, path, statuses):
+        spool = Spool(path)
+        spool.append(statuses[0])
+        spool.append(statuses[1])
+        spool.append(statuses[0])
+        spool.ack(0)
+        assert([s.id for s in spool.pending()] == [1, 0])
+
+    def test_unknown_ack_ignored(self, path, statuses):
+        spool = Spool(path)
+        spool.append(statuses[0])
+        spool.ack(5)
+        assert(len(spool) == 1)
+
+    def test_truncates_when_empty(self, path, statuses):
+        spool = Spool(path)
+        for s in statuses:
+            spool.append(s)
+        for s in statuses:
+            spool.ack(s.id)
+        assert(spool.size == 0)
+        assert(os.path.getsize(path) == 0)
+
+    def test_compaction(self, path, statuses):
+        spool = Spool(path, compact_bytes=1)
+        for s in statuses:
+            spool.append(s)
+        spool.ack(0)
+        assert(b'-' not in open(path, 'rb').read())
+        assert([s.id for s in spool.pending()] == [1, 2, 3])
+
+    def test_incomplete_record(self, path, statuses):
+        spool = Spool(path)
+        spool.append(statuses[0])
+        spool.close()
+        with open(path, 'ab') as f:
+            f.write(b'+{"id":1,"te')
+
+        spool = Spool(path)
+        assert([s.id for s in spool.pending()] == [0])
+        spool.append(statuses[2])
+        assert([s.id for s in Spool(path).pending()] == [0, 2])
+
+    def test_fsync(self, mocker, path, statuses):
+        m = mocker.patch('os.fsync')
+        spool = Spool(path, fsync=True)
+        spool.append(statuses[0])
+        assert(m.called)
+
+    def test_invalid_compact_bytes(self, path):
+        with pytest.raises(ValueError):
+            Spool(path, compact_bytes=0)
+
+class TestSpooledQueue():
+
+    def test_ack_on_task_done(self, path, statuses):
+        q = StatusQueue(spool=Spool(path))
+        for s in statuses:
+            q.put(s)
+        q.get()
+        q.get()
+        q.task_done()
+        assert([s.id for s in q.spool.pending()] == [1, 2, 3])
+
+    def test_sentinel_not_logged(self, path, statuses):
+        q = StatusQueue(spool=Spool(path))
+        q.put(statuses[0])
+        q.put(None)
+        assert(len(q.spool) == 1)
+        q.get()
+        q.get()
+        q.task_done()
+        q.task_done()
+        assert(len(q.spool) == 0)
+
+    def test_ack_per_thread(self, path, statuses):
+        q = StatusQueue(spool=Spool(path))
+        q.put(statuses[0])
+        q.put(statuses[1])
+        q.get()
+
+        def other():
+            q.get()
+            q.task_done()
+
+        t = threading.Thread(target=other)
+        t.start()
+        t.join()
+        assert([s.id for s in q.spool.pending()] == [0])
+
+    def test_replay(self, path, statuses):
+        q = StatusQueue(spool=Spool(path))
+        for s in statuses:
+            q.put(s)
+        q.get()
+        q.task_done()
+        q.get()
+        q.spool.close()
+
+        q = StatusQueue(1, spool=Spool(path))
+        assert(q.qsize() == 3)
+        assert(q.get().id == 1)
+
+    def test_dropped_acked(self, path, statuses):
+        q = StatusQueue(1, overflow='drop_oldest', spool=Spool(path))
+        for s in statuses:
+            q.put(s)
+        assert([s.id for s in q.spool.pending()] == [3])
+
+    def test_drop_newest_not_logged(self, mocker, path, statuses):
+        q = StatusQueue(1, overflow='drop_newest', spool=Spool(path))
+        append = mocker.spy(q.spool, 'append')
+        ack = mocker.spy(q.spool, 'ack')
+        for s in statuses:
+            q.put(s)
+        assert(append.call_count == 1)
+        ack.assert_not_called()
+        assert([s.id for s in q.spool.pending()] == [0])
+
+    def test_spilled_logged_once(self, mocker, path, statuses, tmpdir):
+        q = StatusQueue(1, overflow='spill', spill_dir=str(tmpdir), spool=Spool(path))
+        append = mocker.spy(q.spool, 'append')
+        for s in statuses:
+            q.put(s)
+        while not q.empty():
+            q.get()
+            q.task_done()
+        assert(append.call_count == len(statuses))
+        assert(len(q.spool) == 0)
+
+    @pytest.mark.parametrize('overflow', ['block', 'drop_oldest', 'spill'])
+    def test_logged_under_queue_lock(self, mocker, path, statuses, tmpdir, overflow):
+        q = StatusQueue(2, overflow=overflow, spill_dir=str(tmpdir), spool=Spool(path))
+        locked = []
+        append = q.spool.append
+        def spy(status):
+            locked.append(q.mutex.locked())
+            append(status)
+        mocker.patch.object(q.spool, 'append', side_effect=spy)
+        for s in statuses[:3] if overflow != 'block' else statuses[:2]:
+            q.put(s)
+        assert(locked and all(locked))
+
+    def test_configure_queue(self, tmpdir, statuses):
+        spool_dir = str(tmpdir.join('spool'))
+        WriterThread.configure_queue(spool_dir=spool_dir)
+        WriterThread.enqueue(statuses[0])
+        assert(WriterThread.QUEUE.spool.path == os.path.join(spool_dir, 'WriterThread.spool'))
+        assert(len(WriterThread.QUEUE.spool) == 1)
@@ -0,0 +1,109 @@
+import pytest
+import pickle
+from twitter import Status, User
+
+import twitlib.filters as filters
+import twitlib.util as util
+from twitlib.status import LazyStatus
+
+@pytest.fixture
+def data():
+    return {
+        'id' : 10,
+        'id_str' : '10',
+        'text' : 'short text',
+        'created_at' : 'Mon Jan 01 00:00:00 +0000 2018',
+        'in_reply_to_status_id' : None,
+        'user' : {'id' : 2, 'screen_name' : 'poster'},
+        'entities' : {
+            'hashtags' : [{'text' : 'tag'}],
+            'urls' : [{'url' : 'https://t.co/x', 'expanded_url' : 'https://host.com'}],
+            'user_mentions' : [{'id' : 3, 'screen_name' : 'mentioned'}],
+            'media' : [{'id' : 4, 'media_url_https' : 'https://host.com/a.jpg'}],
+        },
+        'extended_entities' : {
+            'media' : [
+                {'id' : 4, 'media_url_https' : 'https://host.com/a.jpg'},
+                {'id' : 5, 'media_url_https' : 'https://host.com/b.jpg'},
+            ],
+        },
+        'retweeted_status' : {
+            'id' : 1,
+            'text' : 'original',
+            'user' : {'id' : 1, 'screen_name' : 'original'},
+        },
+    }
+
+class TestLazyStatus():
+
+    def test_is_status(self, data):
+        assert(isinstance(LazyStatus(data), Status))
+
+    def test_matches_status(self, data):
+        expected = Status.NewFromJsonDict(dict(data))
+        actual = LazyStatus.NewFromJsonDict(data)
+        assert(actual.AsDict() == expected.AsDict())
+        assert(actual == expected)
+        assert(repr(actual) == repr(expected))
+
+    def test_scalars(self, data):
+        status = LazyStatus(data)
+        assert(status.id == 10)
+        assert(status.text == 'short text')
+        assert(status.full_text is None)
+        assert(status.quoted_status is None)
+        assert(status.tweet_mode == 'compatibility')
+
+    def test_nested_not_built(self, mocker, data):
+        m = mocker.patch.object(User, 'NewFromJsonDict')
+        status = LazyStatus(data)
+        assert(status.id == 10)
+        assert(filters.is_retweet(status))
+        assert(filters.has_hashtag(status, 'tag'))
+        m.assert_not_called()
+
+    def test_nested_built_once(self, data):
+        status = LazyStatus(data)
+        assert(status.user is status.user)
+        assert(status.user.screen_name == 'poster')
+        assert(status.user_mentions[0].screen_name == 'mentioned')
+
+    def test_extended_media(self, data):
+        status = LazyStatus(data)
+        assert(util.list_media(status) == ['https://host.com/a.jpg', 'https://host.com/b.jpg'])
+
+    def test_entity_media(self, data):
+        del data['extended_entities']
+        assert(len(LazyStatus(data).media) == 1)
+
+    def test_lazy_retweet(self, data):
+        retweet = LazyStatus(data).retweeted_status
+        assert(isinstance(retweet, LazyStatus))
+        assert(retweet.text == 'original')
+
+    def test_extended_tweet(self, data):
+        data['truncated'] = True
+        data['extended_tweet'] = {'full_text' : 'full text'}
+        status = LazyStatus(data)
+        assert(status.full_text == 'full text')
+        assert(status.tweet_mode == 'extended')
+        assert('full_text' not in data)
+
+    def test_missing_attribute(self, data):
+        with pytest.raises(AttributeError):
+            LazyStatus(data).bogus
+
+    def test_raw_json(self, data):
+        status = LazyStatus(data)
+        assert(util.status_to_dict(status) is data)
+
+    def test_materialize(self, data):
+        status = LazyStatus(data).materialize()
+        assert(type(status) == Status)
+        assert(status.id == 10)
+
+    def test_pickle(self, data):
+        status = LazyStatus(data)
+        status.user
+        actual = pickle.loads(pickle.dumps(status))
+        assert(actual.AsDict() == status.AsDict())
@@ -91,7 +91,7 @@ def call(mocker, status, subworker, worker_subclass):
     if worker_subclass == WriterThread:
         return mocker.call(status, filename)
     elif worker_subclass == MirrorThread:
-        return mocker.call(subworker.api, status, subworker.temp_dir)
+        return mocker.call(subworker.api, status, subworker.temp_dir, subworker.scheduler)
     elif worker_subclass == MediaDownloaderThread:
         return mocker.call(status, filename)
     else:
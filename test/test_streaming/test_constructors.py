@@ -12,6 +12,7 @@ from queue import Queue
 from twitlib.streaming import Dispatcher
 from twitlib.streaming import WorkerThread
 from twitlib.streaming import MirrorThread, WriterThread, MediaDownloaderThread
+from twitlib.scheduler import PostScheduler
 
 LOG = 'twitlib'
 THREAD_WAIT = 0.1
@@ -39,12 +40,13 @@ class TestConstructors():
 
     arg_specs = {
         'loops' : 10,
-        'filters' : list,
+        'filters' : [lambda status : True],
         'dirname' : str,
         'dry_run' : bool,
         'api' : twitter.Api,
         'temp_dir' : str,
         'format' : str,
+        'scheduler' : PostScheduler,
     }
 
     @pytest.fixture(params=arg_specs.keys())
@@ -60,7 +62,7 @@ class TestConstructors():
     def has_attr(self, thread, mock_kwarg):
         worker_args = ['loops', 'filters']
         writer_args = ['dry_run', 'dirname', 'format']
-        mirror_args = ['dry_run', 'api', 'temp_dir']
+        mirror_args = ['dry_run', 'api', 'temp_dir', 'scheduler']
         downloader_args = ['dry_run', 'dirname', 'format']
 
         key, val = mock_kwarg
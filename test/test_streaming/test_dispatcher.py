@@ -3,6 +3,8 @@ import logging
 import json
 import twitter
 from twitlib.streaming import BaseListener, Dispatcher, WorkerThread
+from twitlib.filters import FilterChain
+from twitlib.dedup import ExactIndex
 
 LOG = 'twitlib'
 
@@ -41,7 +43,8 @@ class TestDispatcher():
 
     @pytest.fixture
     def dispatcher(self, mocker):
-        w = mocker.MagicMock(spec_set=WorkerThread)
+        w = mocker.MagicMock(spec=WorkerThread)
+        w.__name__ = 'WorkerThread'
         result = Dispatcher()
         result.threads = [w]
         return result
@@ -64,6 +67,90 @@ class TestDispatcher():
         for thread in dispatcher.threads:
             assert(thread.enqueue.call_count == call_count)
 
+    @pytest.fixture
+    def consumers(self, mocker):
+        result = [
+                mocker.MagicMock(spec=WorkerThread, name='consumer%i' % i)
+                for i in range(3)
+        ]
+        for i, m in enumerate(result):
+            m.__name__ = 'consumer%i' % i
+        return result
+
+    @pytest.fixture
+    def shared(self, mocker):
+        return mocker.Mock(spec=lambda s : 1, return_value=True, name='shared')
+
+    @pytest.fixture
+    def reject(self, mocker):
+        return mocker.Mock(spec=lambda s : 1, return_value=False, name='reject')
+
+    def test_filters_default_empty(self):
+        assert(Dispatcher().filters == {})
+
+    def test_unfiltered_consumer(self, consumers, status, reject):
+        d = Dispatcher(threads=consumers, filters={consumers[0] : [reject]})
+        d.on_status(status)
+        consumers[0].enqueue.assert_not_called()
+        consumers[1].enqueue.assert_called_once_with(status)
+
+    def test_rejected_not_enqueued(self, consumers, status, shared, reject):
+        filters = {
+            consumers[0] : [shared],
+            consumers[1] : [shared, reject],
+        }
+        d = Dispatcher(threads=consumers[:2], filters=filters)
+        d.on_status(status)
+        consumers[0].enqueue.assert_called_once_with(status)
+        consumers[1].enqueue.assert_not_called()
+
+    def test_shared_filter_evaluated_once(self, consumers, status, shared):
+        filters = {c : [shared] for c in consumers}
+        d = Dispatcher(threads=consumers, filters=filters)
+        d.on_status(status)
+        shared.assert_called_once_with(status)
+        for c in consumers:
+            c.enqueue.assert_called_once_with(status)
+
+    def test_filters_evaluated_per_status(self, consumers, status, shared):
+        d = Dispatcher(threads=consumers, filters={c : [shared] for c in consumers})
+        d.on_status(status)
+        d.on_status(status)
+        assert(shared.call_count == 2)
+
+    def test_adaptive(self, consumers, status, shared):
+        d = Dispatcher(threads=consumers[:1], filters={consumers[0] : [shared]}, adaptive=True)
+        assert(d.adaptive)
+        assert(d._chains[consumers[0]]._adaptive)
+        d.on_status(status)
+        consumers[0].enqueue.assert_called_once_with(status)
+
+    def test_filter_chain_used(self, consumers, status, shared):
+        chain = FilterChain([shared])
+        d = Dispatcher(threads=consumers[:1], filters={consumers[0] : chain})
+        assert(d._chains[consumers[0]] is chain)
+
+    @pytest.fixture
+    def statuses(self):
+        return [twitter.Status.NewFromJsonDict({'id' : i}) for i in range(2)]
+
+    def test_dedup(self, consumers, statuses):
+        d = Dispatcher(threads=consumers[:2], dedup=ExactIndex())
+        for s in statuses + statuses:
+            d.on_status(s)
+        for c in consumers[:2]:
+            assert(c.enqueue.call_args_list == [((s,),) for s in statuses])
+
+    def test_dedup_per_consumer(self, consumers, statuses, reject):
+        chain = FilterChain([reject])
+        dedup = {c : ExactIndex() for c in consumers[:2]}
+        d = Dispatcher(threads=consumers[:2], filters={consumers[1] : chain}, dedup=dedup)
+        d.on_status(statuses[0])
+        d.filters = {}
+        d.on_status(statuses[0])
+        consumers[0].enqueue.assert_called_once_with(statuses[0])
+        consumers[1].enqueue.assert_called_once_with(statuses[0])
+
     @pytest.mark.parametrize('code,expected', [
         (429, False),   # Twitter rate limit code
         (1, None),
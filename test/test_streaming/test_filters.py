@@ -1,4 +1,5 @@
 import pytest
+import logging
 from twitlib.streaming import WorkerThread
 from twitlib.streaming import MirrorThread, WriterThread, MediaDownloaderThread
 
@@ -31,6 +32,14 @@ class TestValidateStatus():
         expected = all( [f(status) for f in filter_funcs ] )
         assert(actual == expected)
 
+    def test_short_circuit_without_debug(self, caplog, worker_class, status, filter_funcs):
+        caplog.set_level(logging.INFO, logger='twitlib')
+        actual = worker_class.validate_status(status, filter_funcs)
+        expected = all( [f.return_value for f in filter_funcs ] )
+        assert(actual == expected)
+        if not filter_funcs[0].return_value:
+            filter_funcs[1].assert_not_called()
+
 @pytest.mark.usefixtures('patch_remove_urls')
 class TestProcessStatus():
 
@@ -42,7 +51,7 @@ class TestProcessStatus():
     @pytest.mark.usefixtures('validate_true')
     def test_validate_status_call_args(self, subworker, status):
         subworker.process_status(status)
-        subworker.validate_status.assert_called_once_with(status, subworker.filters)
+        subworker.validate_status.assert_called_once_with(status, subworker.filter_chain)
 
     @pytest.mark.usefixtures('validate_false', 'patch_statics')
     def test_abort_when_invalid(self, subworker, status, static_func):
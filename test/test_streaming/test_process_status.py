@@ -1,4 +1,5 @@
 import pytest
+import os
 import twitter
 from twitlib.streaming import WorkerThread, MirrorThread, WriterThread, MediaDownloaderThread
 
@@ -53,7 +54,8 @@ class TestDryRun():
 class TestWrite():
 
     @pytest.fixture
-    def thread(self):
+    def thread(self, mocker):
+        mocker.patch.object(WriterThread, 'write_status')
         return WriterThread()
 
     @pytest.mark.usefixtures('validate_true')
@@ -61,6 +63,14 @@ class TestWrite():
         thread.process_status(status)
         thread.format_filename.assert_called_once_with(status, thread.format, thread.dirname)
 
+    @pytest.mark.usefixtures('validate_true')
+    def test_sharded_dirname(self, thread, status):
+        thread.dirname = 'out'
+        thread.shard = lambda s : 'shard'
+        thread.process_status(status)
+        expected = os.path.join('out', 'shard')
+        thread.format_filename.assert_called_once_with(status, thread.format, expected)
+
 @pytest.mark.usefixtures('patch_format')
 class TestDownload():
 
@@ -72,3 +82,71 @@ class TestDownload():
     def test_calls_format(self, thread, status):
         thread.process_status(status)
         thread.format_filename.assert_called_once_with(status, thread.format, thread.dirname)
+
+    @pytest.mark.usefixtures('validate_true')
+    def test_sharded_dirname(self, thread, status):
+        thread.dirname = 'out'
+        thread.shard = lambda s : 'shard'
+        thread.process_status(status)
+        expected = os.path.join('out', 'shard')
+        thread.format_filename.assert_called_once_with(status, thread.format, expected)
+
+@pytest.mark.usefixtures('validate_true')
+class TestMirrorIncomplete():
+
+    def test_skips_post(self, mocker, api, status):
+        mocker.patch.object(MirrorThread, 'mirror', side_effect=IOError('Downloaded 0 of 1'))
+        thread = MirrorThread(api=api)
+        assert(thread.process_status(status) is None)
+        api.PostUpdate.assert_not_called()
+
+    def test_rate_limited_upload(self, mocker, api, status):
+        limited = twitter.TwitterError([{'code' : 88, 'message' : 'Rate limit exceeded'}])
+        mocker.patch.object(MirrorThread, 'mirror', side_effect=limited)
+        assert(MirrorThread(api=api).process_status(status) is None)
+
+    def test_other_twitter_error(self, mocker, api, status):
+        error = twitter.TwitterError([{'code' : 187, 'message' : 'Duplicate'}])
+        mocker.patch.object(MirrorThread, 'mirror', side_effect=error)
+        with pytest.raises(twitter.TwitterError):
+            MirrorThread(api=api).process_status(status)
+
+@pytest.mark.usefixtures('validate_true')
+class TestWriteSegment():
+
+    @pytest.fixture
+    def thread(self, mocker):
+        result = WriterThread(mode='segment')
+        result._segment_writer = mocker.MagicMock(name='segment_writer')
+        result._segment_writer.write_many.side_effect = lambda s : ['segment'] * len(s)
+        return result
+
+    def test_invalid_mode(self):
+        with pytest.raises(ValueError):
+            WriterThread(mode='bogus')
+
+    def test_process_status(self, thread, status):
+        result = thread.process_status(status)
+        thread.segment_writer.write.assert_called_once_with(status)
+        assert(result == thread.segment_writer.write.return_value)
+
+    def test_process_statuses(self, thread, status):
+        result = thread.process_statuses([status, status])
+        thread.segment_writer.write_many.assert_called_once_with([status, status])
+        assert(result == ['segment', 'segment'])
+
+    def test_process_statuses_filtered(self, mocker, thread, status):
+        mocker.patch.object(WorkerThread, 'validate_status', side_effect=[False, True])
+        result = thread.process_statuses([status, status])
+        thread.segment_writer.write_many.assert_called_once_with([status])
+        assert(result == [None, 'segment'])
+
+    def test_dry_run(self, thread, status):
+        thread.dry_run = True
+        thread.process_statuses([status])
+        thread.segment_writer.write_many.assert_not_called()
+
+    def test_close(self, thread):
+        writer = thread.segment_writer
+        thread.close()
+        writer.close.assert_called_once()
@@ -3,6 +3,7 @@ import os
 
 from twitlib.streaming import WorkerThread, WriterThread, MirrorThread, MediaDownloaderThread
 from twitlib.streaming import Dispatcher
+from twitlib.filters import FilterChain
 
 class TestWorkerProperties():
 
@@ -19,6 +20,26 @@ class TestWorkerProperties():
         worker.filters = []
         assert(worker.filters == [])
 
+    def test_filter_chain(self, mocker, worker, status):
+        worker.filters = [WorkerThread.default_filter]
+        assert(worker.filter_chain.funcs == (WorkerThread.default_filter,))
+        compile_filters = mocker.patch('twitlib.streaming.compile_filters')
+        WorkerThread.validate_status(status, worker.filter_chain)
+        compile_filters.assert_not_called()
+
+    def test_adaptive_chains_per_worker(self):
+        funcs = [WorkerThread.default_filter]
+        first = WorkerThread(filters=funcs, adaptive_filters=True)
+        second = WorkerThread(filters=funcs, adaptive_filters=True)
+        assert(first.filter_chain is not second.filter_chain)
+
+    def test_adaptive_filters(self, status):
+        worker = WorkerThread(filters=[WorkerThread.default_filter], adaptive_filters=True)
+        assert(worker.adaptive_filters)
+        assert(isinstance(worker.filters, FilterChain))
+        assert(worker.filters.funcs == (WorkerThread.default_filter,))
+        assert(WorkerThread.validate_status(status, worker.filters))
+
     @pytest.mark.parametrize('val', [None, 1, 10])
     def test_loops(self, worker, val):
         worker.loops = val
@@ -30,6 +51,24 @@ class TestWorkerProperties():
         with pytest.raises(ValueError):
             worker.loops = 0
 
+    @pytest.mark.parametrize('val', [1, 10])
+    def test_batch_size(self, worker, val):
+        worker.batch_size = val
+        assert(worker.batch_size == val)
+
+    def test_batch_size_validate(self, worker):
+        with pytest.raises(ValueError):
+            worker.batch_size = 0
+
+    @pytest.mark.parametrize('val', [0, 0.5])
+    def test_batch_linger(self, worker, val):
+        worker.batch_linger = val
+        assert(worker.batch_linger == val)
+
+    def test_batch_linger_validate(self, worker):
+        with pytest.raises(ValueError):
+            worker.batch_linger = -1
+
 class TestWriterProperties(TestWorkerProperties):
 
     @pytest.fixture
@@ -44,6 +83,16 @@ class TestWriterProperties(TestWorkerProperties):
         worker.format = 'format_str'
         assert(worker.format == 'format_str')
 
+    @pytest.mark.parametrize('shard', [None, 'id', 'date', 'user', '{user.id}', len])
+    def test_shard(self, worker, shard):
+        worker.shard = shard
+        assert(worker.shard == shard)
+
+    @pytest.mark.parametrize('shard', [1, '{}'])
+    def test_shard_validate(self, worker, shard):
+        with pytest.raises(ValueError):
+            worker.shard = shard
+
 class TestMediaDownloaderProperties(TestWorkerProperties):
 
     @pytest.fixture
@@ -58,6 +107,16 @@ class TestMediaDownloaderProperties(TestWorkerProperties):
         worker.format = 'format_str'
         assert(worker.format == 'format_str')
 
+    @pytest.mark.parametrize('shard', [None, 'id', 'date', 'user', '{user.id}', len])
+    def test_shard(self, worker, shard):
+        worker.shard = shard
+        assert(worker.shard == shard)
+
+    @pytest.mark.parametrize('shard', [1, '{}'])
+    def test_shard_validate(self, worker, shard):
+        with pytest.raises(ValueError):
+            worker.shard = shard
+
 class TestMirrorProperties(TestWorkerProperties):
 
     @pytest.fixture
@@ -0,0 +1,166 @@
+import pytest
+import requests
+import twitter
+
+from twitlib.status import LazyStatus
+from twitlib.streaming import Backoff, BaseListener, StreamRunner
+
+LINE = b'{"id":1,"text":"tweet","user":{"id":2,"screen_name":"poster"}}'
+
+class FakeResponse():
+
+    def __init__(self, status_code=200, lines=(), error=None):
+        self.status_code = status_code
+        self.lines = lines
+        self.error = error
+        self.closed = False
+
+    def iter_lines(self, chunk_size=512):
+        yield from self.lines
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def listener(mocker):
+    return mocker.MagicMock(spec=BaseListener)
+
+@pytest.fixture
+def session(mocker):
+    return mocker.MagicMock(spec=requests.Session)
+
+@pytest.fixture
+def runner(mocker, listener, session):
+    result = StreamRunner(twitter.Api('a', 'b', 'c', 'd'), listener, session=session)
+    mocker.patch.object(result._stop, 'wait')
+    return result
+
+@pytest.fixture
+def connect(runner, session):
+    """Responses or errors returned by successive connections, then stop"""
+    def set_results(*results):
+        results = list(results)
+        def post(*args, **kwargs):
+            if not results:
+                runner.stop()
+                raise requests.ConnectionError('stopped')
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        session.post.side_effect = post
+    return set_results
+
+def delays(runner):
+    return [args[0] for args, kwargs in runner._stop.wait.call_args_list]
+
+class TestBackoff():
+
+    def test_linear(self):
+        backoff = Backoff(0.25, 1, step=0.25)
+        assert([backoff.next() for _ in range(5)] == [0.25, 0.5, 0.75, 1, 1])
+
+    def test_exponential(self):
+        backoff = Backoff(5, 20, factor=2)
+        assert([backoff.next() for _ in range(4)] == [5, 10, 20, 20])
+
+    def test_reset(self):
+        backoff = Backoff(5, 20, factor=2)
+        backoff.next()
+        backoff.reset()
+        assert(backoff.next() == 5)
+
+class TestStreamRunner():
+
+    def test_statuses(self, runner, listener, connect):
+        connect(FakeResponse(lines=[b'', LINE, b'']))
+        runner.run('url')
+
+        listener.on_connect.assert_called_once()
+        status, = listener.on_status.call_args[0]
+        assert(isinstance(status, LazyStatus))
+        assert(status.id == 1)
+        assert(runner.keep_alives == 2)
+        assert(runner.connections == 1)
+
+    def test_eager(self, runner, listener, connect):
+        runner._lazy = False
+        connect(FakeResponse(lines=[LINE]))
+        runner.run('url')
+        status, = listener.on_status.call_args[0]
+        assert(type(status) == twitter.Status)
+
+    def test_limit(self, runner, listener, connect):
+        connect(FakeResponse(lines=[b'{"limit":{"track":10}}']))
+        runner.run('url')
+        listener.on_limit.assert_called_once_with(10)
+        listener.on_status.assert_not_called()
+
+    def test_malformed_skipped(self, runner, listener, connect):
+        connect(FakeResponse(lines=[b'{"id":', LINE]))
+        runner.run('url')
+        listener.on_status.assert_called_once()
+
+    def test_tcp_backoff(self, runner, connect):
+        error = requests.ConnectionError('refused')
+        connect(error, error, error)
+        runner.run('url')
+        assert(delays(runner) == [0.25, 0.5, 0.75])
+
+    def test_http_backoff(self, runner, listener, connect):
+        connect(FakeResponse(500), FakeResponse(503))
+        runner.run('url')
+        assert(delays(runner) == [5, 10])
+        assert(listener.on_error.call_count == 2)
+
+    def test_rate_limit_backoff(self, runner, connect):
+        connect(FakeResponse(420), FakeResponse(420))
+        runner.run('url')
+        assert(delays(runner) == [60, 120])
+
+    def test_listener_stops(self, runner, listener, session, connect):
+        listener.on_error.return_value = False
+        connect(FakeResponse(401), FakeResponse(401))
+        runner.run('url')
+        assert(session.post.call_count == 1)
+
+    def test_backoff_reset(self, runner, connect):
+        error = requests.ConnectionError('refused')
+        connect(error, error, FakeResponse(lines=[LINE]), error)
+        runner.run('url')
+        assert(delays(runner) == [0.25, 0.5, 0.25, 0.5])
+
+    def test_keep_alive_no_reset(self, runner, connect):
+        error = requests.ConnectionError('refused')
+        connect(error, FakeResponse(lines=[b'']), error)
+        runner.run('url')
+        assert(delays(runner) == [0.25, 0.5, 0.75])
+
+    def test_stall(self, runner, listener, connect):
+        stall = requests.ConnectionError('Read timed out.')
+        response = FakeResponse(lines=[LINE], error=stall)
+        connect(response)
+        runner.run('url')
+        listener.on_timeout.assert_called_once()
+        assert(response.closed)
+
+    def test_stop(self, runner, listener, connect):
+        listener.on_status.side_effect = lambda status: runner.stop()
+        connect(FakeResponse(lines=[LINE, LINE]))
+        runner.run('url')
+        listener.on_status.assert_called_once()
+        assert(not runner.running)
+
+    def test_filter(self, runner, session, connect):
+        connect()
+        runner.filter(follow=[1, 2], track=['a', 'b'])
+        args, kwargs = session.post.call_args
+        assert(args[0] == 'https://stream.twitter.com/1.1/statuses/filter.json')
+        assert(kwargs['data'] == {'follow' : '1,2', 'track' : 'a,b', 'stall_warnings' : 'true'})
+        assert(kwargs['stream'])
+
+    def test_filter_requires_predicate(self, runner):
+        with pytest.raises(ValueError):
+            runner.filter()
@@ -7,7 +7,10 @@ import os
 
 from twitlib.streaming import WorkerThread
 from twitlib.streaming import MirrorThread, WriterThread, MediaDownloaderThread
+from twitlib.scheduler import PostScheduler
 import twitlib
+import twitlib.codec
+import twitlib.download
 
 class TestWrite():
 
@@ -30,32 +33,51 @@ class TestWrite():
         ret = WriterThread.write_status(status=status, filename=output_file)
         json.dump.assert_called_once_with(status.AsDict(), twitlib.streaming.open(), indent=2, sort_keys=True)
 
+class TestWriteRaw():
+
+    @pytest.fixture
+    def output_file(self):
+        return 'out_file.json'
+
+    def test_writes_raw_bytes(self, output_file, mock_open):
+        status = twitlib.codec.decode_status(b'{"id":1}')
+        ret = WriterThread.write_raw(status=status, filename=output_file)
+        assert(ret == output_file)
+        mock_open.assert_called_once_with(output_file, 'wb')
+        mock_open().write.assert_called_once_with(b'{"id":1}')
+
+    def test_encodes_raw_dict(self, mocker, status, output_file, mock_open):
+        mocker.patch.object(twitlib.util, 'status_to_dict', return_value={'id' : 1, 'text' : 'é'})
+        WriterThread.write_raw(status=status, filename=output_file)
+        mock_open().write.assert_called_once_with('{"id":1,"text":"é"}'.encode('utf-8'))
+
+    def test_process_status_raw(self, mocker, status, mock_open):
+        m = mocker.patch.object(WriterThread, 'write_raw', return_value='status.json')
+        thread = WriterThread(raw_json=True, filters=[], format='status.json')
+        assert(thread.process_status(status) == 'status.json')
+        m.assert_called_once_with(status, 'status.json')
+
 @pytest.mark.usefixtures('add_media')
 class TestDownload():
 
     @pytest.fixture
-    def expected_files(self, mocker, media_outputs):
-        expected = [
-                mocker.call(f, 'wb')
-                for f in media_outputs
-        ]
-        return expected
-
-    def test_opened_correct_files(self, status, mock_open, dirname, expected_files):
-        """Tests process_status() opens correct files for writing"""
-        MediaDownloaderThread.download_media(status, dirname)
-        actual = mock_open.call_args_list
-        assert(status.media)
-        assert(expected_files == actual)
+    def fetch_all(self, mocker, media_outputs):
+        return mocker.patch.object(twitlib.download, 'fetch_all', return_value=media_outputs)
 
-    def test_wrote_correct_content(self, mocker, status, dirname, mock_open, media_urls):
-        """Tests process_status() writes correct content"""
-        content = [ requests.get(url) for url in media_urls ]
-        expected = [ mocker.call(c.content) for c in content ]
+    def test_fetches_media_files(self, status, dirname, media_urls, media_outputs, fetch_all):
+        """Tests download_media() fetches each media URL to the correct file"""
+        MediaDownloaderThread.download_media(status, dirname)
+        fetch_all.assert_called_once_with(media_urls, media_outputs)
 
+    def test_uses_shared_session(self, status, dirname, media_urls, mock_open):
         MediaDownloaderThread.download_media(status, dirname)
-        actual = mock_open().write.call_args_list
-        assert(expected == actual)
+        actual = sorted(c[0][0] for c in twitlib.download.session().get.call_args_list)
+        assert(actual == sorted(media_urls))
+
+    def test_no_media(self, status, dirname, inject_media, fetch_all):
+        inject_media(None)
+        assert(MediaDownloaderThread.download_media(status, dirname) == [])
+        fetch_all.assert_not_called()
 
     def test_returns_file_list(self, mocker, status, dirname, mock_open, media_urls, media_outputs):
         """Tests process_status() returns list of written files"""
@@ -64,10 +86,14 @@ class TestDownload():
         assert(expected == actual)
 
     def test_mkdir_on_missing(self, mocker, status, dirname, mock_open):
-        os.path.exists.return_value = False
         MediaDownloaderThread.download_media(status, dirname)
-        os.path.exists.assert_called_once()
-        os.makedirs.assert_called_once_with(dirname)
+        os.makedirs.assert_called_once_with(dirname, exist_ok=True)
+
+    def test_mkdir_once(self, mocker, status, dirname, mock_open):
+        MediaDownloaderThread.download_media(status, dirname)
+        MediaDownloaderThread.download_media(status, dirname)
+        os.makedirs.assert_called_once_with(dirname, exist_ok=True)
+        os.path.exists.assert_not_called()
 
 @pytest.mark.usefixtures('patch_remove_urls', 'remove_media')
 class TestMirrorNoMedia():
@@ -99,6 +125,11 @@ class TestMirrorNoMedia():
 class TestMirror(TestMirrorNoMedia):
     """Non-truncated mirroring"""
 
+    @pytest.fixture
+    def mock_downloader(self, mock_downloader, media_outputs):
+        mock_downloader.download_media.return_value = media_outputs
+        return mock_downloader
+
     def test_posts_media_files(self, mocker, status, api, dirname, media_outputs, mock_open):
         MirrorThread.mirror(api, status, dirname)
         args, kwargs = api.PostUpdate.call_args
@@ -124,6 +155,22 @@ class TestMirror(TestMirrorNoMedia):
         MirrorThread.mirror(api, status, dirname)
         mock_downloader.download_media.assert_called_once_with(status, dirname)
 
+    def test_scheduled_post(self, mocker, status, api, dirname, media_outputs, mock_open):
+        scheduler = mocker.MagicMock(spec=PostScheduler)
+        result = MirrorThread.mirror(api, status, dirname, scheduler)
+        api.PostUpdate.assert_not_called()
+        assert(api.UploadMediaChunked.call_count == len(media_outputs))
+
+        args, kwargs = scheduler.submit.call_args
+        assert(args[1] == [api.UploadMediaChunked.return_value] * len(media_outputs))
+        assert(result == scheduler.submit.return_value)
+
+    def test_no_partial_post(self, mocker, status, api, dirname, media_outputs):
+        mocker.patch.object(twitlib.download, 'fetch_all', return_value=media_outputs[1:])
+        with pytest.raises(IOError):
+            MirrorThread.mirror(api, status, dirname)
+        api.PostUpdate.assert_not_called()
+
 
 @pytest.mark.usefixtures('patch_io', 'truncate', 'remove_media')
 class TestMirrorTruncatedNoMedia(TestMirrorNoMedia):
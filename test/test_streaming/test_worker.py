@@ -3,8 +3,12 @@ import os
 
 from queue import Queue
 from twitlib.streaming import WorkerThread
+from twitlib.queues import StatusQueue
 
-THREAD_WAIT = 0.1
+# Timeouts of tests that would otherwise block forever, with slack for a
+# loaded interpreter, e.g. while media threads of other tests wind down
+THREAD_WAIT = 1
+BATCH_WAIT = 1
 
 class TestWorker():
     """Parameterized to test all worker classes"""
@@ -27,26 +31,16 @@ class TestWorker():
         WorkerThread.dequeue.assert_called_once()
         worker.process_status.assert_not_called()
 
-    @pytest.fixture
-    def output_file(self):
-        return 'out_file.json'
+    def test_format_reads_named_fields(self, status, dirname, mocker):
+        mocker.patch.object(type(status), 'id', mocker.PropertyMock(return_value=5))
+        actual = WorkerThread.format_filename(status, 'status_{id}.json', dirname)
+        assert(actual == os.path.join(dirname, 'status_5.json'))
+        status.AsDict.assert_not_called()
 
-    @pytest.fixture
-    def mock_format(self, mocker, output_file):
-        mock_fmt = mocker.MagicMock(spec_set=str, name='thread.format')
-        mock_fmt.format.return_value = output_file
-        return mock_fmt
-
-    def test_calls_format_mock(self, status, output_file, dirname, mock_format):
-        WorkerThread.format_filename(status, mock_format, dirname)
-        kwargs = status.AsDict()
-        mock_format.format.assert_called_once_with(**kwargs)
-
-    def test_calls_format_stub(self, status, output_file, dirname, mock_format, mocker):
-        kwargs = {'id' : 0, 'val': 1}
-        mocker.patch.object(status, 'AsDict', return_value=kwargs)
-        WorkerThread.format_filename(status, mock_format, dirname)
-        mock_format.format.assert_called_once_with(**kwargs)
+    def test_format_dotted_field(self, status, mocker):
+        mocker.patch.object(type(status.user), 'screen_name', mocker.PropertyMock(return_value='user'))
+        actual = WorkerThread.format_filename(status, '{user.screen_name}.json')
+        assert(actual == 'user.json')
 
     def test_default_filter_returns_true(self, status):
         filter_ret = WorkerThread.default_filter(status)
@@ -114,3 +108,76 @@ class TestExceptions():
         mocker.patch.object(worker, 'process_status', side_effect=Exception)
         with pytest.raises(Exception):
             worker.run()
+
+@pytest.mark.timeout(BATCH_WAIT, method='signal')
+class TestBatch():
+    """Parameterized to test all worker classes"""
+
+    @pytest.fixture
+    def job_queue(self, mocker, worker_class):
+        q = StatusQueue()
+        mocker.patch.object(worker_class, 'QUEUE', q)
+        return q
+
+    @pytest.fixture
+    def statuses(self, mocker):
+        return [mocker.MagicMock(name='status%i' % i) for i in range(5)]
+
+    @pytest.fixture
+    def batch_worker(self, mocker, worker, job_queue):
+        worker.loops = None
+        worker.batch_size = 2
+        mocker.patch.object(worker, 'process_status')
+        return worker
+
+    def test_dequeue_batch_size(self, worker_class, job_queue, statuses):
+        for s in statuses:
+            job_queue.put(s)
+        batch = worker_class.dequeue_batch(3)
+        assert(batch == statuses[:3])
+
+    def test_dequeue_batch_stops_at_sentinel(self, worker_class, job_queue, statuses):
+        job_queue.put(statuses[0])
+        job_queue.put(None)
+        job_queue.put(statuses[1])
+        batch = worker_class.dequeue_batch(3)
+        assert(batch == [statuses[0], None])
+
+    def test_dequeue_batch_linger(self, worker_class, job_queue, statuses):
+        job_queue.put(statuses[0])
+        batch = worker_class.dequeue_batch(3, linger=0.01)
+        assert(batch == statuses[:1])
+
+    def test_process_statuses_default(self, batch_worker, statuses):
+        batch_worker.process_statuses(statuses)
+        calls = [c[0][0] for c in batch_worker.process_status.call_args_list]
+        assert(calls == statuses)
+
+    def test_run_batches(self, mocker, batch_worker, job_queue, statuses):
+        m = mocker.patch.object(batch_worker, 'process_statuses')
+        for s in statuses:
+            job_queue.put(s)
+        job_queue.put(None)
+        batch_worker.run()
+
+        actual = [c[0][0] for c in m.call_args_list]
+        assert(actual == [statuses[0:2], statuses[2:4], statuses[4:]])
+        assert(job_queue.unfinished_tasks == 0)
+
+    def test_run_batches_loops(self, mocker, batch_worker, job_queue, statuses):
+        m = mocker.patch.object(batch_worker, 'process_statuses')
+        batch_worker.loops = 3
+        for s in statuses:
+            job_queue.put(s)
+        batch_worker.run()
+
+        actual = [c[0][0] for c in m.call_args_list]
+        assert(actual == [statuses[0:2], statuses[2:3]])
+
+    def test_run_batches_exception(self, mocker, batch_worker, job_queue, statuses):
+        mocker.patch.object(batch_worker, 'process_statuses', side_effect=KeyboardInterrupt)
+        for s in statuses[:2]:
+            job_queue.put(s)
+        with pytest.raises(KeyboardInterrupt):
+            batch_worker.run()
+        assert(job_queue.unfinished_tasks == 0)
@@ -0,0 +1,126 @@
+import pytest
+import json
+from twitter import Status
+
+import twitlib.tracing as tracing
+from twitlib.tracing import Tracer
+from twitlib.streaming import WorkerThread
+
+@pytest.fixture
+def mock_queue():
+    """Opt out of the autouse queue.Queue patch, workers need a real queue"""
+    return None
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('trace.jsonl'))
+
+@pytest.fixture
+def tracer(path):
+    tracer = tracing.configure(path, sample_rate=1, flush_every=1)
+    yield tracer
+    tracing.configure(None)
+
+def read(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+class TracedThread(WorkerThread):
+
+    QUEUE = None
+
+    def __init__(self, **kwargs):
+        super().__init__(filters=[lambda s: s.id % 2 == 0], **kwargs)
+
+    def process_status(self, status):
+        if WorkerThread.validate_status(status, self.filter_chain):
+            tracing.mark(status, 'TracedThread', tracing.FILTERED)
+
+class TestTracer():
+
+    def test_durations(self, path):
+        tracer = Tracer(path, sample_rate=1, flush_every=1)
+        for event, now in [
+                (tracing.ENQUEUE, 10.0),
+                (tracing.DEQUEUE, 12.0),
+                (tracing.FILTERED, 12.001),
+                (tracing.IO_START, 12.002),
+                (tracing.IO_END, 12.5),
+                (tracing.DONE, 12.502)]:
+            tracer.mark(1, 'WriterThread', event, now)
+
+        record, = read(path)
+        assert(record['id'] == 1)
+        assert(record['worker'] == 'WriterThread')
+        assert(record['events']['enqueue'] == 10.0)
+        assert(record['ms'] == pytest.approx({
+                'queued' : 2000, 'filter' : 1, 'io' : 498, 'process' : 502, 'total' : 2502}))
+
+    def test_partial(self, path):
+        tracer = Tracer(path, sample_rate=1, flush_every=1)
+        tracer.mark(1, 'WriterThread', tracing.DEQUEUE, 1.0)
+        tracer.mark(1, 'WriterThread', tracing.DONE, 1.5)
+        record, = read(path)
+        assert(record['ms'] == {'process' : 500})
+
+    def test_workers_traced_apart(self, path):
+        tracer = Tracer(path, sample_rate=1, flush_every=1)
+        tracer.mark(1, 'WriterThread', tracing.ENQUEUE, 1.0)
+        tracer.mark(1, 'MirrorThread', tracing.ENQUEUE, 2.0)
+        tracer.mark(1, 'MirrorThread', tracing.DONE, 3.0)
+        tracer.mark(1, 'WriterThread', tracing.DONE, 5.0)
+        assert([(r['worker'], r['ms']['total']) for r in read(path)] == [
+                ('MirrorThread', 1000), ('WriterThread', 4000)])
+
+    def test_max_open(self, path):
+        tracer = Tracer(path, sample_rate=1, max_open=2, flush_every=1)
+        for i in range(3):
+            tracer.mark(i, 'WriterThread', tracing.ENQUEUE, 1.0)
+        for i in range(3):
+            tracer.mark(i, 'WriterThread', tracing.DONE, 2.0)
+        assert([r['id'] for r in read(path)] == [1, 2])
+
+    def test_sampled(self, path):
+        tracer = Tracer(path, sample_rate=0.1)
+        sampled = sum(tracer.sampled(i) for i in range(10000))
+        assert(800 < sampled < 1200)
+        assert(tracer.sampled(12345) == Tracer(path, sample_rate=0.1).sampled(12345))
+
+    @pytest.mark.parametrize('kwargs', [
+        {'sample_rate' : 0}, {'sample_rate' : 1.5}, {'max_open' : 0}, {'flush_every' : 0}])
+    def test_invalid(self, path, kwargs):
+        with pytest.raises(ValueError):
+            Tracer(path, **kwargs)
+
+class TestModule():
+
+    def test_disabled(self, path):
+        tracing.configure(None)
+        tracing.mark(Status.NewFromJsonDict({'id' : 1}), 'WriterThread', tracing.DONE)
+        assert(tracing.get() is None)
+
+    def test_none_status(self, tracer, path):
+        tracing.mark(None, 'WriterThread', tracing.DONE)
+        assert(read(path) == [])
+
+    def test_worker(self, tracer, path):
+        TracedThread.configure_queue()
+        for i in range(4):
+            TracedThread.enqueue(Status.NewFromJsonDict({'id' : i}))
+        TracedThread.enqueue(None)
+        TracedThread().run()
+
+        records = sorted(read(path), key=lambda r: r['id'])
+        assert([r['id'] for r in records] == [0, 1, 2, 3])
+        assert(all(r['worker'] == 'TracedThread' for r in records))
+        assert('filter' in records[0]['ms'])
+        assert('filter' not in records[1]['ms'])
+        assert(all('queued' in r['ms'] and 'total' in r['ms'] for r in records))
+
+    def test_summarize(self, tracer, path):
+        for i in range(100):
+            tracer.mark(i, 'WriterThread', tracing.ENQUEUE, 0.0)
+            tracer.mark(i, 'WriterThread', tracing.DONE, (i + 1) / 1000)
+
+        summary = tracing.summarize(path)['WriterThread']['total']
+        assert(summary == {'count' : 100, 'p50' : 50, 'p99' : 99, 'max' : 100})
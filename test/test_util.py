@@ -1,4 +1,6 @@
 import pytest
+import os
+from twitter import Status
 from twitlib.util import *
 
 
@@ -46,3 +48,135 @@ class TestRemoveUrls():
         expected = text
         actual = remove_urls(text)
         assert(expected == actual)
+
+class TestStatusDict():
+
+    @pytest.fixture
+    def raw(self):
+        return {
+            'id' : 1,
+            'text' : 'tweet text',
+            'user' : {'id' : 2, 'screen_name' : 'user'},
+            'entities' : {
+                'hashtags' : [{'text' : 'tag'}],
+                'media' : [{'media_url_https' : 'https://host.com/file.jpg'}],
+            },
+        }
+
+    def test_prefers_raw_json(self, raw):
+        status = Status.NewFromJsonDict(raw)
+        assert(status_to_dict(status) is raw)
+
+    def test_falls_back_to_as_dict(self, status):
+        actual = status_to_dict(status)
+        assert(actual == status.AsDict())
+
+    def test_round_trip_raw(self, raw):
+        status = Status.NewFromJsonDict(raw)
+        actual = status_from_dict(status_to_dict(status))
+        assert(actual == status)
+
+    def test_round_trip_as_dict(self, raw):
+        status = Status.NewFromJsonDict(raw)
+        actual = status_from_dict(status.AsDict())
+        assert(actual.hashtags[0].text == 'tag')
+        assert(actual.media[0].media_url_https == 'https://host.com/file.jpg')
+        assert(actual.user.screen_name == 'user')
+
+class TestFilenameTemplate():
+
+    @pytest.fixture
+    def raw(self):
+        return {'id' : 1, 'text' : 'tweet text', 'user' : {'id' : 2, 'screen_name' : 'user'}}
+
+    @pytest.mark.parametrize('fmt,expected', [
+        ('status_{id}.json', 'status_1.json'),
+        ('{user.screen_name}/{id:08d}', 'user/00000001'),
+        ('{{literal}}_{id!r}', '{literal}_1'),
+    ])
+    def test_render(self, raw, fmt, expected):
+        status = Status.NewFromJsonDict(raw)
+        assert(FilenameTemplate(fmt).render(status) == expected)
+
+    def test_render_dict(self, raw):
+        assert(FilenameTemplate('{user.screen_name}').render(raw) == 'user')
+
+    def test_is_str(self):
+        template = FilenameTemplate('status_{id}.json')
+        assert(template == 'status_{id}.json')
+        assert(template.fields == ('id',))
+
+    def test_missing_field(self, raw):
+        status = Status.NewFromJsonDict(raw)
+        with pytest.raises(KeyError):
+            FilenameTemplate('{bogus}').render(status)
+
+    @pytest.mark.parametrize('fmt', ['{}', '{0}', '{id:{width}}'])
+    def test_invalid(self, fmt):
+        with pytest.raises(ValueError):
+            FilenameTemplate(fmt)
+
+    def test_compile_cached(self):
+        assert(compile_template('status_{id}') is compile_template('status_{id}'))
+        template = FilenameTemplate('status_{id}')
+        assert(compile_template(template) is template)
+
+    def test_cached_per_status(self, raw, mocker):
+        status = Status.NewFromJsonDict(raw)
+        template = FilenameTemplate('status_{id}')
+        assert(template.render(status) == 'status_1')
+        status.id = 2
+        assert(template.render(status) == 'status_1')
+        assert(FilenameTemplate('status_{id}').render(Status.NewFromJsonDict(raw)) == 'status_1')
+
+class TestMakedirs():
+
+    def test_once_per_dir(self):
+        makedirs('out/a')
+        makedirs('out/a')
+        makedirs('out/b')
+        assert(os.makedirs.call_count == 2)
+        os.makedirs.assert_called_with('out/b', exist_ok=True)
+
+    def test_empty(self):
+        assert(makedirs('') == '')
+        os.makedirs.assert_not_called()
+
+    def test_forget(self):
+        makedirs('out')
+        forget_dirs()
+        makedirs('out')
+        assert(os.makedirs.call_count == 2)
+
+class TestShard():
+
+    @pytest.fixture
+    def status(self):
+        return Status.NewFromJsonDict({
+            'id' : 1212092628029698048,
+            'created_at' : 'Wed Jan 01 12:00:00 +0000 2020',
+            'user' : {'id' : 2, 'screen_name' : 'user'},
+        })
+
+    @pytest.mark.parametrize('shard,expected', [
+        (None, 'out'),
+        ('id', os.path.join('out', '48', '80')),
+        ('date', os.path.join('out', '2020', '01', '01')),
+        ('user', os.path.join('out', '2')),
+        ('{user.screen_name}', os.path.join('out', 'user')),
+        (lambda s : 'x', os.path.join('out', 'x')),
+    ])
+    def test_shard_dirname(self, status, shard, expected):
+        assert(shard_dirname(status, 'out', shard) == expected)
+
+    def test_date_from_id(self, status):
+        status.created_at = None
+        assert(shard_by_date(status) == os.path.join('2019', '12', '31'))
+
+    def test_no_dirname(self, status):
+        assert(shard_dirname(status, '', 'user') == '2')
+
+    @pytest.mark.parametrize('shard', [1, '{0}'])
+    def test_check_invalid(self, shard):
+        with pytest.raises(ValueError):
+            check_shard(shard)
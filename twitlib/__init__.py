@@ -1 +1 @@
-__all__ = ['streaming', 'util', 'auth', 'filters']
+__all__ = ['streaming', 'util', 'auth', 'filters', 'queues', 'segments', 'download', 'multiprocess', 'aio', 'status', 'codec', 'spool', 'dedup', 'metrics', 'pool', 'pipeline', 'scheduler', 'replay', 'tracing']
@@ -0,0 +1,514 @@
+"""
+asyncio variants of the Dispatcher and worker classes. Workers are
+coroutines consuming from a per class asyncio.Queue, so thousands of them
+can run concurrently in a single thread. Media is downloaded with aiohttp
+when it is installed, otherwise twitlib.download is run in the event
+loop's default executor.
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+
+from typing import ClassVar, List, Union
+
+from twitter import Api
+from twitter.models import Status
+
+import twitlib.util as util
+import twitlib.download as download
+import twitlib.metrics as metrics
+from twitlib.filters import FilterChain, FilterFunc, compile_filters
+from twitlib.streaming import \
+    BaseListener, \
+    Dispatcher, \
+    WorkerThread, \
+    WriterThread, \
+    MirrorThread, \
+    MediaDownloaderThread
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+log = logging.getLogger('twitlib')
+
+# Defaults, see configure()
+MAX_CONNECTIONS = 100
+
+_settings = {
+    'max_connections': MAX_CONNECTIONS,
+}
+_sessions = {}  # event loop -> aiohttp.ClientSession
+
+# Errors that cause a media item to be skipped rather than raised
+if aiohttp is not None:
+    FETCH_ERRORS = (IOError, asyncio.TimeoutError, aiohttp.ClientError)
+else:
+    FETCH_ERRORS = (IOError, asyncio.TimeoutError)
+
+# Shared with twitlib.download and twitlib.streaming, see twitlib.metrics
+_FETCHED = metrics.counter('twitlib_media_fetched_total')
+_FETCHED_BYTES = metrics.counter('twitlib_media_bytes_total')
+_FETCH_SECONDS = metrics.histogram('twitlib_media_fetch_seconds')
+_FAILURES = metrics.counter('twitlib_media_failures_total')
+_MIRROR_POSTS = metrics.counter('twitlib_mirror_posts_total')
+_MIRROR_FAILURES = metrics.counter('twitlib_mirror_failures_total')
+_MIRROR_SECONDS = metrics.histogram('twitlib_mirror_post_seconds')
+
+def configure(max_connections: int = MAX_CONNECTIONS) -> None:
+    """
+    Set options for asynchronous media downloads. Timeouts, chunk size
+    and max_bytes are shared with twitlib.download.configure().
+
+    Args
+    ===
+        max_connections : int
+    Maximum simultaneous connections of the aiohttp session. Sessions
+    opened after this call use the new value.
+
+    Return: None
+    """
+    _settings.update(max_connections=max_connections)
+
+def session() -> 'aiohttp.ClientSession':
+    """
+    Gets the aiohttp session of the running event loop, creating it on
+    first use. Requires aiohttp.
+    """
+    if aiohttp is None:
+        raise RuntimeError('aiohttp is required for asynchronous sessions')
+
+    loop = asyncio.get_event_loop()
+    result = _sessions.get(loop)
+    if result is None or result.closed:
+        connector = aiohttp.TCPConnector(limit=_settings['max_connections'])
+        result = _sessions[loop] = aiohttp.ClientSession(connector=connector)
+    return result
+
+async def close_session() -> None:
+    """Close the aiohttp session of the running event loop, if any"""
+    result = _sessions.pop(asyncio.get_event_loop(), None)
+    if result is not None:
+        await result.close()
+
+async def fetch(url: str, filepath: str) -> str:
+    """
+    Download a URL to a file. Equivalent to twitlib.download.fetch(), but
+    without blocking the event loop on network I/O.
+
+    Raises
+    ===
+        IOError :
+    The media exceeds the configured max_bytes
+
+    Return: The path of the written file
+    """
+    if aiohttp is None:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, download.fetch, url, filepath)
+
+    settings = download._settings
+    max_bytes = settings['max_bytes']
+    timeout = settings['timeout']
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+    start = time.perf_counter()
+    async with session().get(url, timeout=timeout) as r:
+        r.raise_for_status()
+        log.debug('Request got URL %s', url)
+
+        length = r.content_length
+        if max_bytes is not None and length and length > max_bytes:
+            raise IOError('%s is %s bytes, exceeding max_bytes' % (url, length))
+
+        temp_path = '%s.%i.part' % (filepath, id(asyncio.current_task()))
+        try:
+            size = 0
+            with open(temp_path, 'wb') as f:
+                async for chunk in r.content.iter_chunked(settings['chunk_size']):
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise IOError('%s exceeded max_bytes' % url)
+                    f.write(chunk)
+            os.replace(temp_path, filepath)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    _FETCH_SECONDS.observe(time.perf_counter() - start)
+    _FETCHED.inc()
+    _FETCHED_BYTES.inc(size)
+    log.debug('Wrote %s', filepath)
+    return filepath
+
+async def fetch_all(urls: List[str], filepaths: List[str]) -> List[str]:
+    """
+    Download several URLs concurrently, each to the matching file path.
+    URLs that fail to download are logged and left out of the result.
+    When a MediaCache is configured, files are linked from the cache.
+    Return: The paths of the written files, in the order given
+    """
+    results = await asyncio.gather(*[
+        _try_fetch(url, path) for url, path in zip(urls, filepaths)
+    ])
+    return [path for path in results if path is not None]
+
+async def _try_fetch(url: str, filepath: str) -> Union[str, None]:
+    try:
+        cache = download.cache()
+        if cache is not None:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, cache.fetch, url, filepath)
+        return await fetch(url, filepath)
+    except FETCH_ERRORS as e:
+        _FAILURES.inc()
+        log.warning('Failed to download %s: %s', url, e)
+        return None
+
+class AsyncWorker():
+    """
+    Abstract asyncio worker to process jobs from an AsyncDispatcher.
+    Counterpart of WorkerThread, with a coroutine run() loop consuming
+    from a per class asyncio.Queue. Derived classes must override the
+    process_status() coroutine and may override default_filter().
+    """
+
+    QUEUE: ClassVar[asyncio.Queue] = None
+    MAXSIZE: ClassVar[int] = 0
+
+    def __init__(self, loops=None, dry_run=False, name=None, **kwargs):
+        """
+        Keyword Args
+        ===
+        loops : int > 0 or None
+            Maximum iterations of the run() loop. Defaults to no limit.
+
+        dry_run : bool
+            Only log actions that would be taken
+
+        name : str
+            Name used in log messages. Defaults to the class name.
+
+        filters : list(function) or FilterChain
+            Filter functions a status must pass to be processed.
+            Defaults to [default_filter].
+        """
+        self.loops = loops
+        self.dry_run = dry_run
+        self.name = name if name is not None else self.__class__.__name__
+        self.filters = kwargs.pop('filters', [self.default_filter])
+        if kwargs:
+            raise TypeError('Unexpected keyword args: %s' % sorted(kwargs))
+        self._task = None
+
+        worker = self.__class__.__name__
+        self._processed = metrics.counter('twitlib_processed_total', worker=worker)
+        self._errors = metrics.counter('twitlib_errors_total', worker=worker)
+        self._latency = metrics.histogram('twitlib_process_seconds', worker=worker)
+
+    @property
+    def filters(self) -> List[FilterFunc]: return self._filters
+
+    @filters.setter
+    def filters(self, funcs: List[FilterFunc]) -> None:
+        self._filters = funcs
+        self._filter_chain = compile_filters(funcs)
+
+    @property
+    def filter_chain(self) -> FilterChain:
+        """The filters compiled when set, passed to validate_status()"""
+        return self._filter_chain
+
+    @property
+    def loops(self) -> int: return self._loops
+
+    @loops.setter
+    def loops(self, val: Union[int, None]) -> None:
+        if val == None or val > 0:
+            self._loops = val
+        else:
+            raise ValueError('loops must be an int > 0')
+
+    @property
+    def dry_run(self) -> bool: return self._dry_run
+
+    @dry_run.setter
+    def dry_run(self, val: bool) -> None: self._dry_run = val
+
+    @property
+    def task(self) -> Union[asyncio.Task, None]:
+        """The task running run(), or None if not started"""
+        return self._task
+
+    def start(self) -> asyncio.Task:
+        """Schedule run() on the current event loop"""
+        self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    async def run(self) -> None:
+        """
+        Coroutine that consumes from the class job queue and awaits
+        process_status() on dequeued statuses. Ends when None is dequeued
+        or after `loops` statuses. close() is awaited when looping ends.
+        """
+        cls = self.__class__
+        queue = cls.queue()
+        loop_count = 0
+        log.debug('%s started', self.name)
+
+        try:
+            while self.loops == None or loop_count < self.loops:
+                status = await queue.get()
+                if status is None:
+                    log.debug('Stopping %s', self.name)
+                    queue.task_done()
+                    break
+
+                start = time.perf_counter()
+                try:
+                    await self.process_status(status)
+                    log.debug('%s finished job', self.name)
+
+                except Exception:
+                    self._errors.inc()
+                    log.exception('Exception on status: %s', status.__repr__())
+                    raise
+
+                finally:
+                    queue.task_done()
+                    self._latency.observe(time.perf_counter() - start)
+                    self._processed.inc()
+                    loop_count += 1
+        finally:
+            await self.close()
+
+    @classmethod
+    def queue(cls) -> asyncio.Queue:
+        """Gets the class job queue, creating it on first use"""
+        if cls.__dict__.get('QUEUE') is None:
+            cls.QUEUE = asyncio.Queue(cls.MAXSIZE)
+        return cls.QUEUE
+
+    @classmethod
+    def configure_queue(cls, maxsize: int = 0) -> None:
+        """
+        Discard the class job queue. A queue holding at most `maxsize`
+        statuses is created on next use, in the event loop running then.
+        """
+        if maxsize < 0:
+            raise ValueError('maxsize must be an int >= 0')
+        cls.MAXSIZE = maxsize
+        cls.QUEUE = None
+
+    @classmethod
+    async def enqueue(cls, status: Union[Status, None]) -> None:
+        """Enqueue a job, waiting for room if the queue is full"""
+        await cls.queue().put(status)
+
+    @classmethod
+    async def dequeue(cls) -> Union[Status, None]:
+        """Dequeue a job, waiting for one if the queue is empty"""
+        return await cls.queue().get()
+
+    async def process_status(self, status: Status):
+        """Called for each job pulled from the class job queue"""
+        raise NotImplementedError('Please override AsyncWorker.process_status()')
+
+    async def close(self) -> None:
+        """Called when the run() loop ends"""
+        pass
+
+    @staticmethod
+    def default_filter(status: Status) -> bool:
+        return True
+
+class AsyncWriter(AsyncWorker):
+    """
+    Worker writing statuses to files, counterpart of WriterThread. Files
+    are written in the event loop's default executor.
+    """
+
+    QUEUE: ClassVar[asyncio.Queue] = None
+
+    def __init__(self, dirname='', format='status_{id}.json', shard=None, **kwargs):
+        self.dirname = dirname
+        self.format = format
+        util.check_shard(shard)
+        self.shard = shard
+        super().__init__(**kwargs)
+
+    async def process_status(self, status: Status) -> Union[str, None]:
+        """Return: Name of the written file, or None if not written"""
+        if not WorkerThread.validate_status(status, self.filter_chain):
+            log.info('Tweet %i failed filter %s filter criteria', status.id, self.name)
+            return None
+
+        dirname = util.shard_dirname(status, self.dirname, self.shard)
+        name = WorkerThread.format_filename(status, self.format, dirname)
+        if self.dry_run:
+            log.info('[DRY RUN] Wrote status %i to %s', status.id, name)
+            return None
+
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(None, WriterThread.write_status, status, name)
+        log.info('Wrote status %i to %s', status.id, name)
+        return result
+
+    @staticmethod
+    def default_filter(status: Status) -> bool:
+        return WriterThread.default_filter(status)
+
+class AsyncMediaDownloader(AsyncWorker):
+    """
+    Worker downloading status media, counterpart of MediaDownloaderThread.
+    The media items of a status are downloaded concurrently.
+    """
+
+    QUEUE: ClassVar[asyncio.Queue] = None
+
+    def __init__(self, dirname='', format='media_{id}', shard=None, **kwargs):
+        self.dirname = dirname
+        self.format = format
+        util.check_shard(shard)
+        self.shard = shard
+        super().__init__(**kwargs)
+
+    async def process_status(self, status: Status) -> Union[List[str], None]:
+        """Return: List of downloaded files"""
+        if not WorkerThread.validate_status(status, self.filter_chain):
+            log.info('Tweet %i failed filter %s filter criteria', status.id, self.name)
+            return []
+
+        dirname = util.shard_dirname(status, self.dirname, self.shard)
+        status_dir = WorkerThread.format_filename(status, self.format, dirname)
+        if self.dry_run:
+            log.info('[DRY RUN] downloading media urls:%s', util.list_media(status))
+            return None
+
+        out_files = await AsyncMediaDownloader.download_media(status, status_dir)
+        log.info('Downloaded media to files: %s', out_files)
+        return out_files
+
+    @staticmethod
+    async def download_media(status: Status, dirname: str) -> List[str]:
+        """
+        Download media from a Status into a given directory.
+        Return: List of filepaths that were downloaded
+        """
+        media_list = status.media
+        if not media_list:
+            log.debug('Status %i had no media, skipping download', status.id)
+            return []
+
+        util.makedirs(dirname)
+        urls = [media.media_url_https for media in media_list]
+        filepaths = [MediaDownloaderThread.url_to_file(url, dirname) for url in urls]
+        return await fetch_all(urls, filepaths)
+
+    @staticmethod
+    def default_filter(status: Status) -> bool:
+        return MediaDownloaderThread.default_filter(status)
+
+class AsyncMirror(AsyncWorker):
+    """
+    Worker mirroring statuses, counterpart of MirrorThread. Media is
+    downloaded asynchronously, the post is made in the event loop's
+    default executor.
+    """
+
+    QUEUE: ClassVar[asyncio.Queue] = None
+
+    def __init__(self, api: Api = None, temp_dir='', **kwargs):
+        self.api = api if api is not None else Api()
+        self.temp_dir = temp_dir
+        super().__init__(**kwargs)
+
+    async def process_status(self, status: Status) -> Union[Status, None]:
+        """Return: The newly posted Status, or None if not posted"""
+        if not WorkerThread.validate_status(status, self.filter_chain):
+            log.info('Tweet %i failed filter %s filter criteria', status.id, self.name)
+            return None
+
+        if self.dry_run:
+            log.info('[DRY RUN] Mirroring tweet %i', status.id)
+            return None
+
+        log.info('Mirroring tweet %i', status.id)
+        try:
+            return await AsyncMirror.mirror(self.api, status, self.temp_dir)
+        except IOError as e:
+            _MIRROR_FAILURES.inc()
+            log.warning('Not mirroring tweet %i: %s', status.id, e)
+            return None
+
+    @staticmethod
+    async def mirror(api: Api, status: Status, temp_dir: str = '') -> Status:
+        """
+        Mirror a status. Nothing is posted unless all of the status media
+        was downloaded.
+
+        Raises
+        ===
+            IOError :
+        One or more media items failed to download
+
+        Return: Status object with the newly posted tweet
+        """
+        text = status.full_text if status.full_text else status.text
+        text = util.remove_urls(text)
+        media = await AsyncMediaDownloader.download_media(status, temp_dir)
+
+        expected = len(status.media) if status.media else 0
+        if len(media) < expected:
+            raise IOError('Downloaded %i of %i media items' % (len(media), expected))
+
+        loop = asyncio.get_event_loop()
+        post = functools.partial(api.PostUpdate, status=text, media=media)
+        with _MIRROR_SECONDS.time():
+            result = await loop.run_in_executor(None, post)
+        _MIRROR_POSTS.inc()
+        return result
+
+    @staticmethod
+    def default_filter(status: Status) -> bool:
+        return MirrorThread.default_filter(status)
+
+class AsyncDispatcher(Dispatcher):
+    """
+    Dispatcher for AsyncWorker classes. Filtering is as for Dispatcher,
+    but on_status() is a coroutine that waits for room in full queues.
+    """
+
+    def __init__(self, workers: List[AsyncWorker] = [], **kwargs):
+        """
+        Args
+        ===
+            workers : list(type)
+        AsyncWorker classes that statuses are enqueued to
+
+            **kwargs :
+        Forwarded to Dispatcher, e.g. `filters`, `adaptive` and `dedup`
+        """
+        super().__init__(threads=workers, **kwargs)
+
+    @property
+    def workers(self) -> List[AsyncWorker]: return self.threads
+
+    @workers.setter
+    def workers(self, val: List[AsyncWorker]) -> None: self.threads = val
+
+    async def on_status(self, status: Status) -> None:
+        """Adds status to queue of listening AsyncWorkers"""
+        BaseListener.on_status(self, status)
+        for worker_cls in self.targets(status):
+            await worker_cls.enqueue(status)
+
+    async def join(self) -> None:
+        """Wait until every status enqueued so far has been processed"""
+        for worker_cls in self.workers:
+            await worker_cls.queue().join()
@@ -0,0 +1,215 @@
+"""
+Pluggable JSON codecs used to encode statuses for writing and to decode
+lines of the streaming API. The standard library json module is used by
+default. Faster backends (orjson, msgspec, ujson) can be selected with
+configure() when they are installed.
+"""
+import json
+import logging
+
+from collections import OrderedDict
+from typing import Any, List, Union
+
+from twitter.models import Status
+
+import twitlib.util as util
+from twitlib.status import LazyStatus
+
+log = logging.getLogger('twitlib')
+
+class Codec():
+    """
+    A JSON encoder and decoder. dumps() returns compact UTF-8 encoded
+    bytes with non-ASCII characters unescaped. loads() accepts bytes or
+    str. Subclasses raise ImportError on construction if their backend
+    is not installed.
+    """
+
+    name = None
+
+    def dumps(self, obj: Any) -> bytes:
+        raise NotImplementedError('Please override Codec.dumps()')
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        raise NotImplementedError('Please override Codec.loads()')
+
+    def __repr__(self) -> str:
+        return '%s()' % self.__class__.__name__
+
+class StdlibCodec(Codec):
+    """Codec using the standard library json module"""
+
+    name = 'json'
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+        self._decoder = json.JSONDecoder()
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj).encode('utf-8')
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        if not isinstance(data, str):
+            data = bytes(data).decode('utf-8')
+        return self._decoder.decode(data)
+
+class OrjsonCodec(Codec):
+    """Codec using orjson"""
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.dumps = orjson.dumps
+        self.loads = orjson.loads
+
+class MsgspecCodec(Codec):
+    """Codec using msgspec.json"""
+
+    name = 'msgspec'
+
+    def __init__(self):
+        import msgspec
+        self.dumps = msgspec.json.Encoder().encode
+        self.loads = msgspec.json.Decoder().decode
+
+class UjsonCodec(Codec):
+    """Codec using ujson"""
+
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def dumps(self, obj: Any) -> bytes:
+        result = self._ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+        return result.encode('utf-8')
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        if not isinstance(data, str):
+            data = bytes(data).decode('utf-8')
+        return self._ujson.loads(data)
+
+# Known codecs, fastest first. 'auto' selects the first one installed.
+CODECS = OrderedDict([
+    (OrjsonCodec.name, OrjsonCodec),
+    (MsgspecCodec.name, MsgspecCodec),
+    (UjsonCodec.name, UjsonCodec),
+    (StdlibCodec.name, StdlibCodec),
+])
+AUTO = 'auto'
+
+_codec = StdlibCodec()
+
+def available() -> List[str]:
+    """Return: Names of the codecs whose backend is installed, fastest first"""
+    result = []
+    for name, codec_cls in CODECS.items():
+        try:
+            codec_cls()
+        except ImportError:
+            continue
+        result.append(name)
+    return result
+
+def configure(name: str = StdlibCodec.name) -> Codec:
+    """
+    Select the codec used by twitlib.
+
+    Args
+    ===
+        name : str
+    One of 'json', 'orjson', 'msgspec', 'ujson', or 'auto' for the fastest
+    installed codec. Defaults to 'json', the standard library.
+
+    Raises
+    ===
+        ValueError :
+    `name` is not a known codec
+
+        ImportError :
+    The backend of the named codec is not installed
+
+    Return: The selected Codec
+    """
+    global _codec
+    if name == AUTO:
+        name = available()[0]
+    if name not in CODECS:
+        raise ValueError('codec must be one of %s' % ((AUTO,) + tuple(CODECS),))
+
+    _codec = CODECS[name]()
+    log.debug('Using %s JSON codec', name)
+    return _codec
+
+def get() -> Codec:
+    """Gets the codec selected with configure()"""
+    return _codec
+
+def dumps(obj: Any) -> bytes:
+    """Encode an object as compact UTF-8 JSON with the selected codec"""
+    return _codec.dumps(obj)
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decode JSON with the selected codec"""
+    return _codec.loads(data)
+
+def encode_status(status: Status) -> bytes:
+    """
+    Encode a status as a single line of compact UTF-8 JSON, without a
+    trailing newline. The raw bytes a status was decoded from by
+    decode_status() are returned untouched, otherwise the raw Twitter
+    dict (or AsDict() result) is encoded.
+    """
+    raw = getattr(status, '_raw', None)
+    if isinstance(raw, bytes):
+        return raw
+    return _codec.dumps(util.status_to_dict(status))
+
+def decode_line(line: Union[bytes, str]) -> Union[dict, None]:
+    """
+    Decode one line of a streaming API response.
+    Return: The decoded message, or None for a blank keep-alive line
+    """
+    line = line.strip()
+    if not line:
+        return None
+    return _codec.loads(line)
+
+def decode_message(line: Union[bytes, str], lazy: bool = True) -> Union[Status, dict, None]:
+    """
+    Decode one line of a streaming API response. Statuses are returned as
+    by decode_status(), other messages such as delete and limit notices
+    as the decoded dict.
+
+    Return: The status or message, or None for a blank keep-alive line
+    """
+    line = line.strip()
+    data = decode_line(line)
+    if not isinstance(data, dict) or 'id' not in data:
+        return data
+
+    status = LazyStatus(data) if lazy else Status.NewFromJsonDict(data)
+    status._raw = line.encode('utf-8') if isinstance(line, str) else bytes(line)
+    return status
+
+def decode_status(line: Union[bytes, str], lazy: bool = True) -> Union[Status, None]:
+    """
+    Decode one line of a streaming API response to a status. The line is
+    kept on the status, so that encode_status() can write it unchanged.
+
+    Args
+    ===
+        line : bytes or str
+    A line of the stream
+
+        lazy : bool
+    If True a twitlib.status.LazyStatus is returned, otherwise a fully
+    parsed twitter.Status
+
+    Return: The status, or None for keep-alives and non-status messages
+    such as delete and limit notices
+    """
+    message = decode_message(line, lazy)
+    return message if isinstance(message, Status) else None
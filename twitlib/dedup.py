@@ -0,0 +1,304 @@
+"""
+Indexes of recently seen status ids, used by the Dispatcher to drop
+statuses that Twitter delivers more than once, e.g. after a stream
+reconnects. Ids are remembered for a time window. An exact index and a
+Bloom filter index for very large windows are provided, and either can
+be persisted to disk so that ids survive a restart.
+"""
+import logging
+import math
+import os
+import struct
+import time
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Iterator, Tuple
+
+import twitlib.util as util
+
+log = logging.getLogger('twitlib')
+
+# Persisted records: status id and the epoch time it was first seen
+RECORD = struct.Struct('<qd')
+
+class DedupIndex():
+    """
+    Base class for indexes of status ids seen within the last `window`
+    seconds. Subclasses implement _contains(), _add() and _expire().
+
+    If `path` is given, each newly seen id is appended to that file, and
+    ids still within the window are loaded from it on construction. The
+    file is rewritten without expired ids as it grows.
+    """
+
+    def __init__(self, window: float = 3600, path: str = None):
+        """
+        Args
+        ===
+            window : float > 0
+        Seconds that an id is remembered for
+
+            path : str
+        File that seen ids are persisted to. Defaults to None, ids are only
+        held in memory.
+        """
+        if window <= 0:
+            raise ValueError('window must be > 0')
+
+        self._window = window
+        self._path = path
+        self._lock = Lock()
+        self._file = None
+        self._logged = 0
+        self._next_compact = 0
+        if path is not None:
+            self._load()
+
+    @property
+    def window(self) -> float: return self._window
+
+    @property
+    def path(self) -> str: return self._path
+
+    def seen(self, status_id: int, now: float = None) -> bool:
+        """
+        Check whether an id was seen within the window, and record it if not.
+
+        Args
+        ===
+            status_id : int
+        Id of a status
+
+            now : float
+        Epoch time the status was received. Defaults to time.time()
+
+        Return: True if the id was already seen
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            if self._contains(status_id):
+                return True
+
+            self._add(status_id, now)
+            if self._file is not None:
+                self._log(status_id, now)
+            return False
+
+    def __contains__(self, status_id: int) -> bool:
+        with self._lock:
+            self._expire(time.time())
+            return self._contains(status_id)
+
+    def close(self) -> None:
+        """Close the persisted file, if any. Seen ids remain in memory."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _contains(self, status_id: int) -> bool:
+        raise NotImplementedError('Please override DedupIndex._contains()')
+
+    def _add(self, status_id: int, now: float) -> None:
+        raise NotImplementedError('Please override DedupIndex._add()')
+
+    def _expire(self, now: float) -> None:
+        raise NotImplementedError('Please override DedupIndex._expire()')
+
+    def _load(self) -> None:
+        now = time.time()
+        records = [
+                (status_id, seen_at) for status_id, seen_at in self._read()
+                if seen_at > now - self._window
+        ]
+        for status_id, seen_at in records:
+            self._expire(seen_at)
+            if not self._contains(status_id):
+                self._add(status_id, seen_at)
+        self._rewrite(records)
+        log.debug('Loaded %i seen ids from %s', len(records), self._path)
+
+    def _read(self) -> Iterator[Tuple[int, float]]:
+        if not os.path.exists(self._path):
+            return
+        with open(self._path, 'rb') as f:
+            data = f.read()
+        # A record cut short by a crash is ignored
+        end = len(data) - len(data) % RECORD.size
+        yield from RECORD.iter_unpack(data[:end])
+
+    def _rewrite(self, records) -> None:
+        if self._file is not None:
+            self._file.close()
+
+        util.makedirs(os.path.dirname(self._path))
+
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(b''.join(RECORD.pack(*record) for record in records))
+        os.replace(temp_path, self._path)
+
+        self._file = open(self._path, 'ab', buffering=0)
+        self._logged = len(records)
+        self._next_compact = max(2 * self._logged, 1024)
+
+    def _log(self, status_id: int, now: float) -> None:
+        self._file.write(RECORD.pack(status_id, now))
+        self._logged += 1
+        if self._logged > self._next_compact:
+            cutoff = now - self._window
+            self._rewrite([r for r in self._read() if r[1] > cutoff])
+
+class ExactIndex(DedupIndex):
+    """
+    Exact index of the ids seen within the window. Holds at most `max_ids`
+    ids, forgetting the oldest early if more are seen within the window.
+    """
+
+    def __init__(self, window: float = 3600, max_ids: int = 1000000, path: str = None):
+        """
+        Args
+        ===
+            window : float > 0
+        Seconds that an id is remembered for
+
+            max_ids : int > 0
+        Maximum number of ids held
+
+            path : str
+        File that seen ids are persisted to, see DedupIndex
+        """
+        if max_ids <= 0:
+            raise ValueError('max_ids must be > 0')
+
+        self._max_ids = max_ids
+        self._ids = OrderedDict()
+        super().__init__(window=window, path=path)
+
+    @property
+    def max_ids(self) -> int: return self._max_ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _contains(self, status_id: int) -> bool:
+        return status_id in self._ids
+
+    def _add(self, status_id: int, now: float) -> None:
+        self._ids[status_id] = now
+        if len(self._ids) > self._max_ids:
+            self._ids.popitem(last=False)
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self._window
+        ids = self._ids
+        while ids:
+            status_id, seen_at = next(iter(ids.items()))
+            if seen_at > cutoff:
+                break
+            del ids[status_id]
+
+class BloomIndex(DedupIndex):
+    """
+    Approximate index of seen ids using two generations of Bloom filters.
+    Ids are added to the current generation, and a new generation replaces
+    the previous one every `window` seconds or once `capacity` ids have
+    been added, so ids are remembered for between one and two windows.
+
+    Memory is fixed by `capacity` and `error_rate`, independent of the
+    window, at the cost of occasionally treating a new id as seen.
+    """
+
+    def __init__(
+            self,
+            window: float = 3600,
+            capacity: int = 10000000,
+            error_rate: float = 0.001,
+            path: str = None):
+        """
+        Args
+        ===
+            window : float > 0
+        Seconds that an id is remembered for, at least, unless more than
+        `capacity` ids are seen in that time
+
+            capacity : int > 0
+        Ids expected per window
+
+            error_rate : float in (0, 1)
+        Probability that an unseen id is reported as seen, when `capacity`
+        ids are held
+
+            path : str
+        File that seen ids are persisted to, see DedupIndex
+        """
+        if capacity <= 0:
+            raise ValueError('capacity must be > 0')
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be in (0, 1)')
+
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self._hashes = max(1, int(round(self._bits / capacity * math.log(2))))
+
+        self._current = bytearray((self._bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+        self._started = None
+        super().__init__(window=window, path=path)
+
+    @property
+    def capacity(self) -> int: return self._capacity
+
+    @property
+    def error_rate(self) -> float: return self._error_rate
+
+    @property
+    def bits(self) -> int:
+        """Bits in each generation's filter"""
+        return self._bits
+
+    @property
+    def hashes(self) -> int:
+        """Bit positions set per id"""
+        return self._hashes
+
+    def _positions(self, status_id: int):
+        h1 = util.hash_id(status_id)
+        h2 = util.hash_id(h1) | 1
+        for i in range(self._hashes):
+            yield (h1 + i * h2) % self._bits
+
+    def _contains(self, status_id: int) -> bool:
+        positions = list(self._positions(status_id))
+        for bits in (self._current, self._previous):
+            if all(bits[p >> 3] & (1 << (p & 7)) for p in positions):
+                return True
+        return False
+
+    def _add(self, status_id: int, now: float) -> None:
+        if self._count >= self._capacity:
+            self._rotate(now)
+        current = self._current
+        for p in self._positions(status_id):
+            current[p >> 3] |= 1 << (p & 7)
+        self._count += 1
+
+    def _expire(self, now: float) -> None:
+        if self._started is None:
+            self._started = now
+        elif now - self._started >= 2 * self._window:
+            # Both generations are older than the window
+            self._rotate(now)
+            self._rotate(now)
+        elif now - self._started >= self._window:
+            self._rotate(now)
+
+    def _rotate(self, now: float) -> None:
+        self._previous = self._current
+        self._current = bytearray(len(self._previous))
+        self._count = 0
+        self._started = now
@@ -0,0 +1,432 @@
+"""
+Downloading of media attached to statuses. Requests are made through a
+single connection pooled requests.Session shared by all threads, and the
+media items of a status are fetched in parallel. Response bodies are
+streamed to disk in fixed size chunks, so memory use does not grow with
+the size of the media. An optional content addressed MediaCache lets
+threads share media that has already been downloaded.
+"""
+import hashlib
+import logging
+import os
+import re
+import requests
+import shutil
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock, get_ident
+from typing import List, Tuple, Union
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import twitlib.metrics as metrics
+
+log = logging.getLogger('twitlib')
+
+# Downloads made by fetch(), and URLs that _try_fetch() failed to place
+_FETCHED = metrics.counter('twitlib_media_fetched_total')
+_FETCHED_BYTES = metrics.counter('twitlib_media_bytes_total')
+_FETCH_SECONDS = metrics.histogram('twitlib_media_fetch_seconds')
+_FAILURES = metrics.counter('twitlib_media_failures_total')
+
+# Defaults, see configure()
+POOL_SIZE = 10
+TIMEOUT = (3.05, 30)
+RETRIES = 3
+MAX_WORKERS = 4
+CHUNK_SIZE = 64 * 1024
+MAX_BYTES = None
+
+_settings = {
+    'pool_size': POOL_SIZE,
+    'timeout': TIMEOUT,
+    'retries': RETRIES,
+    'max_workers': MAX_WORKERS,
+    'chunk_size': CHUNK_SIZE,
+    'max_bytes': MAX_BYTES,
+}
+_lock = Lock()
+_session = None
+_executor = None
+_cache = None
+
+# Name of a file stored by MediaCache, the SHA-256 of its content plus extension
+_CACHED_NAME = re.compile(r'^[0-9a-f]{64}(\.[^.]*)?$')
+
+# Seconds after which a partial MediaCache download is presumed abandoned
+PARTIAL_AGE = 3600
+
+def configure(
+        pool_size: int = POOL_SIZE,
+        timeout: Union[float, Tuple[float, float]] = TIMEOUT,
+        retries: int = RETRIES,
+        max_workers: int = MAX_WORKERS,
+        chunk_size: int = CHUNK_SIZE,
+        max_bytes: int = MAX_BYTES) -> None:
+    """
+    Set connection pool and concurrency options for media downloads. The
+    shared session and thread pool are rebuilt on next use.
+
+    Args
+    ===
+        pool_size : int
+    Maximum number of kept-alive connections per host
+
+        timeout : float or (float, float)
+    Connect and read timeout in seconds, as accepted by requests
+
+        retries : int
+    Retries for connection errors and 429/5xx responses, with backoff
+
+        max_workers : int
+    Threads in the pool shared by all callers of fetch_all(). The first
+    item of each call is downloaded by the calling thread, so size this
+    for the remaining items, e.g. worker threads times extra media per
+    status.
+
+        chunk_size : int
+    Bytes read from a response and written to disk at a time
+
+        max_bytes : int or None
+    Media larger than this many bytes is not downloaded. None for no limit.
+
+    Return: None
+    """
+    global _session, _executor
+    with _lock:
+        _settings.update(
+                pool_size=pool_size,
+                timeout=timeout,
+                retries=retries,
+                max_workers=max_workers,
+                chunk_size=chunk_size,
+                max_bytes=max_bytes
+        )
+        if _session is not None:
+            _session.close()
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _session = None
+        _executor = None
+
+def shutdown(wait: bool = True) -> None:
+    """
+    Close the shared session and stop the threads of the shared pool,
+    waiting for running downloads if `wait`. Both are created again on
+    next use.
+    """
+    global _session, _executor
+    with _lock:
+        session, _session = _session, None
+        pool, _executor = _executor, None
+    if session is not None:
+        session.close()
+    if pool is not None:
+        pool.shutdown(wait=wait)
+
+def session() -> requests.Session:
+    """
+    Gets the shared requests.Session, creating it on first use. The session
+    keeps connections alive and retries failed requests per configure().
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            retry = Retry(
+                    total=_settings['retries'],
+                    backoff_factor=0.5,
+                    status_forcelist=(429, 500, 502, 503, 504)
+            )
+            adapter = HTTPAdapter(
+                    pool_connections=_settings['pool_size'],
+                    pool_maxsize=_settings['pool_size'],
+                    max_retries=retry
+            )
+            _session = requests.Session()
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+def executor() -> ThreadPoolExecutor:
+    """Gets the shared thread pool used for parallel downloads"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                    max_workers=_settings['max_workers'],
+                    thread_name_prefix='media'
+            )
+        return _executor
+
+def configure_cache(dirname: Union[str, None], max_bytes: int = 1024**3) -> None:
+    """
+    Enable a MediaCache for fetch_all(), or disable it if `dirname` is None.
+    See MediaCache for argument details.
+
+    Return: None
+    """
+    global _cache
+    with _lock:
+        _cache = MediaCache(dirname, max_bytes) if dirname is not None else None
+
+def cache() -> Union['MediaCache', None]:
+    """Gets the MediaCache used by fetch_all(), or None if disabled"""
+    return _cache
+
+def fetch(url: str, filepath: str, hasher=None) -> str:
+    """
+    Download a URL to a file using the shared session. The body is streamed
+    to a temporary file alongside `filepath`, which is renamed to `filepath`
+    only once the download completes. If given, `hasher` is a hashlib object
+    that is updated with each chunk of the body.
+
+    Raises
+    ===
+        requests.HTTPError :
+    The server responded with an error status code
+
+        IOError :
+    The media exceeds the configured max_bytes
+
+    Return: The path of the written file
+    """
+    max_bytes = _settings['max_bytes']
+    start = time.perf_counter()
+    r = session().get(url, stream=True, timeout=_settings['timeout'])
+    try:
+        r.raise_for_status()
+        log.debug('Request got URL %s', url)
+
+        length = r.headers.get('Content-Length')
+        if max_bytes is not None and length and int(length) > max_bytes:
+            raise IOError('%s is %s bytes, exceeding max_bytes' % (url, length))
+
+        temp_path = '%s.%i.part' % (filepath, get_ident())
+        try:
+            size = 0
+            with open(temp_path, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=_settings['chunk_size']):
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise IOError('%s exceeded max_bytes' % url)
+                    f.write(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+            os.replace(temp_path, filepath)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    finally:
+        r.close()
+
+    _FETCH_SECONDS.observe(time.perf_counter() - start)
+    _FETCHED.inc()
+    _FETCHED_BYTES.inc(size)
+    log.debug('Wrote %s', filepath)
+    return filepath
+
+def fetch_all(urls: List[str], filepaths: List[str]) -> List[str]:
+    """
+    Download several URLs in parallel, each to the matching file path.
+    The first URL is downloaded in the calling thread while the rest are
+    handed to the shared thread pool, so each calling thread always makes
+    progress even when the pool is busy with other statuses. URLs that
+    fail to download are logged and left out of the result. When a
+    MediaCache is configured, files are linked from the cache.
+    Return: The paths of the written files, in the order given
+    """
+    results = []
+    if urls:
+        rest = executor().map(_try_fetch, urls[1:], filepaths[1:]) if len(urls) > 1 else []
+        results.append(_try_fetch(urls[0], filepaths[0]))
+        results.extend(rest)
+    return [path for path in results if path is not None]
+
+def _try_fetch(url: str, filepath: str) -> Union[str, None]:
+    try:
+        if _cache is not None:
+            return _cache.fetch(url, filepath)
+        return fetch(url, filepath)
+    except IOError as e:
+        _FAILURES.inc()
+        log.warning('Failed to download %s: %s', url, e)
+        return None
+
+class MediaCache():
+    """
+    On disk media cache keyed by URL and stored by content hash. Files are
+    named by the SHA-256 of their content, so identical media found at
+    different URLs is stored once. When the cache grows past `max_bytes`
+    the least recently used files are evicted. Concurrent requests for the
+    same URL are coalesced into a single download. Safe to share between
+    threads.
+
+    Files left in `dirname` by a previous cache are indexed on construction,
+    oldest first, so that they count toward `max_bytes` and are evicted.
+    Their URLs are not known until they are downloaded again. Partial
+    downloads untouched for PARTIAL_AGE seconds are removed, newer ones may
+    belong to another process sharing `dirname` and are left alone.
+    """
+
+    def __init__(self, dirname: str, max_bytes: int = 1024**3):
+        """
+        Args
+        ===
+            dirname : str
+        Directory holding cached files. Created if it does not exist.
+
+            max_bytes : int
+        Total size of cached files to retain
+        """
+        os.makedirs(dirname, exist_ok=True)
+        self._dirname = dirname
+        self._max_bytes = max_bytes
+        self._lock = Lock()
+        self._urls = {}                 # url -> digest
+        self._aliases = {}              # digest -> set of urls
+        self._files = OrderedDict()     # digest -> (path, size), in LRU order
+        self._inflight = {}             # url -> Future
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._index()
+
+    @property
+    def dirname(self) -> str: return self._dirname
+
+    @property
+    def size(self) -> int: return self._size
+
+    @property
+    def hits(self) -> int: return self._hits
+
+    @property
+    def misses(self) -> int: return self._misses
+
+    def get(self, url: str) -> str:
+        """
+        Get the path of the cached file for a URL, downloading it if it is
+        not cached. If another thread is already downloading the URL, waits
+        for that download instead of starting another.
+
+        Return: Path of the cached file
+        """
+        with self._lock:
+            digest = self._urls.get(url)
+            if digest is not None:
+                self._hits += 1
+                self._files.move_to_end(digest)
+                return self._files[digest][0]
+
+            future = self._inflight.get(url)
+            owner = future is None
+            if owner:
+                self._misses += 1
+                future = self._inflight[url] = Future()
+
+        if not owner:
+            return future.result()
+
+        try:
+            path = self._download(url)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[url]
+
+    def fetch(self, url: str, filepath: str) -> str:
+        """
+        Place the media at a URL at `filepath`, hard linking from the cache
+        where possible and copying otherwise.
+
+        Return: `filepath`
+        """
+        for attempt in range(3):
+            cached = self.get(url)
+            try:
+                _link(cached, filepath)
+                return filepath
+            except FileNotFoundError:
+                # Evicted between get() and link, download again
+                log.debug('Cached file %s was evicted, retrying', cached)
+        raise IOError('Unable to cache %s' % url)
+
+    def _download(self, url: str) -> str:
+        hasher = hashlib.sha256()
+        temp_path = os.path.join(self._dirname, 'download.%i.%i' % (os.getpid(), get_ident()))
+        fetch(url, temp_path, hasher=hasher)
+
+        digest = hasher.hexdigest()
+        ext = os.path.splitext(os.path.basename(url))[1]
+        path = os.path.join(self._dirname, digest + ext)
+
+        with self._lock:
+            if digest in self._files:
+                os.remove(temp_path)
+            else:
+                os.replace(temp_path, path)
+                size = os.path.getsize(path)
+                self._files[digest] = (path, size)
+                self._size += size
+            self._urls[url] = digest
+            self._aliases.setdefault(digest, set()).add(url)
+            self._files.move_to_end(digest)
+            self._evict()
+
+        log.debug('Cached %s as %s', url, path)
+        return path
+
+    def _index(self) -> None:
+        """Index files cached by a previous run, least recently modified first"""
+        found = []
+        stale = time.time() - PARTIAL_AGE
+        for entry in os.scandir(self._dirname):
+            if not entry.is_file():
+                continue
+            if entry.name.startswith('download.'):
+                # Partial download from an interrupted run
+                if entry.stat().st_mtime < stale:
+                    os.remove(entry.path)
+            elif _CACHED_NAME.match(entry.name):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, entry.path, stat.st_size))
+
+        for mtime, name, path, size in sorted(found):
+            digest = name.split('.', 1)[0]
+            self._files[digest] = (path, size)
+            self._size += size
+
+        if found:
+            log.debug('Indexed %i cached files, %i bytes', len(found), self._size)
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self._max_bytes and len(self._files) > 1:
+            digest, (path, size) = self._files.popitem(last=False)
+            self._size -= size
+            for alias in self._aliases.pop(digest, ()):
+                del self._urls[alias]
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            log.debug('Evicted %s from media cache', path)
+
+def _link(src: str, dst: str) -> None:
+    """Hard link src to dst, replacing dst. Falls back to a copy across devices."""
+    temp_path = '%s.%i.part' % (dst, get_ident())
+    try:
+        os.link(src, temp_path)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(src, temp_path)
+    os.replace(temp_path, dst)
@@ -1,5 +1,170 @@
+"""
+Filter functions for statuses, and FilterChain for evaluating a list of
+filters as a single short circuiting predicate.
+"""
+import functools
+import time
+
+from typing import Callable, List, Sequence
+
 from twitter import Status
 
+FilterFunc = Callable[[Status], bool]
+
+# Relative evaluation cost assumed for filters without a `cost` attribute
+DEFAULT_COST = 1.0
+
+def cost(value: float) -> Callable[[FilterFunc], FilterFunc]:
+    """
+    Decorator that annotates a filter with its relative evaluation cost.
+    FilterChain evaluates cheaper filters first. The cost also applies to
+    functools.partial objects wrapping the filter.
+
+    Example
+    ---
+    @cost(5)
+    def expensive_filter(status): ...
+    """
+    def decorator(func: FilterFunc) -> FilterFunc:
+        func.cost = value
+        return func
+    return decorator
+
+class FilterChain():
+    """
+    A list of filters compiled into a single predicate. A status passes if
+    every filter returns True. Evaluation stops at the first rejection, with
+    filters ordered by ascending `cost` attribute, ties keeping list order.
+
+    If `adaptive` is True, the time taken and rejection rate of each filter
+    are measured and every `interval` calls the filters are reordered so that
+    filters rejecting the most statuses per unit time run first.
+    """
+
+    def __init__(self, funcs: Sequence[FilterFunc], adaptive: bool = False, interval: int = 1000):
+        self._funcs = tuple(funcs)
+        self._adaptive = adaptive
+        self._interval = interval
+        self._calls = 0
+
+        # Per filter [calls, rejects, seconds], indexed as in self._funcs
+        self._stats = [[0, 0, 0.0] for f in self._funcs]
+        self._set_order(sorted(range(len(self._funcs)), key=lambda i: _cost(self._funcs[i])))
+
+    @property
+    def funcs(self) -> tuple:
+        """Filters in the order they were given"""
+        return self._funcs
+
+    @property
+    def order(self) -> tuple:
+        """Filters in the order they are evaluated"""
+        return self._order
+
+    def __call__(self, status: Status, memo: dict = None) -> bool:
+        """
+        Evaluate the chain on a status. If given, `memo` is a dict of filter
+        results for this status shared between chains, so that a filter
+        appearing in several chains is evaluated only once per status.
+        """
+        if self._adaptive:
+            return self._call_measured(status, memo)
+        if memo is not None:
+            return self._call_memoized(status, memo)
+        for f in self._order:
+            if not f(status):
+                return False
+        return True
+
+    def failures(self, status: Status) -> List[FilterFunc]:
+        """
+        Evaluate every filter without short circuiting.
+        Return: List of filters that rejected the status
+        """
+        return [f for f in self._order if not f(status)]
+
+    def reorder(self) -> None:
+        """
+        Reorder filters by measured cost per rejection, cheapest first.
+        Filters that have not been measured keep their relative order.
+        """
+        def key(i):
+            calls, rejects, seconds = self._stats[i]
+            if not calls:
+                return 0.0
+            return (seconds / calls) / max(rejects / calls, 1e-6)
+        self._set_order(sorted(self._indices, key=key))
+
+    def _set_order(self, indices: List[int]) -> None:
+        self._indices = tuple(indices)
+        self._order = tuple(self._funcs[i] for i in indices)
+
+    def _call_memoized(self, status: Status, memo: dict) -> bool:
+        # Keyed by id() since filters need not be hashable, the memo only
+        # lives as long as the filters it refers to
+        for f in self._order:
+            result = memo.get(id(f))
+            if result is None:
+                result = memo[id(f)] = bool(f(status))
+            if not result:
+                return False
+        return True
+
+    def _call_measured(self, status: Status, memo: dict = None) -> bool:
+        self._calls += 1
+        if self._calls % self._interval == 0:
+            self.reorder()
+
+        for i in self._indices:
+            f = self._funcs[i]
+            result = memo.get(id(f)) if memo is not None else None
+            if result is None:
+                stats = self._stats[i]
+                start = time.perf_counter()
+                result = bool(f(status))
+                stats[2] += time.perf_counter() - start
+                stats[0] += 1
+                stats[1] += not result
+                if memo is not None:
+                    memo[id(f)] = result
+            if not result:
+                return False
+        return True
+
+def _cost(func: FilterFunc) -> float:
+    # Filters taking extra args are bound with functools.partial, which
+    # does not carry the cost of the function it wraps
+    value = getattr(func, 'cost', None)
+    while value is None and isinstance(func, functools.partial):
+        func = func.func
+        value = getattr(func, 'cost', None)
+    return value if isinstance(value, (int, float)) else DEFAULT_COST
+
+def compile_filters(funcs: Sequence[FilterFunc], adaptive: bool = False) -> FilterChain:
+    """
+    Compile a list of filters into a FilterChain. Chains are cached, so
+    compiling the same filters again returns the same chain. Adaptive
+    chains keep per chain statistics that are not thread safe, so they
+    are never cached and each caller gets its own. A FilterChain is
+    returned unchanged.
+    """
+    if isinstance(funcs, FilterChain):
+        return funcs
+
+    funcs = tuple(funcs)
+    if adaptive:
+        return FilterChain(funcs, adaptive=True)
+    try:
+        hash(funcs)
+    except TypeError:
+        # Unhashable filter, can't be cached
+        return FilterChain(funcs)
+    return _compile(funcs)
+
+@functools.lru_cache(maxsize=256)
+def _compile(funcs: tuple) -> FilterChain:
+    return FilterChain(funcs)
+
 def is_reply(status):
     if status.in_reply_to_user_id:
         return True
@@ -19,6 +184,7 @@ def is_retweet(status):
 def has_media(status):
     return bool(status.media)
 
+@cost(3)
 def has_hashtag(status, tag_name, ignore_case=False):
     if not status.hashtags:
         return False
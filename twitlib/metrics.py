@@ -0,0 +1,314 @@
+"""
+In-process metrics for workers, the Dispatcher and media I/O. Counters,
+gauges and latency histograms are kept in a Registry. The shared REGISTRY
+is updated by twitlib itself, and can be read with snapshot(), rendered
+in the Prometheus text format with render(), served over HTTP with serve()
+or logged periodically with start_dump().
+"""
+import json
+import logging
+import time
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, List, Tuple
+
+log = logging.getLogger('twitlib')
+
+# Upper bounds of histogram buckets in seconds, for latencies from 1ms to 10s
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metric():
+    """Base class for a named metric with a fixed set of labels"""
+
+    kind = None
+
+    def __init__(self, name: str, labels: Dict[str, str]):
+        self.name = name
+        self.labels = labels
+        self._lock = Lock()
+
+    def reset(self) -> None:
+        raise NotImplementedError('Please override Metric.reset()')
+
+    def value(self):
+        raise NotImplementedError('Please override Metric.value()')
+
+class Counter(Metric):
+    """A count that only increases"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, labels: Dict[str, str]):
+        super().__init__(name, labels)
+        self._value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def reset(self) -> None:
+        with self._lock:
+            self._value = 0
+
+    def value(self) -> float:
+        return self._value
+
+class Gauge(Metric):
+    """
+    A value that may go up and down. If `func` is given, it is called to
+    read the value whenever the gauge is collected.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, labels: Dict[str, str], func: Callable[[], float] = None):
+        super().__init__(name, labels)
+        self._value = 0
+        self.func = func
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def reset(self) -> None:
+        self._value = 0
+
+    def value(self) -> float:
+        if self.func is not None:
+            return self.func()
+        return self._value
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, typically latencies in seconds, over
+    buckets with the given upper bounds. Values above the last bound are
+    counted in a final +Inf bucket.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, labels: Dict[str, str], buckets: Tuple[float, ...] = BUCKETS):
+        super().__init__(name, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.reset()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def time(self) -> '_Timer':
+        """Return: A context manager observing the seconds spent within it"""
+        return _Timer(self)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._sum = 0.0
+
+    def value(self) -> dict:
+        """
+        Return: dict with the `count` and `sum` of observed values, and
+        cumulative `buckets` counts keyed by upper bound
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {'count': cumulative, 'sum': total, 'buckets': buckets}
+
+class _Timer():
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self) -> '_Timer':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._histogram.observe(time.perf_counter() - self._start)
+
+class Registry():
+    """
+    Collection of metrics keyed by name and labels. Getting a metric that
+    already exists returns it, so callers may look metrics up when needed
+    or keep a reference to update on hot paths. Safe to share between
+    threads.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+
+    def counter(self, name: str, **labels) -> Counter:
+        """Gets or creates a Counter"""
+        return self._get(Counter, name, labels)
+
+    def gauge(self, name: str, func: Callable[[], float] = None, **labels) -> Gauge:
+        """
+        Gets or creates a Gauge. If `func` is given it replaces the function
+        that the gauge reads its value from.
+        """
+        gauge = self._get(Gauge, name, labels)
+        if func is not None:
+            gauge.func = func
+        return gauge
+
+    def histogram(self, name: str, buckets: Tuple[float, ...] = BUCKETS, **labels) -> Histogram:
+        """Gets or creates a Histogram. `buckets` is only used on creation."""
+        return self._get(Histogram, name, labels, buckets=buckets)
+
+    def collect(self) -> List[Metric]:
+        """Return: All metrics, sorted by name and labels"""
+        with self._lock:
+            return [self._metrics[key] for key in sorted(self._metrics)]
+
+    def reset(self) -> None:
+        """Reset the value of every metric. Metrics stay registered."""
+        for metric in self.collect():
+            metric.reset()
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        Return: Current values keyed by metric name with labels, e.g.
+        'twitlib_processed_total{worker="WriterThread"}'
+        """
+        result = {}
+        for metric in self.collect():
+            try:
+                result[_series(metric.name, metric.labels)] = metric.value()
+            except Exception:
+                log.exception('Failed to read metric %s', metric.name)
+        return result
+
+    def render(self) -> str:
+        """Return: All metrics in the Prometheus text exposition format"""
+        lines = []
+        typed = set()
+        for metric in self.collect():
+            try:
+                value = metric.value()
+            except Exception:
+                log.exception('Failed to read metric %s', metric.name)
+                continue
+
+            if metric.name not in typed:
+                typed.add(metric.name)
+                lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+
+            if metric.kind != Histogram.kind:
+                lines.append('%s %s' % (_series(metric.name, metric.labels), _number(value)))
+                continue
+
+            for bound, count in value['buckets'].items():
+                labels = dict(metric.labels, le=_number(bound))
+                lines.append('%s %i' % (_series(metric.name + '_bucket', labels), count))
+            lines.append('%s %s' % (_series(metric.name + '_sum', metric.labels), _number(value['sum'])))
+            lines.append('%s %i' % (_series(metric.name + '_count', metric.labels), value['count']))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, level: int = logging.INFO) -> None:
+        """Log a snapshot of all metrics as JSON"""
+        log.log(level, 'Metrics: %s', json.dumps(self.snapshot(), sort_keys=True, default=str))
+
+    def start_dump(self, interval: float = 60.0, level: int = logging.INFO) -> Event:
+        """
+        Dump all metrics every `interval` seconds from a daemon thread.
+        Return: Event that stops the dumps when set
+        """
+        if interval <= 0:
+            raise ValueError('interval must be > 0')
+
+        stop = Event()
+        def run():
+            while not stop.wait(interval):
+                self.dump(level)
+        Thread(target=run, name='metrics-dump', daemon=True).start()
+        return stop
+
+    def serve(self, port: int = 9090, host: str = '') -> ThreadingHTTPServer:
+        """
+        Serve render() over HTTP from a daemon thread, for Prometheus or
+        other scrapers. Every path responds with the metrics.
+
+        Return: The server, stop it with shutdown()
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug('Metrics request: ' + format, *args)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        log.info('Serving metrics on port %i', server.server_address[1])
+        return server
+
+    def _get(self, metric_cls, name: str, labels: Dict[str, str], **kwargs) -> Metric:
+        labels = {k: str(v) for k, v in labels.items()}
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = metric_cls(name, labels, **kwargs)
+                    self._metrics[key] = metric
+
+        if not isinstance(metric, metric_cls):
+            raise ValueError('Metric %s is a %s' % (name, metric.kind))
+        return metric
+
+def _series(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    pairs = ','.join(
+            '%s="%s"' % (k, v.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+            for k, v in sorted(labels.items())
+    )
+    return '%s{%s}' % (name, pairs)
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# Registry updated by twitlib
+REGISTRY = Registry()
+
+def counter(name: str, **labels) -> Counter:
+    """Gets or creates a Counter in REGISTRY"""
+    return REGISTRY.counter(name, **labels)
+
+def gauge(name: str, func: Callable[[], float] = None, **labels) -> Gauge:
+    """Gets or creates a Gauge in REGISTRY"""
+    return REGISTRY.gauge(name, func, **labels)
+
+def histogram(name: str, buckets: Tuple[float, ...] = BUCKETS, **labels) -> Histogram:
+    """Gets or creates a Histogram in REGISTRY"""
+    return REGISTRY.histogram(name, buckets, **labels)
@@ -0,0 +1,108 @@
+"""
+Process pool backend for CPU bound workers. Runs the process_status()
+method of a WorkerThread subclass in a pool of processes, so that work
+such as JSON serialization is not limited to one core by the GIL.
+"""
+import json
+import logging
+import os
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import util as mp_util
+from threading import BoundedSemaphore
+from typing import Type, Union
+
+from twitter.models import Status
+
+import twitlib.util as util
+
+log = logging.getLogger('twitlib')
+
+# WorkerThread instance owned by each pool process
+_worker = None
+
+class ProcessPoolWorker():
+    """
+    Runs WorkerThread.process_status() in a pool of processes. Instances can
+    be registered with a Dispatcher in place of a thread class, since they
+    provide the same enqueue() method.
+
+    Statuses are sent to the pool as raw JSON text and rebuilt in the pool
+    process, rather than pickling twitter.Status objects. Each pool process
+    constructs one `worker_cls` instance with the given keyword args, which
+    is never started as a thread. With the default fork start method the
+    keyword args are inherited by the pool processes, otherwise they must
+    be picklable.
+    """
+
+    def __init__(self, worker_cls: Type, processes: int = None, max_pending: int = None, **worker_kwargs):
+        """
+        Args
+        ===
+            worker_cls : type
+        WorkerThread subclass whose process_status() is run
+
+            processes : int
+        Number of pool processes. Defaults to the number of CPUs.
+
+            max_pending : int
+        Maximum statuses submitted to the pool and not yet processed. When
+        reached, enqueue() blocks. Defaults to no limit.
+
+            **worker_kwargs :
+        Forwarded to the `worker_cls` constructor in each pool process
+        """
+        self.__name__ = '%s(%s)' % (self.__class__.__name__, worker_cls.__name__)
+        self._worker_cls = worker_cls
+        self._pending = BoundedSemaphore(max_pending) if max_pending else None
+        self._executor = ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=_init_worker,
+                initargs=(worker_cls, worker_kwargs)
+        )
+
+    @property
+    def worker_cls(self) -> Type: return self._worker_cls
+
+    def enqueue(self, status: Union[Status, None]) -> Union[Future, None]:
+        """
+        Submit a status to the pool. Enqueueing None is accepted for
+        compatibility with thread classes and shuts down the pool once
+        submitted statuses are processed.
+
+        Return: Future holding the process_status() return value
+        """
+        if status is None:
+            self.close(wait=False)
+            return None
+
+        raw = json.dumps(util.status_to_dict(status))
+        if self._pending is not None:
+            self._pending.acquire()
+
+        future = self._executor.submit(_process, raw)
+        future.add_done_callback(self._done)
+        return future
+
+    def close(self, wait: bool = True) -> None:
+        """Stop accepting statuses and shut down the pool after pending work"""
+        self._executor.shutdown(wait=wait)
+
+    def _done(self, future: Future) -> None:
+        if self._pending is not None:
+            self._pending.release()
+        if not future.cancelled() and future.exception() is not None:
+            log.error('Exception in %s', self.__name__, exc_info=future.exception())
+
+def _init_worker(worker_cls: Type, worker_kwargs: dict) -> None:
+    global _worker
+    kwargs = dict(worker_kwargs)
+    kwargs.setdefault('name', '%s-%i' % (worker_cls.__name__, os.getpid()))
+    _worker = worker_cls(**kwargs)
+
+    # Flush and close worker resources when the pool process exits
+    mp_util.Finalize(_worker, _worker.close, exitpriority=10)
+
+def _process(raw: str):
+    status = util.status_from_dict(json.loads(raw))
+    return _worker.process_status(status)
@@ -0,0 +1,161 @@
+"""
+Coordinated shutdown of a Dispatcher and the workers consuming its
+queues. A Pipeline stops intake, lets workers finish every queued status,
+stops them with the None sentinel so that close() flushes buffered
+batches and segment writers, and reports workers that miss a deadline.
+"""
+import logging
+import time
+
+from queue import Full
+from typing import List, Type, Union
+
+import twitlib.util as util
+from twitlib.dedup import DedupIndex
+from twitlib.pool import WorkerPool
+from twitlib.streaming import Dispatcher, WorkerThread
+
+log = logging.getLogger('twitlib')
+
+class Pipeline():
+    """
+    A Dispatcher and the worker threads or WorkerPools consuming the queues
+    of its thread classes. Workers are started with start(), and stopped
+    without losing queued statuses with drain() or shutdown().
+    """
+
+    def __init__(
+            self,
+            dispatcher: Dispatcher,
+            workers: List[Union[WorkerThread, WorkerPool]] = ()):
+        """
+        Args
+        ===
+            dispatcher : Dispatcher
+        Dispatcher feeding the worker queues
+
+            workers : list(WorkerThread or WorkerPool)
+        Workers consuming the queues of the dispatcher's thread classes.
+        Threads may already be started.
+        """
+        self._dispatcher = dispatcher
+        self._workers = list(workers)
+
+    @property
+    def dispatcher(self) -> Dispatcher: return self._dispatcher
+
+    @property
+    def workers(self) -> List[Union[WorkerThread, WorkerPool]]: return self._workers
+
+    def start(self) -> 'Pipeline':
+        """Start any workers not yet started"""
+        for worker in self._workers:
+            if isinstance(worker, WorkerPool):
+                worker.start()
+            elif worker.ident is None:
+                worker.start()
+        return self
+
+    def drain(self, timeout: float = None) -> List[WorkerThread]:
+        """
+        Close the dispatcher, wait for the workers to process every queued
+        status, then stop the workers. Stopped workers call close(), which
+        flushes buffered batches and segment writers.
+
+        Args
+        ===
+            timeout : float or None
+        Seconds to wait overall. None waits indefinitely.
+
+        Return: Workers still running when the timeout expired. They are
+        daemon threads by default, and are killed if the interpreter exits.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._dispatcher.close()
+
+        for thread_cls in self._thread_classes():
+            if not self._wait_empty(thread_cls, deadline):
+                log.warning(
+                        '%s queue not drained, %i statuses unfinished',
+                        thread_cls.__name__, thread_cls.QUEUE.unfinished_tasks
+                )
+
+        stuck = []
+        threads = []
+        for worker in self._workers:
+            if isinstance(worker, WorkerPool):
+                stuck.extend(worker.stop(_remaining(deadline)))
+            elif worker.is_alive():
+                self._stop_thread(worker, deadline)
+                threads.append(worker)
+        stuck.extend(util.join_all(threads, _remaining(deadline)))
+
+        for worker in stuck:
+            log.warning('%s did not stop within %ss', worker.name, timeout)
+        log.info('Pipeline drained, %i workers still running', len(stuck))
+        return stuck
+
+    def shutdown(self, timeout: float = None) -> List[WorkerThread]:
+        """
+        drain() the pipeline, then close the dispatcher's dedup indexes and
+        the spools of queues whose workers all stopped. Statuses still in a
+        spool are replayed by the next process.
+
+        Args
+        ===
+            timeout : float or None
+        Seconds to wait for the workers. None waits indefinitely.
+
+        Return: Workers still running when the timeout expired
+        """
+        stuck = self.drain(timeout)
+
+        dedup = self._dispatcher.dedup
+        indexes = dedup.values() if isinstance(dedup, dict) else [dedup]
+        for index in indexes:
+            if isinstance(index, DedupIndex):
+                index.close()
+
+        running = {type(worker) for worker in stuck}
+        for thread_cls in self._thread_classes():
+            spool = getattr(thread_cls.QUEUE, 'spool', None)
+            if spool is not None and thread_cls not in running:
+                spool.close()
+        return stuck
+
+    def _thread_classes(self) -> List[Type[WorkerThread]]:
+        """Thread classes of the dispatcher that have a queue and a consumer"""
+        consumers = set()
+        for worker in self._workers:
+            thread_cls = worker.thread_cls if isinstance(worker, WorkerPool) else type(worker)
+            consumers.add(thread_cls)
+        return [
+                thread_cls for thread_cls in self._dispatcher.threads
+                if thread_cls in consumers and getattr(thread_cls, 'QUEUE', None) is not None
+        ]
+
+    @staticmethod
+    def _wait_empty(thread_cls: Type[WorkerThread], deadline: float = None) -> bool:
+        """
+        Wait until every status in a class queue has been processed.
+        Return: False if the deadline passed first
+        """
+        queue = thread_cls.QUEUE
+        with queue.all_tasks_done:
+            while queue.unfinished_tasks:
+                remaining = _remaining(deadline)
+                if remaining is not None and remaining <= 0:
+                    return False
+                queue.all_tasks_done.wait(remaining)
+        return True
+
+    @staticmethod
+    def _stop_thread(thread: WorkerThread, deadline: float = None) -> None:
+        """Enqueue the None sentinel for a thread, giving up at the deadline"""
+        try:
+            thread.__class__.QUEUE.put(None, block=True, timeout=_remaining(deadline))
+        except Full:
+            log.warning('%s queue full, could not stop %s', thread.__class__.__name__, thread.name)
+
+def _remaining(deadline: float = None) -> Union[float, None]:
+    return None if deadline is None else max(0, deadline - time.monotonic())
@@ -0,0 +1,249 @@
+"""
+Autoscaling pools of worker threads. A WorkerPool owns the threads of one
+WorkerThread subclass, starting more when the class queue backs up or
+processing slows down, and retiring idle ones with the None sentinel.
+"""
+import logging
+import math
+
+from threading import Event, Lock, Thread
+from typing import Callable, List, Type
+
+import twitlib.metrics as metrics
+import twitlib.util as util
+from twitlib.streaming import WorkerThread
+
+log = logging.getLogger('twitlib')
+
+class WorkerPool():
+    """
+    Keeps between `min_workers` and `max_workers` threads of a WorkerThread
+    subclass consuming its class queue. A monitor thread checks the pool
+    every `interval` seconds:
+
+        -   If the queue holds more than `backlog` statuses per worker, the
+            pool grows to one worker per `backlog` queued statuses.
+
+        -   If the mean process_status() latency since the last check
+            exceeds `latency_target` and statuses are queued, one worker is
+            added.
+
+        -   If the queue has been empty for `idle_checks` checks in a row,
+            one worker is retired by enqueueing None.
+
+    Workers that die are replaced up to `min_workers`. Latency is read from
+    the twitlib_process_seconds histogram, see twitlib.metrics.
+    """
+
+    def __init__(
+            self,
+            thread_cls: Type[WorkerThread],
+            factory: Callable[[int], WorkerThread] = None,
+            min_workers: int = 1,
+            max_workers: int = 8,
+            backlog: int = 10,
+            latency_target: float = None,
+            idle_checks: int = 5,
+            interval: float = 1.0):
+        """
+        Args
+        ===
+            thread_cls : type
+        WorkerThread subclass whose queue the pool consumes
+
+            factory : callable
+        Called with a worker index to create each worker, which must be an
+        unstarted instance of `thread_cls`. Defaults to thread_cls() with a
+        name made of the class name and index.
+
+            min_workers : int >= 0
+        Workers kept running when idle
+
+            max_workers : int >= min_workers, > 0
+        Upper bound on running workers
+
+            backlog : int > 0
+        Queued statuses per worker that trigger growth
+
+            latency_target : float or None
+        Mean seconds per status above which a worker is added while
+        statuses are queued. None disables latency based growth.
+
+            idle_checks : int > 0
+        Consecutive checks with an empty queue before a worker is retired
+
+            interval : float > 0
+        Seconds between checks
+        """
+        if min_workers < 0:
+            raise ValueError('min_workers must be an int >= 0')
+        if max_workers < max(min_workers, 1):
+            raise ValueError('max_workers must be an int > 0 and >= min_workers')
+        if backlog <= 0:
+            raise ValueError('backlog must be an int > 0')
+        if idle_checks <= 0:
+            raise ValueError('idle_checks must be an int > 0')
+        if interval <= 0:
+            raise ValueError('interval must be > 0')
+
+        self._thread_cls = thread_cls
+        self._factory = factory if factory is not None else self._default_factory
+        self._min_workers = min_workers
+        self._max_workers = max_workers
+        self._backlog = backlog
+        self._latency_target = latency_target
+        self._idle_checks = idle_checks
+        self._interval = interval
+
+        self._lock = Lock()
+        self._workers = []
+        self._created = 0
+        self._retiring = 0
+        self._idle = 0
+        self._stop = Event()
+        self._monitor = None
+
+        name = thread_cls.__name__
+        self._latency = metrics.histogram('twitlib_process_seconds', worker=name)
+        self._last_latency = self._latency.value()
+        metrics.gauge('twitlib_pool_workers', lambda: self.size, worker=name)
+
+    @property
+    def thread_cls(self) -> Type[WorkerThread]: return self._thread_cls
+
+    @property
+    def min_workers(self) -> int: return self._min_workers
+
+    @property
+    def max_workers(self) -> int: return self._max_workers
+
+    @property
+    def workers(self) -> List[WorkerThread]:
+        """Running workers, including any about to retire"""
+        with self._lock:
+            self._prune()
+            return list(self._workers)
+
+    @property
+    def size(self) -> int:
+        """Running workers, not counting those being retired"""
+        with self._lock:
+            self._prune()
+            return len(self._workers) - self._retiring
+
+    def start(self) -> 'WorkerPool':
+        """Start `min_workers` workers and the monitor thread"""
+        self.scale_to(self._min_workers)
+        self._stop.clear()
+        self._monitor = Thread(
+                target=self._run,
+                name='%s-pool' % self._thread_cls.__name__,
+                daemon=True
+        )
+        self._monitor.start()
+        return self
+
+    def stop(self, timeout: float = None) -> List[WorkerThread]:
+        """
+        Stop the monitor and retire every worker. Workers finish the
+        statuses queued ahead of their None sentinel before exiting.
+
+        Args
+        ===
+            timeout : float or None
+        Seconds to wait for the workers to exit. None waits indefinitely.
+
+        Return: Workers still running when the timeout expired
+        """
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join()
+            self._monitor = None
+
+        self.scale_to(0)
+        return util.join_all(self.workers, timeout)
+
+    def scale_to(self, count: int) -> int:
+        """
+        Start or retire workers so that `count` are running, clamped to
+        [0, max_workers].
+
+        Return: The number of workers after scaling
+        """
+        count = max(0, min(count, self._max_workers))
+        with self._lock:
+            self._prune()
+            size = len(self._workers) - self._retiring
+
+            for _ in range(count - size):
+                worker = self._factory(self._created)
+                self._created += 1
+                worker.start()
+                self._workers.append(worker)
+
+            retire = max(0, size - count)
+            self._retiring += retire
+
+        # Outside the lock, enqueue blocks while a bounded queue is full
+        for _ in range(retire):
+            self._thread_cls.enqueue(None)
+
+        if count != size:
+            log.info('Scaled %s pool from %i to %i workers', self._thread_cls.__name__, size, count)
+        return count
+
+    def check(self) -> int:
+        """
+        Grow or shrink the pool once, as done by the monitor thread.
+        Return: The number of workers after the check
+        """
+        depth = self._thread_cls.QUEUE.qsize()
+        size = self.size
+        latency = self._mean_latency()
+
+        if depth == 0:
+            self._idle += 1
+        else:
+            self._idle = 0
+
+        target = max(size, self._min_workers)
+        if depth > self._backlog * size:
+            target = max(target, math.ceil(depth / self._backlog))
+        elif depth and self._latency_target is not None \
+                and latency is not None and latency > self._latency_target:
+            target = max(target, size + 1)
+        elif self._idle >= self._idle_checks and size > self._min_workers:
+            target = size - 1
+            self._idle = 0
+
+        if target != size:
+            return self.scale_to(target)
+        return size
+
+    def _mean_latency(self) -> float:
+        """Mean seconds per status processed since the last call, or None"""
+        value = self._latency.value()
+        last, self._last_latency = self._last_latency, value
+        count = value['count'] - last['count']
+        return (value['sum'] - last['sum']) / count if count > 0 else None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            try:
+                self.check()
+            except Exception:
+                log.exception('Failed to scale %s pool', self._thread_cls.__name__)
+
+    def _prune(self) -> None:
+        """
+        Forget workers that exited. Each worker that exited on a None
+        sentinel cancels a pending retirement, workers that crashed or
+        ran out of loops leave their sentinel queued for another worker.
+        """
+        alive = [w for w in self._workers if w.is_alive()]
+        retired = sum(1 for w in self._workers if not w.is_alive() and w.stopped)
+        self._retiring = max(0, self._retiring - retired)
+        self._workers = alive
+
+    def _default_factory(self, index: int) -> WorkerThread:
+        return self._thread_cls(name='%s-%i' % (self._thread_cls.__name__, index))
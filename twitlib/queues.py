@@ -0,0 +1,355 @@
+"""
+Job queues for worker threads. Provides a bounded queue with a
+selectable policy for handling statuses that arrive while the queue
+is full, and an optional priority order.
+"""
+import heapq
+import itertools
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+from collections import deque
+from queue import Queue
+from typing import Callable, Tuple, Union
+
+from twitter.models import Status
+
+import twitlib.codec as codec
+import twitlib.util as util
+from twitlib.spool import Spool
+
+log = logging.getLogger('twitlib')
+
+# Overflow policies
+BLOCK = 'block'
+DROP_NEWEST = 'drop_newest'
+DROP_OLDEST = 'drop_oldest'
+SPILL = 'spill'
+
+POLICIES = (BLOCK, DROP_NEWEST, DROP_OLDEST, SPILL)
+
+# Maps a status to its priority, higher is dequeued sooner
+PriorityFunc = Callable[[Status], float]
+
+class StatusQueue(Queue):
+    """
+    Queue of statuses with an optional capacity and overflow policy.
+    Inherits from queue.Queue, so blocking put()/get() semantics and
+    task_done()/join() accounting are unchanged for the `block` policy.
+
+    Overflow policies
+    ===
+    block :
+        put() blocks until room is available (queue.Queue behavior)
+
+    drop_newest :
+        The status being enqueued is discarded
+
+    drop_oldest :
+        The status at the head of the queue is discarded to make room
+
+    spill :
+        The status is appended to a file in `spill_dir` and read back
+        into the queue in FIFO order as room becomes available
+
+    The None sentinel used to stop worker threads is never dropped or
+    spilled, it always blocks until room is available.
+
+    Priority order
+    ===
+    With a `priority` function, statuses are dequeued by arrival time less
+    `aging` seconds per unit of priority instead of in FIFO order. A status
+    of priority 1 is served before priority 0 statuses that arrived up to
+    `aging` seconds before it, but not before older ones, so low priority
+    statuses wait at most `aging` times the highest priority in the queue
+    and are never starved. The `drop_oldest` policy drops the status that
+    would be served last, and spilled statuses are prioritized when read
+    back. The None sentinel is served after every queued status.
+
+    With a twitlib.spool.Spool, each status is logged when it is put and
+    acknowledged when task_done() is called for it, by the thread that got
+    it from the queue. Dropped statuses are acknowledged when dropped.
+    Statuses pending in the spool are queued on construction, regardless
+    of `maxsize`, so work unfinished when the process died is redone.
+    """
+
+    def __init__(
+            self,
+            maxsize: int = 0,
+            overflow: str = BLOCK,
+            spill_dir: str = None,
+            spool: Spool = None,
+            priority: PriorityFunc = None,
+            aging: float = 60.0):
+        """
+        Args
+        ===
+            maxsize : int >= 0
+        Maximum number of statuses held in memory. Defaults to 0, no limit.
+
+            overflow : str
+        Policy applied when a status is enqueued to a full queue. One of
+        'block', 'drop_newest', 'drop_oldest' or 'spill'.
+
+            spill_dir : str
+        Directory for the spill file of the `spill` policy, created on
+        first spill if it does not exist. Defaults to the system temp
+        directory.
+
+            spool : twitlib.spool.Spool
+        Write-ahead log of queued statuses. Defaults to None, no spool.
+
+            priority : function(Status) -> float
+        Priority of a status, see Priority order. Defaults to None, FIFO.
+
+            aging : float > 0
+        Seconds of queue time a unit of priority is worth. Defaults to 60.
+        """
+        if overflow not in POLICIES:
+            raise ValueError('overflow must be one of %s' % (POLICIES,))
+        if maxsize < 0:
+            raise ValueError('maxsize must be an int >= 0')
+        if aging <= 0:
+            raise ValueError('aging must be > 0')
+
+        # Set before Queue.__init__(), which calls _init()
+        self._priority = priority
+        self._aging = aging
+        self._seq = itertools.count()
+
+        super().__init__(maxsize)
+        self._overflow = overflow
+        self._spill_dir = spill_dir
+        self._spill = None
+        self._spill_count = 0
+        self._dropped = 0
+        self._spilled = 0
+
+        self._spool = spool
+        self._taken = threading.local()
+        if spool is not None:
+            for status in spool.pending():
+                self._push(status)
+                self.unfinished_tasks += 1
+
+    @property
+    def overflow(self) -> str: return self._overflow
+
+    @property
+    def dropped(self) -> int: return self._dropped
+
+    @property
+    def spilled(self) -> int: return self._spilled
+
+    @property
+    def pending_spill(self) -> int: return self._spill_count
+
+    @property
+    def spool(self) -> Union[Spool, None]: return self._spool
+
+    @property
+    def priority(self) -> Union[PriorityFunc, None]: return self._priority
+
+    @property
+    def aging(self) -> float: return self._aging
+
+    def put(self, item: Union[Status, None], block: bool = True, timeout: float = None) -> None:
+        """
+        Put a status in the queue, applying the overflow policy if the
+        queue is full. Arguments match queue.Queue.put(). With the
+        `block` policy or when enqueueing None, block/timeout are
+        respected and queue.Full may be raised.
+
+        With a spool, a status is logged under the queue lock once it has
+        been queued or spilled, so the spool records statuses in queue
+        order and never holds those discarded by `drop_newest`.
+        """
+        if self._overflow == BLOCK or item is None:
+            return super().put(item, block=block, timeout=timeout)
+
+        must_block = False
+        with self.not_full:
+            if not self._full():
+                self._put(item)
+            elif self._overflow == DROP_NEWEST:
+                self._count_dropped(item, logged=False)
+                return
+            elif self._overflow == SPILL:
+                self._log(item)
+                self._spill_write(item)
+            elif self._drop_oldest():
+                self._put(item)
+            else:
+                # Only sentinels are queued so nothing can be dropped
+                must_block = True
+
+            if not must_block:
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+                return
+
+        super().put(item, block=block, timeout=timeout)
+
+    def get(self, block: bool = True, timeout: float = None) -> Union[Status, None]:
+        """
+        Remove and return an item from the queue, as queue.Queue.get().
+        With a spool, the item is remembered for the calling thread until
+        it calls task_done().
+        """
+        item = super().get(block=block, timeout=timeout)
+        if self._spool is not None:
+            self._taken_items().append(item)
+        return item
+
+    def task_done(self) -> None:
+        """
+        Indicate that a formerly enqueued task is complete, as
+        queue.Queue.task_done(). With a spool, the oldest item the calling
+        thread got and has not yet completed is acknowledged.
+        """
+        super().task_done()
+        if self._spool is None:
+            return
+
+        taken = self._taken_items()
+        item = taken.popleft() if taken else None
+        if item is not None:
+            self._spool.ack(item.id)
+
+    def _taken_items(self) -> deque:
+        try:
+            return self._taken.items
+        except AttributeError:
+            self._taken.items = deque()
+            return self._taken.items
+
+    def _init(self, maxsize: int) -> None:
+        if self._priority is None:
+            super()._init(maxsize)
+        else:
+            # Heap of (key, sequence, item), see _key()
+            self.queue = []
+
+    def _put(self, item: Union[Status, None]) -> None:
+        """Queue an item accepted by put(), called with the queue lock held"""
+        self._log(item)
+        self._push(item)
+
+    def _log(self, item: Union[Status, None]) -> None:
+        if self._spool is not None and item is not None:
+            self._spool.append(item)
+
+    def _push(self, item: Union[Status, None]) -> None:
+        if self._priority is None:
+            super()._put(item)
+        else:
+            heapq.heappush(self.queue, (self._key(item), next(self._seq), item))
+
+    def _key(self, item: Union[Status, None]) -> float:
+        if item is None:
+            return math.inf
+        try:
+            priority = self._priority(item)
+        except Exception:
+            log.exception('Priority function failed for status %s', getattr(item, 'id', None))
+            priority = 0
+        return time.monotonic() - self._aging * priority
+
+    def _full(self) -> bool:
+        if self.maxsize <= 0:
+            return False
+        return self._spill_count > 0 or self._qsize() >= self.maxsize
+
+    def _get(self) -> Union[Status, None]:
+        if self._priority is None:
+            item = super()._get()
+        else:
+            item = heapq.heappop(self.queue)[-1]
+        if self._spill_count:
+            # Logged when spilled
+            self._push(self._spill_read())
+        return item
+
+    def _drop_oldest(self) -> bool:
+        if self._priority is not None:
+            return self._drop_last()
+        for i, queued in enumerate(self.queue):
+            if queued is not None:
+                del self.queue[i]
+                self.unfinished_tasks -= 1
+                self._count_dropped(queued)
+                return True
+        return False
+
+    def _drop_last(self) -> bool:
+        """Drop the status that would be dequeued last from a priority queue"""
+        entries = [e for e in self.queue if e[-1] is not None]
+        if not entries:
+            return False
+        last = max(entries)
+        self.queue.remove(last)
+        heapq.heapify(self.queue)
+        self.unfinished_tasks -= 1
+        self._count_dropped(last[-1])
+        return True
+
+    def _count_dropped(self, item: Status, logged: bool = True) -> None:
+        self._dropped += 1
+        if self._spool is not None and logged:
+            self._spool.ack(item.id)
+        log.debug('Queue full, dropped status %s', getattr(item, 'id', None))
+
+    def _spill_write(self, item: Status) -> None:
+        if self._spill is None:
+            if self._spill_dir:
+                os.makedirs(self._spill_dir, exist_ok=True)
+            self._spill = tempfile.TemporaryFile(
+                    mode='w+b',
+                    dir=self._spill_dir,
+                    prefix='twitlib_spill_'
+            )
+            self._spill_read_pos = 0
+
+        self._spill.seek(0, os.SEEK_END)
+        self._spill.write(codec.encode_status(item) + b'\n')
+        self._spill_count += 1
+        self._spilled += 1
+        log.debug('Queue full, spilled status %s to disk', getattr(item, 'id', None))
+
+    def _spill_read(self) -> Status:
+        self._spill.seek(self._spill_read_pos)
+        line = self._spill.readline()
+        self._spill_read_pos = self._spill.tell()
+        self._spill_count -= 1
+
+        # Reclaim disk space once everything spilled has been read back
+        if not self._spill_count:
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spill_read_pos = 0
+
+        return util.status_from_dict(codec.loads(line))
+
+def weighted(*rules: Tuple[PriorityFunc, float]) -> PriorityFunc:
+    """
+    Build a priority function from (function, weight) pairs. The priority
+    of a status is the sum of each function's result times its weight, so
+    filter functions add their weight when they pass, e.g.
+
+        weighted((partial(tweeted_by, id=VIP_ID), 10), (has_media, 1), (log_followers, 0.5))
+
+    Return: function(Status) -> float
+    """
+    def priority(status: Status) -> float:
+        return sum(float(func(status) or 0) * weight for func, weight in rules)
+    return priority
+
+def log_followers(status: Status) -> float:
+    """Priority of a status by the order of magnitude of its author's followers"""
+    user = status.user
+    followers = getattr(user, 'followers_count', None) if user is not None else None
+    return math.log10(followers + 1) if followers else 0.0
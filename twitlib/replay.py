@@ -0,0 +1,251 @@
+"""
+Replay of archived statuses. Files written by WriterThread, one UTF-32
+JSON status per file, compact raw JSON files or JSON Lines segments, are
+read back in parallel and fed to a listener such as a Dispatcher, either
+as fast as possible or paced by the time the statuses were tweeted.
+"""
+import fnmatch
+import json
+import logging
+import os
+import re
+import time
+
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from threading import Event
+from typing import Iterable, Iterator, List, Union
+
+from twitter.models import Status
+
+import twitlib.codec as codec
+import twitlib.metrics as metrics
+import twitlib.util as util
+
+log = logging.getLogger('twitlib')
+
+# Files replayed from directories by default
+PATTERNS = ('*.json', '*.jsonl')
+
+# Byte order marks written by the utf-32 codec, see WriterThread.write_status()
+UTF32_BOMS = (b'\xff\xfe\x00\x00', b'\x00\x00\xfe\xff')
+
+# Ids below this were assigned before Twitter switched to snowflake ids
+FIRST_SNOWFLAKE_ID = 29700859247
+
+_REPLAYED = metrics.counter('twitlib_replayed_total')
+_UNREADABLE = metrics.counter('twitlib_replay_unreadable_total')
+
+class Replayer():
+    """
+    Feeds archived statuses to a listener. Files are read by a pool of
+    `readers` threads, up to `read_ahead` files ahead of the status being
+    replayed, and statuses are replayed in file order.
+
+    With `speed` set, statuses are paced by their tweet times scaled by
+    `speed`, e.g. 1.0 for the recorded rate or 10.0 for ten times faster.
+    A status older than the one before it is replayed immediately, so
+    files should be given in chronological order. Without `speed`,
+    statuses are replayed as fast as the listener accepts them, which
+    makes a replay a load test that needs no network access.
+    """
+
+    def __init__(
+            self,
+            listener,
+            speed: float = None,
+            readers: int = 4,
+            read_ahead: int = 16,
+            lazy: bool = True,
+            patterns: Iterable[str] = PATTERNS):
+        """
+        Args
+        ===
+            listener : BaseListener
+        Receives each status through on_status()
+
+            speed : float > 0 or None
+        Multiple of the recorded rate to replay at. Defaults to None, as
+        fast as possible.
+
+            readers : int > 0
+        Threads reading files
+
+            read_ahead : int > 0
+        Files read ahead of the status being replayed
+
+            lazy : bool
+        If True, statuses stored as raw JSON are twitlib.status.LazyStatus
+        objects, see twitlib.codec.decode_status()
+
+            patterns : list(str)
+        Glob patterns of the files replayed from directories
+        """
+        if speed is not None and speed <= 0:
+            raise ValueError('speed must be > 0 or None')
+        if readers <= 0:
+            raise ValueError('readers must be an int > 0')
+        if read_ahead <= 0:
+            raise ValueError('read_ahead must be an int > 0')
+
+        self._listener = listener
+        self._speed = speed
+        self._readers = readers
+        self._read_ahead = read_ahead
+        self._lazy = lazy
+        self._patterns = tuple(patterns)
+        self._stop = Event()
+        self._replayed = 0
+
+    @property
+    def listener(self): return self._listener
+
+    @property
+    def speed(self) -> Union[float, None]: return self._speed
+
+    @property
+    def replayed(self) -> int:
+        """Statuses replayed by the last call to replay()"""
+        return self._replayed
+
+    def replay(self, paths: Union[str, List[str]]) -> int:
+        """
+        Replay the statuses in files, or in matching files found under
+        directories, until all are replayed or stop() is called.
+
+        Args
+        ===
+            paths : str or list(str)
+        Files and directories to replay
+
+        Return: The number of statuses replayed
+        """
+        self._stop.clear()
+        self._replayed = 0
+        start = None
+
+        files = find_files(paths, self._patterns)
+        with ThreadPoolExecutor(self._readers, thread_name_prefix='replay') as pool:
+            for statuses in _read_ahead(pool, files, self._read_ahead, self._lazy):
+                for status in statuses:
+                    if self._stop.is_set():
+                        return self._replayed
+
+                    if self._speed is not None:
+                        start = self._pace(status, start)
+                    self._listener.on_status(status)
+                    self._replayed += 1
+                    _REPLAYED.inc()
+
+                if self._stop.is_set():
+                    break
+
+        log.info('Replayed %i statuses', self._replayed)
+        return self._replayed
+
+    def stop(self) -> None:
+        """Stop replay() after the current status"""
+        self._stop.set()
+
+    def _pace(self, status: Status, start: tuple) -> tuple:
+        """
+        Wait until a status is due, relative to the first status replayed.
+        Return: The (wall clock, tweet time) pair of the first status
+        """
+        tweeted = status_time(status)
+        if tweeted is None:
+            return start
+        if start is None:
+            return (time.monotonic(), tweeted)
+
+        due = start[0] + (tweeted - start[1]) / self._speed
+        delay = due - time.monotonic()
+        if delay > 0:
+            self._stop.wait(delay)
+        return start
+
+def find_files(paths: Union[str, List[str]], patterns: Iterable[str] = PATTERNS) -> Iterator[str]:
+    """
+    Iterate over files and the files under directories that match any of
+    `patterns`. Files within a directory are sorted by name with numbers
+    compared by value, so status_{id}.json files are in id order.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort(key=_natural_key)
+            for name in sorted(filenames, key=_natural_key):
+                if any(fnmatch.fnmatch(name, p) for p in patterns):
+                    yield os.path.join(dirpath, name)
+
+def read_file(path: str, lazy: bool = True) -> List[Status]:
+    """
+    Read the statuses in a file written by WriterThread: a UTF-32 JSON file
+    written by write_status(), a raw UTF-8 JSON file written by write_raw(),
+    or a JSON Lines segment. Malformed lines of a segment are skipped.
+
+    Return: The statuses in file order
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if data[:4] in UTF32_BOMS:
+        return [util.status_from_dict(json.loads(data.decode('utf-32')))]
+
+    if not path.endswith('.jsonl'):
+        status = codec.decode_status(data, lazy)
+        return [status] if status is not None else []
+
+    statuses = []
+    for i, line in enumerate(data.splitlines()):
+        try:
+            status = codec.decode_status(line, lazy)
+        except ValueError:
+            log.warning('Skipped malformed line %i of %s', i + 1, path)
+            continue
+        if status is not None:
+            statuses.append(status)
+    return statuses
+
+def status_time(status: Status) -> Union[float, None]:
+    """
+    Gets the epoch time a status was tweeted, to the millisecond from a
+    snowflake id, otherwise to the second from `created_at`.
+
+    Return: Seconds since the epoch, or None if unknown
+    """
+    if status.id and status.id >= FIRST_SNOWFLAKE_ID:
+        return ((status.id >> 22) + util.SNOWFLAKE_EPOCH_MS) / 1000
+    if status.created_at:
+        return status.created_at_in_seconds
+    return None
+
+def _read_ahead(pool: Executor, files: Iterator[str], depth: int, lazy: bool) -> Iterator[List[Status]]:
+    """Read files in a pool, `depth` at a time, yielding their statuses in order"""
+    pending = deque()
+
+    def submit():
+        path = next(files, None)
+        if path is not None:
+            pending.append((path, pool.submit(read_file, path, lazy)))
+
+    for _ in range(depth):
+        submit()
+
+    while pending:
+        path, future = pending.popleft()
+        submit()
+        try:
+            yield future.result()
+        except (OSError, ValueError) as e:
+            _UNREADABLE.inc()
+            log.warning('Skipped unreadable file %s: %s', path, e)
+
+def _natural_key(name: str) -> list:
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
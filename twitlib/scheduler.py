@@ -0,0 +1,361 @@
+"""
+Rate limited posting for MirrorThread. A PostScheduler posts prepared
+tweets from a single thread at the rate allowed by Twitter, so mirror
+workers hand off a post and move on to downloading and uploading media
+for the next status instead of blocking in Api.PostUpdate().
+"""
+import heapq
+import itertools
+import logging
+import time
+
+from concurrent.futures import CancelledError, Future
+from threading import Condition, Thread
+from typing import Callable, List, Tuple, Union
+
+import twitter
+from twitter import Api
+from twitter.models import Status
+
+import twitlib.metrics as metrics
+
+log = logging.getLogger('twitlib')
+
+# Twitter allows 300 tweets per account every 3 hours
+POST_RATE = 300 / (3 * 3600)
+
+# Twitter error codes for exceeded rate limits and the status update limit
+RATE_LIMIT_CODES = (88, 185)
+
+# Endpoint whose x-rate-limit-* headers python-twitter records in Api.rate_limit
+UPDATE_PATH = '/statuses/update.json'
+
+_MIRROR_POSTS = metrics.counter('twitlib_mirror_posts_total')
+_MIRROR_FAILURES = metrics.counter('twitlib_mirror_failures_total')
+_MIRROR_SECONDS = metrics.histogram('twitlib_mirror_post_seconds')
+_RATE_LIMITED = metrics.counter('twitlib_mirror_rate_limited_total')
+
+class TokenBucket():
+    """
+    Token bucket holding at most `capacity` tokens, refilled at `rate`
+    tokens per second. Not thread safe, callers must serialize access.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        """
+        Args
+        ===
+            rate : float > 0
+        Tokens added per second
+
+            capacity : float >= 1
+        Maximum tokens held, i.e. the largest burst allowed. The bucket
+        starts full.
+        """
+        if rate <= 0:
+            raise ValueError('rate must be > 0')
+        if capacity < 1:
+            raise ValueError('capacity must be >= 1')
+
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    @property
+    def rate(self) -> float: return self._rate
+
+    @property
+    def capacity(self) -> float: return self._capacity
+
+    @property
+    def tokens(self) -> float:
+        """Tokens currently available"""
+        self._refill(time.monotonic())
+        return self._tokens
+
+    def take(self, now: float = None) -> float:
+        """
+        Take one token if available.
+        Return: 0 if a token was taken, otherwise seconds until one is available
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now + (1 - self._tokens) / self._rate
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self._rate
+
+    def pause(self, seconds: float, now: float = None) -> None:
+        """Empty the bucket and stop refilling it for `seconds`"""
+        now = time.monotonic() if now is None else now
+        self._tokens = 0.0
+        self._updated = now
+        self._paused_until = now + seconds
+
+    def limit(self, remaining: int, reset_in: float, now: float = None) -> None:
+        """
+        Apply a quota reported by the server. At most `remaining` tokens
+        are held, and if none remain the bucket is paused for `reset_in`
+        seconds.
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if remaining <= 0:
+            self.pause(max(reset_in, 0.0), now)
+        else:
+            self._tokens = min(self._tokens, remaining)
+
+    def _refill(self, now: float) -> None:
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self._capacity, self._tokens + (now - start) * self._rate)
+        self._updated = max(self._updated, now)
+
+class PostScheduler():
+    """
+    Posts tweets from a daemon thread, taking a token from a TokenBucket
+    for each post. Pending posts are ordered by priority, highest first,
+    then by submission order.
+
+    After each post, the quota Twitter reports in the x-rate-limit-*
+    headers, as recorded by python-twitter in Api.rate_limit, is applied
+    to the bucket. When Twitter reports a rate limit, the post is retried
+    once the reported window resets, or after `retry_after` seconds if no
+    reset time is known, and posting pauses until then.
+
+    Build the Api with sleep_on_rate_limit=False, the scheduler does its
+    own waiting.
+    """
+
+    def __init__(
+            self,
+            api: Api,
+            rate: float = POST_RATE,
+            burst: int = 10,
+            priority: Callable[[Status], float] = None,
+            max_pending: int = 0,
+            retry_after: float = 900):
+        """
+        Args
+        ===
+            api : twitter.Api
+        Authenticated Api used to post
+
+            rate : float > 0
+        Posts per second allowed on average, defaults to Twitter's limit
+
+            burst : int >= 1
+        Posts allowed back to back after a quiet period
+
+            priority : callable
+        Called with the mirrored status to get the priority of its post,
+        higher posts first. Defaults to None, posts are made in order.
+
+            max_pending : int >= 0
+        Posts held before submit() blocks, 0 for no limit
+
+            retry_after : float > 0
+        Seconds to pause posting when rate limited and Twitter gave no
+        reset time
+        """
+        if max_pending < 0:
+            raise ValueError('max_pending must be an int >= 0')
+        if retry_after <= 0:
+            raise ValueError('retry_after must be > 0')
+
+        self._api = api
+        self._bucket = TokenBucket(rate, burst)
+        self._priority = priority
+        self._max_pending = max_pending
+        self._retry_after = retry_after
+
+        self._heap = []
+        self._order = itertools.count()
+        self._cond = Condition()
+        self._closed = False
+        self._aborted = False
+
+        metrics.gauge('twitlib_mirror_pending', lambda: self.pending)
+        self._thread = Thread(target=self._run, name='PostScheduler', daemon=True)
+        self._thread.start()
+
+    @property
+    def api(self) -> Api: return self._api
+
+    @property
+    def bucket(self) -> TokenBucket: return self._bucket
+
+    @property
+    def pending(self) -> int:
+        """Posts waiting for quota"""
+        return len(self._heap)
+
+    def quota(self) -> Union[Tuple[int, float], None]:
+        """
+        Quota of the status update endpoint reported by Twitter.
+        Return: Remaining posts and seconds until the window resets, or
+        None if no current quota is known
+        """
+        rate_limit = getattr(self._api, 'rate_limit', None)
+        base_url = getattr(self._api, 'base_url', None)
+        if rate_limit is None or base_url is None:
+            return None
+
+        limit = rate_limit.get_limit(base_url + UPDATE_PATH)
+        reset_in = limit.reset - time.time()
+        # No headers were seen, or the window they describe has passed
+        if not limit.limit or reset_in <= 0:
+            return None
+        return limit.remaining, reset_in
+
+    def submit(
+            self,
+            text: str,
+            media: List[int] = None,
+            status: Status = None,
+            priority: float = None) -> Future:
+        """
+        Queue a post. Blocks while `max_pending` posts are waiting.
+
+        Args
+        ===
+            text : str
+        Text of the tweet
+
+            media : list(int)
+        Ids of media already uploaded with the Api
+
+            status : twitter.Status
+        The status being mirrored, passed to the priority function
+
+            priority : float
+        Overrides the priority given by the priority function
+
+        Raises
+        ===
+            RuntimeError :
+        The scheduler was closed
+
+        Return: Future holding the posted Status
+        """
+        if priority is None:
+            priority = self._priority(status) if self._priority and status is not None else 0
+
+        future = Future()
+        with self._cond:
+            while self._max_pending and len(self._heap) >= self._max_pending and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                raise RuntimeError('PostScheduler is closed')
+
+            heapq.heappush(self._heap, (-priority, next(self._order), text, media, future))
+            self._cond.notify_all()
+        return future
+
+    def close(self, timeout: float = None) -> int:
+        """
+        Stop accepting posts and wait for pending posts to be made.
+
+        Args
+        ===
+            timeout : float or None
+        Seconds to wait. Posts still pending afterwards are cancelled.
+        None waits indefinitely.
+
+        Return: Number of posts cancelled
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            return 0
+
+        with self._cond:
+            self._aborted = True
+            cancelled = [entry[-1] for entry in self._heap]
+            self._heap = []
+            self._cond.notify_all()
+
+        for future in cancelled:
+            # Posts requeued after a rate limit are already running
+            if not future.cancel():
+                future.set_exception(CancelledError())
+        log.warning('PostScheduler closed with %i posts unsent', len(cancelled))
+        return len(cancelled)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap and not self._closed:
+                    self._cond.wait()
+                if not self._heap or self._aborted:
+                    return
+
+                wait = self._bucket.take()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                entry = heapq.heappop(self._heap)
+                self._cond.notify_all()
+
+            self._post(entry)
+
+    def _post(self, entry: tuple) -> None:
+        _, _, text, media, future = entry
+        # Claims the future so a later cancel() fails instead of racing set_result()
+        if not future.running() and not future.set_running_or_notify_cancel():
+            return
+
+        try:
+            with _MIRROR_SECONDS.time():
+                result = self._api.PostUpdate(status=text, media=media or None)
+
+        except twitter.TwitterError as e:
+            if not is_rate_limited(e):
+                self._fail(future, e)
+                return
+
+            _RATE_LIMITED.inc()
+            quota = self.quota()
+            pause = quota[1] if quota is not None and quota[0] <= 0 else self._retry_after
+            log.warning('Rate limited, pausing posts for %.0fs', pause)
+            with self._cond:
+                self._bucket.pause(pause)
+                if self._aborted:
+                    future.set_exception(CancelledError())
+                else:
+                    heapq.heappush(self._heap, entry)
+
+        except Exception as e:
+            self._fail(future, e)
+
+        else:
+            _MIRROR_POSTS.inc()
+            future.set_result(result)
+
+            quota = self.quota()
+            if quota is not None:
+                with self._cond:
+                    self._bucket.limit(*quota)
+
+    @staticmethod
+    def _fail(future: Future, e: Exception) -> None:
+        _MIRROR_FAILURES.inc()
+        log.error('Failed to post: %s', e)
+        future.set_exception(e)
+
+def is_rate_limited(e: twitter.TwitterError) -> bool:
+    """Checks the error codes Twitter returned for a rate limit"""
+    errors = e.message
+    if isinstance(errors, dict):
+        errors = [errors]
+    if not isinstance(errors, list):
+        return False
+    return any(isinstance(err, dict) and err.get('code') in RATE_LIMIT_CODES for err in errors)
@@ -0,0 +1,200 @@
+"""
+Append-only JSON Lines writer that rolls statuses into a sequence of
+segment files, as an alternative to writing one file per status.
+"""
+import atexit
+import logging
+import os
+import time
+import weakref
+
+from threading import Lock, Timer
+from typing import List
+
+from twitter.models import Status
+
+import twitlib.codec as codec
+
+log = logging.getLogger('twitlib')
+
+# Seconds between flushes of buffered lines when fsync_interval is None
+FLUSH_INTERVAL = 1.0
+
+# Writers with a segment open, closed at interpreter exit
+_open_writers = weakref.WeakSet()
+
+@atexit.register
+def _close_all() -> None:
+    for writer in list(_open_writers):
+        writer.close()
+
+class SegmentWriter():
+    """
+    Appends statuses as compact UTF-8 JSON Lines to a segment file, keeping
+    a single file handle open. A new segment is started when the current
+    one exceeds `max_bytes` or has been open for `max_seconds`. Statuses are
+    written one per line with twitlib.codec.encode_status(), so the raw JSON
+    received from Twitter is used when available.
+
+    Lines still buffered when writes stop are flushed by a timer after at
+    most `fsync_interval` seconds, so a quiet stream does not hold them in
+    memory. Open segments are closed when the interpreter exits.
+    """
+
+    def __init__(
+            self,
+            dirname: str = '',
+            format: str = 'segment_{thread}_{time}_{index}.jsonl',
+            max_bytes: int = 64 * 1024 * 1024,
+            max_seconds: float = 3600,
+            fsync_interval: float = 1.0,
+            thread: str = ''):
+        """
+        Args
+        ===
+            dirname : str
+        Directory that segment files are written to
+
+            format : str
+        Filename format for segment files. May reference {thread}, the
+        owning thread name, {time}, the epoch second the segment was opened,
+        and {index}, a count of segments opened by this writer.
+
+            max_bytes : int or None
+        Rotate after a segment reaches this size. None disables size rotation.
+
+            max_seconds : float or None
+        Rotate after a segment has been open this long. None disables time
+        based rotation.
+
+            fsync_interval : float or None
+        Minimum seconds between fsync() calls on the open segment. 0 will
+        fsync after every write, None leaves syncing to the OS.
+
+            thread : str
+        Name of the owning thread, used in segment filenames
+        """
+        self.dirname = dirname
+        self.format = format
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.fsync_interval = fsync_interval
+        self.thread = thread
+
+        self._lock = Lock()
+        self._file = None
+        self._path = None
+        self._index = 0
+        self._opened = 0.0
+        self._synced = 0.0
+        self._timer = None
+
+    @property
+    def path(self) -> str:
+        """Path of the open segment, or None if no segment is open"""
+        return self._path
+
+    def write(self, status: Status) -> str:
+        """
+        Append a status to the current segment, rotating first if needed.
+        Return: Path of the segment the status was written to
+        """
+        return self.write_many([status])[0]
+
+    def write_many(self, statuses: List[Status]) -> List[str]:
+        """
+        Append several statuses, syncing at most once for the whole batch.
+        Return: Path of the segment each status was written to
+        """
+        paths = []
+        with self._lock:
+            for status in statuses:
+                line = codec.encode_status(status)
+                self._maybe_rotate()
+                self._file.write(line + b'\n')
+                paths.append(self._path)
+            self._maybe_sync()
+        return paths
+
+    def flush(self, fsync: bool = True) -> None:
+        """Flush buffered lines to the OS, and optionally to disk"""
+        with self._lock:
+            if self._file:
+                self._sync(fsync)
+
+    def rotate(self) -> None:
+        """Close the current segment. The next write opens a new one."""
+        with self._lock:
+            self._close()
+
+    def close(self) -> None:
+        """Flush, sync and close the current segment"""
+        self.rotate()
+
+    def _maybe_rotate(self) -> None:
+        if self._file:
+            too_big = self.max_bytes is not None and self._file.tell() >= self.max_bytes
+            too_old = self.max_seconds is not None and time.time() - self._opened >= self.max_seconds
+            if too_big or too_old:
+                self._close()
+
+        if not self._file:
+            self._open()
+
+    def _maybe_sync(self) -> None:
+        if self.fsync_interval is None:
+            self._schedule_flush(FLUSH_INTERVAL)
+            return
+
+        remaining = self.fsync_interval - (time.monotonic() - self._synced)
+        if remaining <= 0:
+            self._sync(True)
+        else:
+            self._schedule_flush(remaining)
+
+    def _schedule_flush(self, delay: float) -> None:
+        if self._timer is None:
+            self._timer = Timer(delay, self._timed_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_flush(self) -> None:
+        with self._lock:
+            self._timer = None
+            if self._file:
+                self._sync(self.fsync_interval is not None)
+
+    def _cancel_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _sync(self, fsync: bool) -> None:
+        self._file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+            self._synced = time.monotonic()
+
+    def _open(self) -> None:
+        self._opened = time.time()
+        name = self.format.format(
+                thread=self.thread,
+                time=int(self._opened),
+                index=self._index
+        )
+        self._path = os.path.join(self.dirname, name) if self.dirname else name
+        self._file = open(self._path, 'ab')
+        self._index += 1
+        _open_writers.add(self)
+        log.debug('Opened segment %s', self._path)
+
+    def _close(self) -> None:
+        if not self._file:
+            return
+        self._cancel_flush()
+        self._sync(self.fsync_interval is not None)
+        self._file.close()
+        _open_writers.discard(self)
+        log.debug('Closed segment %s', self._path)
+        self._file = None
+        self._path = None
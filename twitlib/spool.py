@@ -0,0 +1,191 @@
+"""
+Write-ahead spool for statuses held in worker job queues. Statuses are
+appended to a log when enqueued and acknowledged when their job is done,
+so the statuses that were still queued or being processed when the
+process died can be replayed on restart.
+"""
+import logging
+import os
+
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import List
+
+from twitter.models import Status
+
+import twitlib.codec as codec
+import twitlib.util as util
+
+log = logging.getLogger('twitlib')
+
+# Record markers
+PUT = b'+'
+ACK = b'-'
+
+class Spool():
+    """
+    Append-only log of enqueued statuses. Each status is written as a put
+    record holding its compact UTF-8 JSON (see twitlib.codec), and each
+    acknowledgement as an ack record holding the status id. Statuses put
+    but not acknowledged are pending, and are read back in put order by
+    pending(). Records are written unbuffered, so they survive the death
+    of the process. Set `fsync` to also survive the loss of the machine.
+
+    The log is truncated whenever no statuses are pending, and compacted
+    to the pending statuses when it grows past `compact_bytes`.
+    """
+
+    def __init__(self, path: str, fsync: bool = False, compact_bytes: int = 64 * 1024 * 1024):
+        """
+        Args
+        ===
+            path : str
+        Log file, created with its directory if it does not exist. Any
+        statuses pending in an existing log are kept.
+
+            fsync : bool
+        If True, fsync() after every record
+
+            compact_bytes : int or None
+        Compact the log once it exceeds this size. None disables compaction.
+        """
+        if compact_bytes is not None and compact_bytes <= 0:
+            raise ValueError('compact_bytes must be an int > 0 or None')
+
+        self._path = path
+        self._fsync = fsync
+        self._compact_bytes = compact_bytes
+        self._next_compact = compact_bytes
+        self._lock = Lock()
+
+        util.makedirs(os.path.dirname(path))
+        self._outstanding = {}
+        self._file = None
+        self._open()
+
+    @property
+    def path(self) -> str: return self._path
+
+    @property
+    def size(self) -> int:
+        """Current size of the log in bytes"""
+        return self._size
+
+    def __len__(self) -> int:
+        """Number of pending statuses"""
+        return sum(self._outstanding.values())
+
+    def append(self, status: Status) -> None:
+        """Log a status as pending"""
+        record = PUT + codec.encode_status(status) + b'\n'
+        with self._lock:
+            self._write(record)
+            self._outstanding[status.id] = self._outstanding.get(status.id, 0) + 1
+
+    def ack(self, status_id: int) -> None:
+        """
+        Acknowledge the oldest pending status with the given id, so that it
+        is not replayed. Ids that are not pending are ignored.
+        """
+        with self._lock:
+            count = self._outstanding.get(status_id)
+            if not count:
+                log.debug('Status %s is not pending in %s', status_id, self._path)
+                return
+
+            if count > 1:
+                self._outstanding[status_id] = count - 1
+            else:
+                del self._outstanding[status_id]
+
+            if not self._outstanding:
+                self._truncate()
+            else:
+                self._write(ACK + str(status_id).encode('ascii') + b'\n')
+                if self._next_compact is not None and self._size > self._next_compact:
+                    self._compact()
+
+    def pending(self) -> List[Status]:
+        """
+        Return: Statuses logged and not yet acknowledged, in the order they
+        were logged
+        """
+        with self._lock:
+            return [util.status_from_dict(codec.loads(line)) for line in self._read()]
+
+    def close(self) -> None:
+        """Close the log file. Pending statuses remain in the log."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _open(self) -> None:
+        pending = self._read() if os.path.exists(self._path) else []
+        self._rewrite(pending)
+        for line in pending:
+            status_id = codec.loads(line)['id']
+            self._outstanding[status_id] = self._outstanding.get(status_id, 0) + 1
+        if pending:
+            log.info('Spool %s has %i pending statuses', self._path, len(pending))
+
+    def _read(self) -> List[bytes]:
+        """Return: JSON of the pending put records in the log, in order"""
+        puts = OrderedDict()
+        index = 0
+        with open(self._path, 'rb') as f:
+            for line in f:
+                # A record cut short by a crash is the last line and has no newline
+                if not line.endswith(b'\n'):
+                    log.warning('Ignoring incomplete record at end of %s', self._path)
+                    break
+
+                marker, body = line[:1], line[1:-1]
+                if marker == PUT:
+                    status_id = codec.loads(body)['id']
+                    puts.setdefault(status_id, deque()).append((index, body))
+                    index += 1
+                elif marker == ACK:
+                    waiting = puts.get(int(body))
+                    if waiting:
+                        waiting.popleft()
+                else:
+                    log.warning('Ignoring unknown record in %s', self._path)
+
+        records = sorted(record for waiting in puts.values() for record in waiting)
+        return [body for _, body in records]
+
+    def _rewrite(self, pending: List[bytes]) -> None:
+        """Replace the log with put records for `pending`"""
+        if self._file is not None:
+            self._file.close()
+
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            for body in pending:
+                f.write(PUT + body + b'\n')
+            f.flush()
+            if self._fsync:
+                os.fsync(f.fileno())
+        os.replace(temp_path, self._path)
+
+        self._file = open(self._path, 'ab', buffering=0)
+        self._size = self._file.tell()
+
+    def _compact(self) -> None:
+        self._rewrite(self._read())
+        self._next_compact = max(self._compact_bytes, 2 * self._size)
+        log.debug('Compacted spool %s to %i bytes', self._path, self._size)
+
+    def _truncate(self) -> None:
+        self._file.truncate(0)
+        self._size = 0
+        self._next_compact = self._compact_bytes
+        if self._fsync:
+            os.fsync(self._file.fileno())
+
+    def _write(self, record: bytes) -> None:
+        self._file.write(record)
+        self._size += len(record)
+        if self._fsync:
+            os.fsync(self._file.fileno())
@@ -0,0 +1,100 @@
+"""
+Lazily parsed statuses. LazyStatus wraps the raw dict received from the
+streaming API and builds the nested twitter model objects of a status
+only when they are first accessed, so statuses rejected by cheap filters
+are never fully parsed.
+"""
+from typing import Union
+
+from twitter.models import Status, User, Media, Hashtag, Url
+
+# Attributes of twitter.Status, all of which default to None
+PARAMS = frozenset(Status().param_defaults)
+
+class LazyStatus(Status):
+    """
+    A twitter.Status whose attributes are read from the raw status dict on
+    first access. Plain values such as `id` and `text` are looked up in the
+    dict, while `user`, `hashtags`, `media`, `urls` and `user_mentions` are
+    built as twitter models only when accessed. Nested `retweeted_status`
+    and `quoted_status` are themselves LazyStatus objects. Each attribute is
+    computed at most once.
+
+    Inherits from twitter.Status, so isinstance() checks, AsDict(),
+    AsJsonString() and equality behave as for a fully parsed status.
+    """
+
+    def __init__(self, data: dict = None):
+        """
+        Args
+        ===
+            data : dict
+        A status as decoded from the Twitter API JSON. Not copied, so it
+        must not be modified afterwards.
+        """
+        data = data if data is not None else {}
+
+        # Extended tweets from the streaming API, as in Status.NewFromJsonDict()
+        if 'extended_tweet' in data:
+            data = dict(data)
+            data.update(data['extended_tweet'])
+
+        self._json = data
+        self.param_defaults = _PARAM_DEFAULTS
+
+    @classmethod
+    def NewFromJsonDict(cls, data: dict, **kwargs) -> 'LazyStatus':
+        """Create a LazyStatus wrapping a JSON dict. Keyword args are ignored."""
+        return cls(data)
+
+    def __getattr__(self, name: str):
+        # Only called for attributes not yet computed. Results are stored
+        # on the instance, so later access is a plain attribute lookup.
+        if name in _BUILDERS:
+            value = _BUILDERS[name](self._json)
+        elif name in PARAMS:
+            value = self._json.get(name)
+        elif name == 'tweet_mode':
+            value = 'extended' if self._json.get('full_text') else 'compatibility'
+        else:
+            raise AttributeError(
+                "'%s' object has no attribute '%s'" % (self.__class__.__name__, name)
+            )
+        self.__dict__[name] = value
+        return value
+
+    def materialize(self) -> Status:
+        """
+        Return: A fully parsed twitter.Status for the same data
+        """
+        return Status.NewFromJsonDict(self._json)
+
+def _entities(data: dict, key: str, model) -> Union[list, None]:
+    entities = data.get('entities')
+    if not entities or key not in entities:
+        return None
+    return [model.NewFromJsonDict(item) for item in entities[key]]
+
+def _media(data: dict) -> Union[list, None]:
+    extended = data.get('extended_entities')
+    if extended and 'media' in extended:
+        return [Media.NewFromJsonDict(m) for m in extended['media']]
+    return _entities(data, 'media', Media)
+
+def _nested_status(key: str):
+    def build(data: dict) -> Union[LazyStatus, None]:
+        return LazyStatus(data[key]) if key in data else None
+    return build
+
+_PARAM_DEFAULTS = Status().param_defaults
+
+_BUILDERS = {
+    'user': lambda data: User.NewFromJsonDict(data['user']) if 'user' in data else None,
+    'retweeted_status': _nested_status('retweeted_status'),
+    'quoted_status': _nested_status('quoted_status'),
+    'current_user_retweet': lambda data: data['current_user_retweet']['id'] if 'current_user_retweet' in data else None,
+    'hashtags': lambda data: _entities(data, 'hashtags', Hashtag),
+    'urls': lambda data: _entities(data, 'urls', Url),
+    'user_mentions': lambda data: _entities(data, 'user_mentions', User),
+    'media': _media,
+}
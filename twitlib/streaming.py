@@ -3,25 +3,57 @@ Producers and consumers for a thread pool pattern of receiving
 objects from Twitter's streaming API and acting on those objects
 in some way.
 """
+import functools
 import logging
-import requests
 import json
 import os
+import time
 
-from threading import Thread
-from queue import Queue
-from typing import Callable, List, NoReturn, ClassVar, Union, Type
+from concurrent.futures import Future
+from threading import Event, Thread
+from queue import Queue, Empty
+from typing import Dict, List, NoReturn, ClassVar, Union, Type
 
+import requests
 import twitter
+from requests_oauthlib import OAuth1
 from twitter import Api
 from twitter.models import Status, Media, User
 
 import twitlib.util as util
-
-FilterFunc = Callable[[Status], bool]
+import twitlib.codec as codec
+import twitlib.download as download
+from twitlib.queues import StatusQueue, PriorityFunc, BLOCK
+from twitlib.segments import SegmentWriter
+from twitlib.spool import Spool
+from twitlib.dedup import DedupIndex
+from twitlib.scheduler import PostScheduler, is_rate_limited
+import twitlib.metrics as metrics
+import twitlib.tracing as tracing
+from twitlib.filters import FilterChain, FilterFunc, compile_filters
 
 log = logging.getLogger('twitlib')
 
+# Statuses checked and rejected by WorkerThread.validate_status()
+_VALIDATED = metrics.counter('twitlib_filter_checks_total', stage='worker')
+_REJECTED = metrics.counter('twitlib_filter_rejections_total', stage='worker')
+
+# Statuses received by Dispatchers, and those dropped as duplicates by a shared index
+_RECEIVED = metrics.counter('twitlib_received_total')
+_DUPLICATES = metrics.counter('twitlib_duplicates_total')
+
+# Statuses received by Dispatchers after close()
+_REFUSED = metrics.counter('twitlib_refused_total')
+
+# Stream connections made by StreamRunner, and keep-alive lines received
+_CONNECTS = metrics.counter('twitlib_stream_connects_total')
+_KEEP_ALIVES = metrics.counter('twitlib_stream_keep_alives_total')
+
+# Mirror posts, see MirrorThread.mirror()
+_MIRROR_POSTS = metrics.counter('twitlib_mirror_posts_total')
+_MIRROR_FAILURES = metrics.counter('twitlib_mirror_failures_total')
+_MIRROR_SECONDS = metrics.histogram('twitlib_mirror_post_seconds')
+
 class WorkerThread(Thread):
     """
     Abstract worker thread to process jobs from the dispatcher. Derived
@@ -29,9 +61,9 @@ class WorkerThread(Thread):
     if desired. Inherits from threading.Thread class.
     """
 
-    QUEUE: ClassVar[Queue] = Queue()
+    QUEUE: ClassVar[Queue] = StatusQueue()
 
-    def __init__(self, loops=None, dry_run=False, **kwargs):
+    def __init__(self, loops=None, dry_run=False, batch_size=1, batch_linger=0.0, **kwargs):
         """
         Worker thread base class constructor. Follows the `threading.Thread`
         paradigm of accepting only keyword arguments.
@@ -42,17 +74,42 @@ class WorkerThread(Thread):
             Maximum iterations of the run() loop. After `loops` items have been
             dequeued, the thread will die. Defaults to no iteration limit.
 
-        filters : function, list(function),
-            Maximum iterations of the run() loop. After `loops` items have been
-            dequeued, the thread will die. Defaults to no iteration limit.
+        filters : list(function) or FilterChain
+            Filter functions a status must pass to be processed. Defaults to
+            [default_filter]. A prebuilt twitlib.filters.FilterChain may be
+            given instead of a list.
+
+        adaptive_filters : bool
+            If True, filters are reordered by their measured cost per
+            rejection as statuses are processed, see FilterChain.
+            Defaults to False, filters run in order of their `cost`.
+
+        batch_size : int > 0
+            Maximum number of statuses dequeued at once. When greater than 1,
+            run() passes batches to process_statuses(). Defaults to 1, one
+            status per process_status() call.
+
+        batch_linger : float >= 0
+            Seconds to wait for a batch to fill after its first status has
+            been dequeued. Defaults to 0, only statuses already queued are
+            added to a batch.
 
         **kwargs :
             Forwarded to threading.Thread constructor
         """
         self.loops = loops
         self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.batch_linger = batch_linger
+        self._stopped = False
+        self._adaptive_filters = kwargs.pop('adaptive_filters', False)
         self.filters = kwargs.pop('filters', [self.default_filter])
 
+        worker = self.__class__.__name__
+        self._processed = metrics.counter('twitlib_processed_total', worker=worker)
+        self._errors = metrics.counter('twitlib_errors_total', worker=worker)
+        self._latency = metrics.histogram('twitlib_process_seconds', worker=worker)
+
         # Default to daemon thread for worker
         daemon = kwargs.pop('daemon', True)
         super().__init__(daemon=daemon, **kwargs)
@@ -61,7 +118,18 @@ class WorkerThread(Thread):
     def filters(self) -> List[FilterFunc]: return self._filters
 
     @filters.setter
-    def filters(self, funcs: List[FilterFunc]) -> None: self._filters = funcs
+    def filters(self, funcs: List[FilterFunc]) -> None:
+        chain = compile_filters(funcs, adaptive=self._adaptive_filters)
+        self._filters = chain if self._adaptive_filters else funcs
+        self._filter_chain = chain
+
+    @property
+    def filter_chain(self) -> FilterChain:
+        """The filters compiled when set, passed to validate_status()"""
+        return self._filter_chain
+
+    @property
+    def adaptive_filters(self) -> bool: return self._adaptive_filters
 
     @property
     def loops(self) -> int: return self._loops
@@ -79,16 +147,52 @@ class WorkerThread(Thread):
     @dry_run.setter
     def dry_run(self, val: bool) -> None: self._dry_run = val
 
+    @property
+    def batch_size(self) -> int: return self._batch_size
+
+    @batch_size.setter
+    def batch_size(self, val: int) -> None:
+        if val > 0:
+            self._batch_size = val
+        else:
+            raise ValueError('batch_size must be an int > 0')
+
+    @property
+    def batch_linger(self) -> float: return self._batch_linger
+
+    @batch_linger.setter
+    def batch_linger(self, val: float) -> None:
+        if val >= 0:
+            self._batch_linger = val
+        else:
+            raise ValueError('batch_linger must be >= 0')
+
+    @property
+    def stopped(self) -> bool:
+        """True once the thread has dequeued the None sentinel"""
+        return self._stopped
+
     def run(self) -> None:
         """
         Looping method that consumes from the class job queue and runs
         process_status() on dequeued objects. Thread can be killed by
         enqueueing None; when None is dequeued by the thread, looping
-        will end
+        will end. If batch_size > 1, statuses are dequeued in batches
+        and passed to process_statuses() instead. close() is called when
+        looping ends.
         """
-
+        log.debug('%s started', self.__class__.__name__)
+        try:
+            if self.batch_size > 1:
+                self._run_batches()
+            else:
+                self._run_single()
+        finally:
+            self.close()
+
+    def _run_single(self) -> None:
+        """Unbatched variant of the run() loop"""
         cls = self.__class__.__name__
-        log.debug('%s started', cls)
         loop_count = 0
 
         while self.loops == None or loop_count < self.loops:
@@ -97,21 +201,75 @@ class WorkerThread(Thread):
             status = self.__class__.dequeue()
             if status is None:
                 log.debug('Stopping %s', cls)
+                self._stopped = True
                 self.__class__.QUEUE.task_done()
                 break
 
+            tracing.mark(status, cls, tracing.DEQUEUE)
+            start = time.perf_counter()
             try:
                 self.process_status(status)
                 log.debug('%s finished job', cls)
 
             except Exception:
+                self._errors.inc()
                 log.exception('Exception on status: %s', status.__repr__())
                 raise
 
             finally:
+                tracing.mark(status, cls, tracing.DONE)
                 self.__class__.QUEUE.task_done()
+                self._latency.observe(time.perf_counter() - start)
+                self._processed.inc()
                 loop_count += 1
 
+    def _run_batches(self) -> None:
+        """Batched variant of the run() loop"""
+        cls = self.__class__.__name__
+        loop_count = 0
+
+        while self.loops == None or loop_count < self.loops:
+
+            max_items = self.batch_size
+            if self.loops != None:
+                max_items = min(max_items, self.loops - loop_count)
+
+            # Block waiting for incoming statuses, a trailing None ends the loop
+            batch = self.__class__.dequeue_batch(max_items, self.batch_linger)
+            stop = batch[-1] is None
+            statuses = batch[:-1] if stop else batch
+            self._stopped = stop
+            for status in statuses:
+                tracing.mark(status, cls, tracing.DEQUEUE)
+
+            start = time.perf_counter()
+            try:
+                if statuses:
+                    self.process_statuses(statuses)
+                    log.debug('%s finished batch of %i jobs', cls, len(statuses))
+
+            except Exception:
+                self._errors.inc()
+                log.exception('Exception on batch: %s', [s.id for s in statuses])
+                raise
+
+            finally:
+                for status in statuses:
+                    tracing.mark(status, cls, tracing.DONE)
+                for _ in batch:
+                    self.__class__.QUEUE.task_done()
+                if statuses:
+                    # Latency per status, spread evenly over the batch
+                    elapsed = (time.perf_counter() - start) / len(statuses)
+                    for _ in statuses:
+                        self._latency.observe(elapsed)
+                    self._processed.inc(len(statuses))
+                loop_count += len(statuses)
+
+            if stop:
+                log.debug('Stopping %s', cls)
+                break
+
     @classmethod
     def dequeue(cls, **kwargs) -> Union[Status, None]:
         """
@@ -126,11 +284,95 @@ class WorkerThread(Thread):
         """
         return cls.QUEUE.get(block=True, timeout=None, **kwargs)
 
+    @classmethod
+    def dequeue_batch(cls, max_items: int, linger: float = 0.0) -> List[Union[Status, None]]:
+        """
+        Dequeue up to `max_items` jobs from the class job queue. Blocks
+        indefinitely for the first job, then waits up to `linger` seconds
+        for the batch to fill. Collection stops early if None is dequeued.
+
+        Return
+        ===
+            list(Status or None):
+        The dequeued jobs in queue order. If None was dequeued it is
+        the last element of the list. The caller must call task_done()
+        once for every element.
+        """
+        batch = [cls.dequeue()]
+        deadline = time.monotonic() + linger
+
+        while len(batch) < max_items and batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(cls.QUEUE.get(block=True, timeout=remaining))
+                else:
+                    batch.append(cls.QUEUE.get(block=False))
+            except Empty:
+                break
+
+        return batch
+
+    @classmethod
+    def configure_queue(
+            cls,
+            maxsize: int = 0,
+            overflow: str = BLOCK,
+            spill_dir: str = None,
+            spool_dir: str = None,
+            priority: PriorityFunc = None,
+            aging: float = 60.0) -> None:
+        """
+        Replace the class job queue with a StatusQueue of the given capacity,
+        overflow policy and order. Statuses still in the old queue are discarded,
+        so this should be called before any threads of the class are started.
+
+        Args
+        ===
+            maxsize : int >= 0
+        Maximum number of statuses held in the queue. Defaults to no limit.
+
+            overflow : str
+        Policy for enqueue() when the queue is full. One of 'block',
+        'drop_newest', 'drop_oldest' or 'spill'. See twitlib.queues.
+
+            spill_dir : str
+        Directory used to hold statuses for the 'spill' policy
+
+            spool_dir : str
+        If given, statuses are logged to a twitlib.spool.Spool named after
+        the class in this directory until processed. Statuses left in the
+        spool by a previous run are queued again.
+
+            priority : function(Status) -> float
+        If given, statuses of higher priority are dequeued first, and
+        `aging` seconds of queue time are worth one unit of priority so
+        none are starved. Defaults to None, FIFO. See twitlib.queues.
+
+            aging : float > 0
+        Seconds of queue time a unit of priority is worth
+
+        Return: None
+        """
+        spool = None
+        if spool_dir is not None:
+            spool = Spool(os.path.join(spool_dir, '%s.spool' % cls.__name__))
+        cls.QUEUE = StatusQueue(
+                maxsize,
+                overflow=overflow,
+                spill_dir=spill_dir,
+                spool=spool,
+                priority=priority,
+                aging=aging
+        )
+
     @classmethod
     def enqueue(cls, status: Union[Status, None], **kwargs) -> None:
         """
-        Enqueue a job to the class job queue. Will block indefinitely by default.
-        Keyword args are forwarded to Queue.get(), can be used to override blocking.
+        Enqueue a job to the class job queue. Will block indefinitely by default
+        if the queue is full, unless the queue was configured with a dropping or
+        spilling overflow policy. Keyword args are forwarded to Queue.put(), can be
+        used to override blocking.
 
         Args
         ===
@@ -139,6 +381,7 @@ class WorkerThread(Thread):
 
         Return: None
         """
+        tracing.mark(status, cls.__name__, tracing.ENQUEUE)
         cls.QUEUE.put(status, block=True, timeout=None, **kwargs)
 
     def process_status(self, status: Status) -> NoReturn:
@@ -147,9 +390,26 @@ class WorkerThread(Thread):
         subclasses to specify how dequeued items are processed
         """
         # Call to simplify testing TODO remove?
-        WorkerThread.validate_status(status, self.filters)
+        WorkerThread.validate_status(status, self.filter_chain)
         raise NotImplementedError('Please override WorkerThread.process_status()')
 
+    def close(self) -> None:
+        """
+        Called when the run() loop ends. Override this in subclasses to
+        flush and release any resources held by the thread.
+        """
+        pass
+
+    def process_statuses(self, statuses: List[Status]) -> list:
+        """
+        Called with each batch of jobs pulled from the class job queue when
+        batch_size > 1. Override this in subclasses to amortize work across
+        a batch. By default calls process_status() on each status in order.
+
+        Return: list of process_status() return values
+        """
+        return [self.process_status(status) for status in statuses]
+
     @staticmethod
     def default_filter(status: Status) -> bool:
         """
@@ -161,11 +421,24 @@ class WorkerThread(Thread):
     @staticmethod
     def validate_status(status: Status, funcs: List[FilterFunc]) -> bool:
         """
-        Pass a status through a list of validation functions.
+        Pass a status through a list of validation functions. The list is
+        compiled to a short circuiting FilterChain, see twitlib.filters.
+        A FilterChain, such as a worker's filter_chain, is used as given. When
+        debug logging is enabled every function is evaluated so that all
+        failures can be logged.
         Return: all( [ f(status) for f in funcs ] )
         """
-        failures = [ f for f in funcs if not f(status) ]
+        chain = funcs if isinstance(funcs, FilterChain) else compile_filters(funcs)
+        _VALIDATED.inc()
+        if not log.isEnabledFor(logging.DEBUG):
+            result = chain(status)
+            if not result:
+                _REJECTED.inc()
+            return result
+
+        failures = chain.failures(status)
         if failures:
+            _REJECTED.inc()
             log.debug('Tweet %i failed %i filter criteria: %s',
                 status.id,
                 len(failures),
@@ -180,11 +453,13 @@ class WorkerThread(Thread):
     def format_filename(status: Status, fmt: str, dirname:str = None) -> str:
         """
         Helper method to apply a given format to a status object.
-        forwarded to json.dump(). Optionally specify a directory path that
-        will be prepended to the generated filename.
+        Optionally specify a directory path that will be prepended to the
+        generated filename. Only the fields named in the format are read from
+        the status, and dotted fields like '{user.screen_name}' are allowed.
+        Formats are compiled once and the expanded name is cached on the
+        status, so workers sharing a format expand it once per status.
         """
-        kwargs = status.AsDict()
-        name = fmt.format(**kwargs)
+        name = util.compile_template(fmt).render(status)
         return os.path.join(dirname, name) if dirname else name
 
 class WriterThread(WorkerThread):
@@ -194,11 +469,69 @@ class WriterThread(WorkerThread):
     writing may be enabled in the future.
     """
 
-    QUEUE: ClassVar[Queue] = Queue()
+    QUEUE: ClassVar[Queue] = StatusQueue()
+
+    # Output modes
+    FILE = 'file'
+    SEGMENT = 'segment'
+
+    def __init__(self, dirname='', format='status_{id}.json', mode=FILE, raw_json=False, shard=None, **kwargs):
+        """
+        Keyword Args
+        ===
+        dirname : str
+            Directory that output files are written to
+
+        format : str
+            Filename format for `file` mode, applied to each status
+
+        mode : str
+            'file' writes each status to its own file named with `format`.
+            'segment' appends statuses as JSON Lines to rotating segment
+            files, see twitlib.segments.SegmentWriter.
+
+        raw_json : bool
+            In `file` mode, write each status as compact UTF-8 JSON with
+            twitlib.codec instead of indented UTF-32 JSON of AsDict(). The
+            raw bytes received from Twitter are written untouched when
+            available. Segments are always written this way.
+
+        shard : str, callable or None
+            Splits `file` mode output over subdirectories of `dirname`, by
+            'id', 'date', 'user' or a format string. See util.shard_dirname()
 
-    def __init__(self, dirname='', format='status_{id}.json', **kwargs):
+        segment_format : str
+            Filename format for segment files in `segment` mode
+
+        segment_bytes : int or None
+            Segment size that triggers rotation in `segment` mode
+
+        segment_seconds : float or None
+            Segment age that triggers rotation in `segment` mode
+
+        fsync_interval : float or None
+            Minimum seconds between fsync() calls in `segment` mode
+
+        **kwargs :
+            Forwarded to WorkerThread constructor
+        """
         self.dirname = dirname
         self.format = format
+        self.mode = mode
+        self.raw_json = raw_json
+        self.shard = shard
+
+        segment_defaults = {
+                'segment_format': 'segment_{thread}_{time}_{index}.jsonl',
+                'segment_bytes': 64 * 1024 * 1024,
+                'segment_seconds': 3600,
+                'fsync_interval': 1.0,
+        }
+        self._segment_args = {
+                attr: kwargs.pop(attr, default)
+                for attr, default in segment_defaults.items()
+        }
+        self._segment_writer = None
         super().__init__(**kwargs)
 
     @property
@@ -213,6 +546,50 @@ class WriterThread(WorkerThread):
     @format.setter
     def format(self, val: str) -> None: self._format = val
 
+    @property
+    def mode(self) -> str: return self._mode
+
+    @mode.setter
+    def mode(self, val: str) -> None:
+        if val in (WriterThread.FILE, WriterThread.SEGMENT):
+            self._mode = val
+        else:
+            raise ValueError("mode must be 'file' or 'segment'")
+
+    @property
+    def raw_json(self) -> bool: return self._raw_json
+
+    @raw_json.setter
+    def raw_json(self, val: bool) -> None: self._raw_json = val
+
+    @property
+    def shard(self): return self._shard
+
+    @shard.setter
+    def shard(self, val) -> None:
+        util.check_shard(val)
+        self._shard = val
+
+    @property
+    def segment_writer(self) -> SegmentWriter:
+        """The SegmentWriter used in `segment` mode, created on first use"""
+        if self._segment_writer is None:
+            args = self._segment_args
+            self._segment_writer = SegmentWriter(
+                    dirname=self.dirname,
+                    format=args['segment_format'],
+                    max_bytes=args['segment_bytes'],
+                    max_seconds=args['segment_seconds'],
+                    fsync_interval=args['fsync_interval'],
+                    thread=self.name
+            )
+        return self._segment_writer
+
+    def close(self) -> None:
+        """Closes the open segment file, if any"""
+        if self._segment_writer is not None:
+            self._segment_writer.close()
+
     def process_status(self, status: Status) -> str:
         """
         Override for WorkerThread.process_status(). Performs the following actions:
@@ -221,23 +598,76 @@ class WriterThread(WorkerThread):
                 If any filter returns False, processing will abort.
 
             2.  Writes the status as a JSON to a file formatted with self.tweet_fmt
-                located in the directory given in self.dirname
+                located in the directory given in self.dirname, or appends it to
+                the current segment file in `segment` mode
 
         Return: Name of written file, or None if error
         """
-        if not WorkerThread.validate_status(status, self.filters):
+        if not WorkerThread.validate_status(status, self.filter_chain):
             log.info('Tweet %i failed filter %s filter criteria', status.id, self.__class__.__name__)
             return None
-
-        name = WorkerThread.format_filename(status, self.format, self.dirname)
+        cls = self.__class__.__name__
+        tracing.mark(status, cls, tracing.FILTERED)
+
+        if self.mode == WriterThread.SEGMENT:
+            if self.dry_run:
+                log.info('[DRY RUN] Appended status %i to segment', status.id)
+                return None
+            tracing.mark(status, cls, tracing.IO_START)
+            name = self.segment_writer.write(status)
+            tracing.mark(status, cls, tracing.IO_END)
+            log.info('Appended status %i to %s', status.id, name)
+            return name
+
+        dirname = util.shard_dirname(status, self.dirname, self.shard)
+        name = WorkerThread.format_filename(status, self.format, dirname)
         if self.dry_run:
             log.info('[DRY RUN] Wrote status %i to %s', status.id, name)
             return None
+
+        tracing.mark(status, cls, tracing.IO_START)
+        if self.raw_json:
+            result = self.write_raw(status, name)
         else:
             result = self.write_status(status, name)
-            log.info('Wrote status %i to %s', status.id, name)
-            return result
+        tracing.mark(status, cls, tracing.IO_END)
+        log.info('Wrote status %i to %s', status.id, name)
+        return result
+
+    def process_statuses(self, statuses: List[Status]) -> List[str]:
+        """
+        Override for WorkerThread.process_statuses(). In `segment` mode, all
+        statuses passing the filters are appended to the segment together.
+
+        Return: Names of written files, with None for statuses not written
+        """
+        if self.mode != WriterThread.SEGMENT:
+            return super().process_statuses(statuses)
+
+        results = [None] * len(statuses)
+        valid = [
+                i for i, status in enumerate(statuses)
+                if WorkerThread.validate_status(status, self.filter_chain)
+        ]
+        if not valid:
+            return results
 
+        cls = self.__class__.__name__
+        for i in valid:
+            tracing.mark(statuses[i], cls, tracing.FILTERED)
+        if self.dry_run:
+            log.info('[DRY RUN] Appended %i statuses to segment', len(valid))
+            return results
+
+        for i in valid:
+            tracing.mark(statuses[i], cls, tracing.IO_START)
+        paths = self.segment_writer.write_many([statuses[i] for i in valid])
+        for i in valid:
+            tracing.mark(statuses[i], cls, tracing.IO_END)
+        for i, path in zip(valid, paths):
+            results[i] = path
+        log.info('Appended %i statuses to %s', len(valid), paths[-1])
+        return results
 
     @staticmethod
     def write_status(status: Status, filename: str) -> str:
@@ -245,12 +675,26 @@ class WriterThread(WorkerThread):
         Write a status as a JSON object to a given file. Keyword args are
         forwarded to json.dump()
         """
+        util.makedirs(os.path.dirname(filename))
         with open(filename, 'w', encoding='utf-32') as f:
             json.dump(status.AsDict(), f, indent=2, sort_keys=True)
 
         log.debug('Wrote status to %s', filename)
         return filename
 
+    @staticmethod
+    def write_raw(status: Status, filename: str) -> str:
+        """
+        Write a status to a given file as compact UTF-8 JSON, using the raw
+        bytes received from Twitter when available. See twitlib.codec.
+        """
+        util.makedirs(os.path.dirname(filename))
+        with open(filename, 'wb') as f:
+            f.write(codec.encode_status(status))
+
+        log.debug('Wrote status to %s', filename)
+        return filename
+
     @staticmethod
     def default_filter(status: Status) -> bool:
         """
@@ -271,13 +715,14 @@ class MirrorThread(WorkerThread):
     Mirroring is only defined for Status objects (tweepy tweets).
     """
 
-    QUEUE: ClassVar[Queue] = Queue()
+    QUEUE: ClassVar[Queue] = StatusQueue()
 
     def __init__(self, **kwargs):
 
         default_args = {
                 'api': Api(),
                 'temp_dir': '',
+                'scheduler': None,
         }
         for attr, default in default_args.items():
             val = kwargs.pop(attr, default)
@@ -297,6 +742,12 @@ class MirrorThread(WorkerThread):
     @api.setter
     def api(self, val: Api) -> None: self._api = val
 
+    @property
+    def scheduler(self) -> Union[PostScheduler, None]: return self._scheduler
+
+    @scheduler.setter
+    def scheduler(self, val: Union[PostScheduler, None]) -> None: self._scheduler = val
+
     def process_status(self, status: Status) -> Status:
         """
         Override for WorkerThread.process_status(). Performs the following actions:
@@ -307,26 +758,75 @@ class MirrorThread(WorkerThread):
             2.  Writes the status as a JSON to a file formatted with self.tweet_fmt
                 located in the directory given in self.dirname
 
-        Returns the newly tweeted Status, or None if validation failed or dry_run=True
+        Returns the newly tweeted Status, or None if validation failed or dry_run=True.
+        With a scheduler, returns a Future holding the tweeted Status instead.
         """
-        if not WorkerThread.validate_status(status, self.filters):
+        if not WorkerThread.validate_status(status, self.filter_chain):
             log.info('Tweet %i failed filter %s filter criteria', status.id, self.__class__.__name__)
             return None
+        cls = self.__class__.__name__
+        tracing.mark(status, cls, tracing.FILTERED)
 
         if self.dry_run:
             log.info('[DRY RUN] Mirroring tweet %i', status.id)
             return None
-        else:
-            log.info('Mirroring tweet %i', status.id)
-            return MirrorThread.mirror(self.api, status, self.temp_dir)
+
+        log.info('Mirroring tweet %i', status.id)
+        tracing.mark(status, cls, tracing.IO_START)
+        try:
+            return MirrorThread.mirror(self.api, status, self.temp_dir, self.scheduler)
+        except IOError as e:
+            _MIRROR_FAILURES.inc()
+            log.warning('Not mirroring tweet %i: %s', status.id, e)
+            return None
+        except twitter.TwitterError as e:
+            # Api built with sleep_on_rate_limit=False for a scheduler
+            if not is_rate_limited(e):
+                raise
+            _MIRROR_FAILURES.inc()
+            log.warning('Not mirroring tweet %i, rate limited: %s', status.id, e)
+            return None
+        finally:
+            tracing.mark(status, cls, tracing.IO_END)
 
     @staticmethod
-    def mirror(api: Api, status: Status, temp_dir: str = '') -> Status:
-        """Mirror a status. Returns a Status object with the newly posted tweet"""
+    def mirror(
+            api: Api,
+            status: Status,
+            temp_dir: str = '',
+            scheduler: PostScheduler = None) -> Union[Status, Future]:
+        """
+        Mirror a status. Nothing is posted unless all of the status media
+        was downloaded, so a partial copy is never published.
+
+        If a twitlib.scheduler.PostScheduler is given, media is uploaded
+        right away and the post is handed to the scheduler, to be made
+        when the rate limit allows.
+
+        Raises
+        ===
+            IOError :
+        One or more media items failed to download
+
+        Return: Status object with the newly posted tweet, or a Future
+        holding it if a scheduler is given
+        """
         text = status.full_text if status.full_text else status.text
         text = util.remove_urls(text)
         media = MediaDownloaderThread.download_media(status, temp_dir)
-        return api.PostUpdate(status=text, media=media)
+
+        expected = len(status.media) if status.media else 0
+        if len(media) < expected:
+            raise IOError('Downloaded %i of %i media items' % (len(media), expected))
+
+        if scheduler is not None:
+            media_ids = [api.UploadMediaChunked(media=path) for path in media]
+            return scheduler.submit(text, media_ids, status=status)
+
+        with _MIRROR_SECONDS.time():
+            result = api.PostUpdate(status=text, media=media)
+        _MIRROR_POSTS.inc()
+        return result
 
     @staticmethod
     def default_filter(status: Status):
@@ -354,11 +854,12 @@ class MediaDownloaderThread(WorkerThread):
     writing may be enabled in the future.
     """
 
-    QUEUE: ClassVar[Queue] = Queue()
+    QUEUE: ClassVar[Queue] = StatusQueue()
 
-    def __init__(self, dirname='', format='media_{id}.json', **kwargs):
+    def __init__(self, dirname='', format='media_{id}.json', shard=None, **kwargs):
         self.dirname=dirname
         self.format=format
+        self.shard=shard
         super().__init__(**kwargs)
 
     @property
@@ -373,6 +874,14 @@ class MediaDownloaderThread(WorkerThread):
     @format.setter
     def format(self, val: str) -> None: self._format = val
 
+    @property
+    def shard(self): return self._shard
+
+    @shard.setter
+    def shard(self, val) -> None:
+        util.check_shard(val)
+        self._shard = val
+
     def process_status(self, status: Status):
         """
         Override for WorkerThread.process_status(). Performs the following actions:
@@ -384,17 +893,22 @@ class MediaDownloaderThread(WorkerThread):
                 located in the directory given in self.dirname
 
         """
-        if not WorkerThread.validate_status(status, self.filters):
+        if not WorkerThread.validate_status(status, self.filter_chain):
             log.info('Tweet %i failed filter %s filter criteria', status.id, self.__class__.__name__)
             return []
+        cls = self.__class__.__name__
+        tracing.mark(status, cls, tracing.FILTERED)
 
         media_list = status.media
         url_list = util.list_media(status)
-        status_dir = WorkerThread.format_filename(status, self.format, self.dirname)
+        dirname = util.shard_dirname(status, self.dirname, self.shard)
+        status_dir = WorkerThread.format_filename(status, self.format, dirname)
 
         if not self.dry_run:
             log.info('Downloading media urls:%s', url_list)
+            tracing.mark(status, cls, tracing.IO_START)
             out_files = MediaDownloaderThread.download_media(status, status_dir)
+            tracing.mark(status, cls, tracing.IO_END)
             log.info('Downloaded media to files: %s', out_files)
             return out_files
         else:
@@ -418,28 +932,14 @@ class MediaDownloaderThread(WorkerThread):
             log.debug('Status %i had no media, skipping download', status.id)
             return []
 
-        # Create subdirectory for downloads
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
+        # Create subdirectory for downloads, once per directory
+        util.makedirs(dirname)
 
-        # Download each media element into subdirectory
-        result = []
-        for i, media in enumerate(media_list):
-            log.debug('Downloading media item %i', i+1)
-            url = media.media_url_https
-
-            # TODO validate response code
-            r = requests.get(url)
-            log.debug('Request got URL %s', url)
-
-            filepath = MediaDownloaderThread.url_to_file(url, dirname)
-            with open(filepath, 'wb') as f:
-                f.write(r.content)
-            log.debug('Wrote %s', filepath)
-
-            result.append(filepath)
-
-        return result
+        # Download media elements into subdirectory in parallel
+        urls = [media.media_url_https for media in media_list]
+        filepaths = [MediaDownloaderThread.url_to_file(url, dirname) for url in urls]
+        log.debug('Downloading %i media items', len(urls))
+        return download.fetch_all(urls, filepaths)
 
     @staticmethod
     def url_to_file(url: str, dirname: str ='') -> str:
@@ -496,8 +996,8 @@ class BaseListener():
     def on_direct_message(self, status) -> None:
         log.info('Got direct message')
 
-    def on_limit(self) -> None:
-        log.warning('Got limit message')
+    def on_limit(self, track: int = None) -> None:
+        log.warning('Got limit message, %s statuses undelivered', track)
 
     def on_timeout(self) -> None:
         log.warning('Stream timeout')
@@ -511,30 +1011,399 @@ class Dispatcher(BaseListener):
     calls and on_error handling from BaseListener.
     """
 
-    def __init__(self, threads: List[WorkerThread] = []):
+    def __init__(
+            self,
+            threads: List[WorkerThread] = [],
+            filters: Dict[Type[WorkerThread], List[FilterFunc]] = None,
+            adaptive: bool = False,
+            dedup: Union[DedupIndex, Dict[Type[WorkerThread], DedupIndex]] = None):
         """
         When a status is received and pushed to on_status(), the
         dispatcher will call thread.enqueue(status) for each
         thread class given in the `threads` arg.
+
+        If `filters` is given, it maps thread classes to a list of filter
+        functions. A status is only enqueued for a thread class if it passes
+        that class's filters, so rejected statuses are never queued. Each
+        distinct filter function is evaluated at most once per status, even
+        when it is shared by several thread classes. Threads whose filtering
+        is done here should be constructed with `filters=[]`.
+
+        If `adaptive` is True, each thread class's filters are reordered by
+        measured cost per rejection, see twitlib.filters.FilterChain. A
+        FilterChain may also be given in place of a list of functions.
+
+        If `dedup` is a twitlib.dedup.DedupIndex, statuses whose id it has
+        already seen are dropped before filtering, e.g. those redelivered
+        after a reconnect. It may also map thread classes to an index each,
+        so that each class is given a status id at most once. Ids are only
+        recorded in a class's index when the status passes its filters.
+
+        Once close() is called, statuses are no longer enqueued, so that
+        the worker queues can be drained, see twitlib.pipeline.
         """
-        self._threads = threads
+        self._adaptive = adaptive
+        self._closed = False
+        self.threads = threads
+        self.filters = filters if filters is not None else {}
+        self.dedup = dedup
         super().__init__()
 
     @property
     def threads(self) -> List[WorkerThread]: return self._threads
 
     @threads.setter
-    def threads(self, val: List[WorkerThread]): self._threads = val
+    def threads(self, val: List[WorkerThread]):
+        self._threads = val
+        self._metrics = {}
+        for thread_cls in val:
+            self._bind_metrics(thread_cls)
+
+    @property
+    def adaptive(self) -> bool: return self._adaptive
+
+    @property
+    def dedup(self) -> Union[DedupIndex, Dict[Type[WorkerThread], DedupIndex], None]:
+        return self._dedup
+
+    @dedup.setter
+    def dedup(self, val: Union[DedupIndex, Dict[Type[WorkerThread], DedupIndex], None]) -> None:
+        self._dedup = val
+
+    @property
+    def closed(self) -> bool: return self._closed
+
+    @property
+    def filters(self) -> Dict[Type[WorkerThread], List[FilterFunc]]: return self._filters
+
+    @filters.setter
+    def filters(self, val: Dict[Type[WorkerThread], List[FilterFunc]]) -> None:
+        self._filters = val
+        self._chains = {
+                thread_cls: compile_filters(funcs, adaptive=self._adaptive)
+                for thread_cls, funcs in val.items()
+        }
 
     def on_status(self, status: Type[Status]) -> None:
         """Adds status to queue of listening WorkerThreads"""
         super().on_status(status)
+        for thread_cls in self.targets(status):
+            thread_cls.enqueue(status)
+
+    def targets(self, status: Status) -> List[Type[WorkerThread]]:
+        """
+        Applies deduplication and filters to a status.
+        Return: The thread classes that the status should be enqueued to
+        """
+        _RECEIVED.inc()
+        if self._closed:
+            _REFUSED.inc()
+            log.warning('Dispatcher closed, dropped tweet %i', status.id)
+            return []
 
+        dedup = self._dedup
+        if isinstance(dedup, DedupIndex):
+            if dedup.seen(status.id):
+                _DUPLICATES.inc()
+                log.debug('Tweet %i is a duplicate', status.id)
+                return []
+            dedup = None
+
+        result = []
+        memo = {}
         for thread_cls in self.threads:
-            thread_cls.enqueue(status)
+            enqueued, rejected, duplicates = \
+                    self._metrics.get(thread_cls) or self._bind_metrics(thread_cls)
+            chain = self._chains.get(thread_cls)
+            if chain is not None and not chain(status, memo):
+                rejected.inc()
+                log.debug('Tweet %i rejected for %s', status.id, thread_cls.__name__)
+                continue
+
+            index = dedup.get(thread_cls) if dedup else None
+            if index is not None and index.seen(status.id):
+                duplicates.inc()
+                log.debug('Tweet %i is a duplicate for %s', status.id, thread_cls.__name__)
+                continue
+
+            enqueued.inc()
+            result.append(thread_cls)
+        return result
+
+    def close(self) -> None:
+        """Stop enqueueing statuses. Statuses received afterwards are dropped."""
+        self._closed = True
+        log.info('Dispatcher closed')
+
+    def _bind_metrics(self, thread_cls: Type[WorkerThread]) -> tuple:
+        """Registers the metrics of a thread class, see twitlib.metrics"""
+        worker = thread_cls.__name__
+        # Targets such as ProcessPoolWorker have no class job queue
+        if hasattr(thread_cls, 'QUEUE'):
+            metrics.gauge('twitlib_queue_depth', functools.partial(_queue_depth, thread_cls), worker=worker)
+        result = (
+                metrics.counter('twitlib_enqueued_total', worker=worker),
+                metrics.counter('twitlib_filter_rejections_total', stage='dispatcher', worker=worker),
+                metrics.counter('twitlib_duplicates_total', worker=worker),
+        )
+        self._metrics[thread_cls] = result
+        return result
 
     def on_error(self, status_code: int) -> Union[bool, None]:
         super().on_error(status_code)
         if status_code == 429:
             return False
         return None
+
+def _queue_depth(thread_cls: Type[WorkerThread]) -> int:
+    queue = getattr(thread_cls, 'QUEUE', None)
+    return queue.qsize() if queue is not None else 0
+
+class Backoff():
+    """
+    Delays between reconnection attempts, growing linearly by `step` or
+    exponentially by `factor` from `initial` up to `maximum` seconds.
+    """
+
+    def __init__(self, initial: float, maximum: float, step: float = 0, factor: float = 1):
+        self.initial = initial
+        self.maximum = maximum
+        self.step = step
+        self.factor = factor
+        self.reset()
+
+    def next(self) -> float:
+        """Return: The delay before the next attempt"""
+        delay = self._delay
+        self._delay = min(self.maximum, self._delay * self.factor + self.step)
+        return delay
+
+    def reset(self) -> None:
+        self._delay = self.initial
+
+class StreamRunner():
+    """
+    Owns a connection to the Twitter streaming API and feeds a long-lived
+    listener, typically a Dispatcher, reconnecting as Twitter recommends:
+
+        -   Network errors, stalls and disconnects back off linearly from
+            250ms up to 16s
+
+        -   HTTP errors back off exponentially from 5s up to 320s
+
+        -   HTTP 420, rate limited, backs off exponentially from 60s
+
+    Backoff is reset once a connection delivers data. Lines are decoded
+    with twitlib.codec as they arrive. Statuses go to on_status(), limit
+    notices to on_limit() and HTTP errors to on_error(), which may return
+    False to stop reconnecting. Blank keep-alive lines are counted, and a
+    connection with no data, keep-alives included, for `stall_timeout`
+    seconds is treated as a stall.
+    """
+
+    def __init__(
+            self,
+            api: Api,
+            listener: BaseListener,
+            lazy: bool = True,
+            stall_timeout: float = 90,
+            connect_timeout: float = 10,
+            chunk_size: int = 512,
+            session: requests.Session = None):
+        """
+        Args
+        ===
+            api : twitter.Api
+        Api authenticated with user OAuth keys, used for the stream URL,
+        credentials and proxies
+
+            listener : BaseListener
+        Receives statuses and stream events
+
+            lazy : bool
+        If True statuses are twitlib.status.LazyStatus objects, otherwise
+        fully parsed twitter.Status objects
+
+            stall_timeout : float > 0
+        Seconds without data before reconnecting. Twitter sends keep-alives
+        every 30 seconds.
+
+            connect_timeout : float > 0
+        Seconds to wait for a connection
+
+            chunk_size : int > 0
+        Bytes read from the connection at a time
+
+            session : requests.Session
+        Session used to connect. Defaults to a new session.
+        """
+        if stall_timeout <= 0 or connect_timeout <= 0:
+            raise ValueError('stall_timeout and connect_timeout must be > 0')
+        if chunk_size <= 0:
+            raise ValueError('chunk_size must be an int > 0')
+
+        self._api = api
+        self._listener = listener
+        self._lazy = lazy
+        self._timeout = (connect_timeout, stall_timeout)
+        self._chunk_size = chunk_size
+        self._session = session if session is not None else requests.Session()
+        self._auth = OAuth1(
+                api._consumer_key,
+                api._consumer_secret,
+                api._access_token_key,
+                api._access_token_secret
+        )
+
+        self.tcp_backoff = Backoff(0.25, 16, step=0.25)
+        self.http_backoff = Backoff(5, 320, factor=2)
+        self.rate_limit_backoff = Backoff(60, 960, factor=2)
+
+        self._stop = Event()
+        self._response = None
+        self._connections = 0
+        self._keep_alives = 0
+
+    @property
+    def listener(self) -> BaseListener: return self._listener
+
+    @property
+    def connections(self) -> int: return self._connections
+
+    @property
+    def keep_alives(self) -> int: return self._keep_alives
+
+    @property
+    def running(self) -> bool: return not self._stop.is_set()
+
+    def filter(
+            self,
+            follow: List[str] = None,
+            track: List[str] = None,
+            locations: List[str] = None,
+            languages: List[str] = None,
+            stall_warnings: bool = True,
+            filter_level: str = None) -> None:
+        """
+        Stream statuses matching the given predicates until stop() is
+        called or the listener stops the stream. Arguments match
+        twitter.Api.GetStreamFilter().
+        """
+        if follow is None and track is None and locations is None:
+            raise ValueError('One of follow, track or locations is required')
+
+        data = {}
+        for key, val in (('follow', follow), ('track', track), ('locations', locations), ('language', languages)):
+            if val is not None:
+                data[key] = ','.join(str(v) for v in val)
+        if stall_warnings:
+            data['stall_warnings'] = 'true'
+        if filter_level is not None:
+            data['filter_level'] = filter_level
+
+        self.run('%s/statuses/filter.json' % self._api.stream_url, data)
+
+    def run(self, url: str, data: dict = None) -> None:
+        """
+        Connect to a streaming endpoint with a POST of `data`, reconnecting
+        until stop() is called or the listener stops the stream.
+        """
+        self._stop.clear()
+        while not self._stop.is_set():
+            try:
+                response = self._session.post(
+                        url,
+                        data=data,
+                        stream=True,
+                        auth=self._auth,
+                        timeout=self._timeout,
+                        proxies=getattr(self._api, 'proxies', None)
+                )
+            except requests.RequestException as e:
+                self._wait(self.tcp_backoff, 'Failed to connect: %s' % e)
+                continue
+
+            if response.status_code != 200:
+                response.close()
+                if self._listener.on_error(response.status_code) is False:
+                    log.info('Listener stopped the stream on HTTP %i', response.status_code)
+                    break
+                backoff = self.rate_limit_backoff if response.status_code == 420 else self.http_backoff
+                self._wait(backoff, 'HTTP %i from stream' % response.status_code)
+                continue
+
+            self._connections += 1
+            _CONNECTS.inc()
+            self._response = response
+            self._listener.on_connect()
+            try:
+                self._consume(response)
+                reason = 'Stream disconnected'
+            except requests.RequestException as e:
+                if self._stop.is_set():
+                    break
+                if isinstance(e, requests.Timeout) or 'timed out' in str(e):
+                    self._listener.on_timeout()
+                reason = 'Stream failed: %s' % e
+            except Exception:
+                # Closing the response from stop() may break the read
+                if self._stop.is_set():
+                    break
+                raise
+            finally:
+                self._response = None
+                response.close()
+
+            self._wait(self.tcp_backoff, reason)
+
+    def stop(self) -> None:
+        """Stop streaming, closing the current connection"""
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                log.debug('Error closing stream', exc_info=True)
+
+    def _consume(self, response: requests.Response) -> None:
+        received = False
+        for line in response.iter_lines(chunk_size=self._chunk_size):
+            if self._stop.is_set():
+                return
+            try:
+                message = codec.decode_message(line, self._lazy)
+            except ValueError:
+                log.warning('Malformed stream message: %r', line[:100])
+                continue
+
+            if message is None:
+                self._keep_alives += 1
+                _KEEP_ALIVES.inc()
+                continue
+
+            if not received:
+                received = True
+                self.tcp_backoff.reset()
+                self.http_backoff.reset()
+                self.rate_limit_backoff.reset()
+
+            if isinstance(message, Status):
+                self._listener.on_status(message)
+            elif 'limit' in message:
+                self._listener.on_limit(message['limit'].get('track'))
+            elif 'warning' in message:
+                log.warning('Stall warning: %s', message['warning'].get('message'))
+            elif 'disconnect' in message:
+                log.warning('Disconnect notice: %s', message['disconnect'].get('reason'))
+            elif 'direct_message' in message:
+                self._listener.on_direct_message(message['direct_message'])
+            else:
+                log.debug('Ignored stream message: %s', list(message))
+
+    def _wait(self, backoff: Backoff, reason: str) -> None:
+        if self._stop.is_set():
+            return
+        delay = backoff.next()
+        log.warning('%s, reconnecting in %.2fs', reason, delay)
+        self._stop.wait(delay)
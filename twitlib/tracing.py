@@ -0,0 +1,220 @@
+"""
+Per-status latency tracing through the worker queues. When enabled with
+configure(), a sample of statuses chosen by a hash of their id is
+timestamped as each worker class enqueues, dequeues, filters and
+processes it, and one JSON line per status and worker class is appended
+to a trace file. The line shows whether the time was spent waiting in
+the queue or doing I/O.
+
+Tracing is off by default and costs one global lookup per event.
+"""
+import atexit
+import json
+import logging
+import os
+import time
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Union
+
+import twitlib.util as util
+
+log = logging.getLogger('twitlib')
+
+# Events, in the order they occur for a status processed by a worker
+ENQUEUE = 'enqueue'
+DEQUEUE = 'dequeue'
+FILTERED = 'filtered'
+IO_START = 'io_start'
+IO_END = 'io_end'
+DONE = 'done'
+
+EVENTS = (ENQUEUE, DEQUEUE, FILTERED, IO_START, IO_END, DONE)
+
+# Durations written with each trace: name, start event, end event
+DURATIONS = (
+    ('queued', ENQUEUE, DEQUEUE),
+    ('filter', DEQUEUE, FILTERED),
+    ('io', IO_START, IO_END),
+    ('process', DEQUEUE, DONE),
+    ('total', ENQUEUE, DONE),
+)
+
+class Tracer():
+    """
+    Collects the events of sampled statuses and appends a JSON line to
+    `path` when a worker class is done with a status:
+
+        {"id": 1, "worker": "MirrorThread",
+         "events": {"enqueue": 1600000000.0, "dequeue": ..., "done": ...},
+         "ms": {"queued": 5012.1, "filter": 0.02, "io": 380.4, ...}}
+
+    Event times are epoch seconds. Durations are in milliseconds, and only
+    those whose events both occurred are written, e.g. a status rejected by
+    the filters has no `filter` or `io` duration.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            sample_rate: float = 0.01,
+            max_open: int = 100000,
+            flush_every: int = 100):
+        """
+        Args
+        ===
+            path : str
+        Trace file, appended to
+
+            sample_rate : float in (0, 1]
+        Fraction of status ids traced
+
+            max_open : int > 0
+        Traces held for statuses not yet done. The oldest are discarded
+        beyond this, e.g. statuses dropped from a full queue.
+
+            flush_every : int > 0
+        Traces buffered before the file is flushed
+        """
+        if not 0 < sample_rate <= 1:
+            raise ValueError('sample_rate must be in (0, 1]')
+        if max_open <= 0:
+            raise ValueError('max_open must be an int > 0')
+        if flush_every <= 0:
+            raise ValueError('flush_every must be an int > 0')
+
+        self._path = path
+        self._sample_rate = sample_rate
+        self._threshold = int(sample_rate * (1 << 64))
+        self._max_open = max_open
+        self._flush_every = flush_every
+
+        self._lock = Lock()
+        self._open = OrderedDict()
+        self._unflushed = 0
+        util.makedirs(os.path.dirname(path))
+        self._file = open(path, 'a', encoding='utf-8')
+
+    @property
+    def path(self) -> str: return self._path
+
+    @property
+    def sample_rate(self) -> float: return self._sample_rate
+
+    def sampled(self, status_id: int) -> bool:
+        """Whether a status id is traced, the same in every process"""
+        return util.hash_id(status_id) < self._threshold
+
+    def mark(self, status_id: int, worker: str, event: str, now: float = None) -> None:
+        """Record an event for a sampled status and worker class"""
+        now = time.time() if now is None else now
+        key = (status_id, worker)
+        with self._lock:
+            if event == DONE:
+                # Traces discarded or begun before tracing was configured are dropped
+                events = self._open.pop(key, None)
+                if events is not None:
+                    events[event] = now
+                    self._write(status_id, worker, events)
+                return
+
+            events = self._open.get(key)
+            if events is None:
+                events = self._open[key] = {}
+                if len(self._open) > self._max_open:
+                    self._open.popitem(last=False)
+            events[event] = now
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._unflushed = 0
+
+    def close(self) -> None:
+        """Flush and close the trace file. Unfinished traces are discarded."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._open.clear()
+
+    def _write(self, status_id: int, worker: str, events: Dict[str, float]) -> None:
+        if self._file is None:
+            return
+
+        durations = OrderedDict()
+        for name, start, end in DURATIONS:
+            if start in events and end in events:
+                durations[name] = round(1000 * (events[end] - events[start]), 3)
+
+        record = {'id': status_id, 'worker': worker, 'events': events, 'ms': durations}
+        self._file.write(json.dumps(record) + '\n')
+        self._unflushed += 1
+        if self._unflushed >= self._flush_every:
+            self._file.flush()
+            self._unflushed = 0
+
+# Tracer used by mark(), None when tracing is off
+_tracer = None
+
+def configure(path: str = None, sample_rate: float = 0.01, **kwargs) -> Union[Tracer, None]:
+    """
+    Enable tracing to `path`, or disable it if `path` is None. The previous
+    tracer, if any, is closed. Keyword args are forwarded to Tracer.
+
+    Return: The new Tracer, or None
+    """
+    global _tracer
+    previous = _tracer
+    _tracer = Tracer(path, sample_rate, **kwargs) if path is not None else None
+    if previous is not None:
+        previous.close()
+    if _tracer is not None:
+        log.info('Tracing %s of statuses to %s', sample_rate, path)
+    return _tracer
+
+def get() -> Union[Tracer, None]:
+    """Gets the Tracer used by mark(), or None when tracing is off"""
+    return _tracer
+
+def mark(status, worker: str, event: str) -> None:
+    """Record an event for a status and worker class, if the status is sampled"""
+    tracer = _tracer
+    if tracer is None or status is None:
+        return
+    status_id = status.id
+    if tracer.sampled(status_id):
+        tracer.mark(status_id, worker, event)
+
+def summarize(path: str) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Summarize a trace file.
+    Return: p50, p99 and max milliseconds of each duration, by worker class
+    """
+    values = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            durations = values.setdefault(record['worker'], {})
+            for name, ms in record['ms'].items():
+                durations.setdefault(name, []).append(ms)
+
+    result = {}
+    for worker, durations in values.items():
+        result[worker] = {}
+        for name, ms in durations.items():
+            ms.sort()
+            result[worker][name] = {
+                'count': len(ms),
+                'p50': ms[(len(ms) - 1) // 2],
+                'p99': ms[min(len(ms) - 1, int(round(0.99 * (len(ms) - 1))))],
+                'max': ms[-1],
+            }
+    return result
+
+@atexit.register
+def _close() -> None:
+    if _tracer is not None:
+        _tracer.close()
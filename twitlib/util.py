@@ -1,5 +1,14 @@
+import _string
+import functools
 import json
+import os
 import re
+import string
+import time
+
+from typing import Union
+
+from twitter import Status
 
 def list_media(status):
     """
@@ -26,3 +35,282 @@ def remove_urls(text):
     """
     text = re.sub(r"https://t.co\S+", "", text)
     return re.sub(r"\s+", " ", text)
+
+# Keys that Status.AsDict() lifts out of the 'entities' object
+ENTITY_KEYS = ('hashtags', 'media', 'urls', 'user_mentions')
+
+def status_to_dict(status):
+    """
+    Gets a JSON serializable dict for a twitter.Status. The raw dict
+    received from Twitter is preferred when available, since the result
+    of Status.AsDict() does not survive a Status.NewFromJsonDict() round
+    trip unchanged.
+
+    Args
+    ===
+        status : twitter.Status
+    Status object to convert
+
+    Return
+    ===
+    dict : Raw Twitter JSON if available, otherwise status.AsDict()
+    """
+    raw = getattr(status, '_json', None)
+    return raw if isinstance(raw, dict) else status.AsDict()
+
+def status_from_dict(data):
+    """
+    Builds a twitter.Status from a dict produced by status_to_dict().
+    Dicts in the flattened Status.AsDict() layout are converted back to
+    the layout of the Twitter API before parsing.
+
+    Args
+    ===
+        data : dict
+    Raw Twitter JSON or the result of Status.AsDict()
+
+    Return
+    ===
+    twitter.Status : The parsed status
+    """
+    return Status.NewFromJsonDict(_unflatten(data))
+
+def _unflatten(data):
+    if 'entities' in data or not any(k in data for k in ENTITY_KEYS):
+        return data
+
+    data = dict(data)
+    data['entities'] = {k: data.pop(k) for k in ENTITY_KEYS if k in data}
+    for key in ('retweeted_status', 'quoted_status'):
+        if isinstance(data.get(key), dict):
+            data[key] = _unflatten(data[key])
+    return data
+
+class FilenameTemplate(str):
+    """
+    A str.format() template compiled for expansion with the attributes of a
+    status. Only the fields referenced by the template are read from the
+    status, rather than converting the whole status with AsDict(). Fields
+    may use attribute and index access, e.g. '{user.screen_name}' or
+    '{media[0].id}'. Nested models are accessed as objects or as dicts.
+
+    Behaves as the template string it was constructed from.
+    """
+
+    def __new__(cls, fmt: str):
+        self = super().__new__(cls, fmt)
+        self._compiled, self._fields = _compile_template(fmt)
+        return self
+
+    @property
+    def fields(self) -> tuple:
+        """Field names referenced by the template, in order"""
+        return tuple(name for name, first, rest in self._fields)
+
+    def render(self, status) -> str:
+        """
+        Expand the template with the attributes of a status. The result is
+        cached on the status, so it is computed once per status and template.
+
+        Raises
+        ===
+            KeyError :
+        A field is not an attribute of the status
+
+        Return: The expanded template
+        """
+        cache = _name_cache(status)
+        if cache is not None:
+            name = cache.get(self)
+            if name is not None:
+                return name
+
+        values = [_resolve(status, first, rest) for name, first, rest in self._fields]
+        name = self._compiled.format(*values)
+        if cache is not None:
+            cache[self] = name
+        return name
+
+@functools.lru_cache(maxsize=256)
+def compile_template(fmt: str) -> FilenameTemplate:
+    """
+    Compile a template string to a FilenameTemplate. Compiled templates are
+    cached, so compiling the same string again is a dict lookup. A
+    FilenameTemplate is returned unchanged.
+    """
+    if isinstance(fmt, FilenameTemplate):
+        return fmt
+    return FilenameTemplate(fmt)
+
+def _compile_template(fmt: str) -> tuple:
+    """
+    Rewrite a template with positional fields, one per referenced field.
+    Return: (positional template, tuple of (name, first, rest))
+    """
+    parts = []
+    fields = []
+    for literal, name, spec, conversion in string.Formatter().parse(fmt):
+        parts.append(literal.replace('{', '{{').replace('}', '}}'))
+        if name is None:
+            continue
+        if not name or name.isdigit():
+            raise ValueError('Template fields must be named: %r' % fmt)
+        if spec and '{' in spec:
+            raise ValueError('Nested template fields are not supported: %r' % fmt)
+
+        first, rest = _string.formatter_field_name_split(name)
+        parts.append('{%i%s%s}' % (
+            len(fields),
+            '!' + conversion if conversion else '',
+            ':' + spec if spec else ''
+        ))
+        fields.append((name, first, tuple(rest)))
+    return ''.join(parts), tuple(fields)
+
+def _resolve(status, first: str, rest: tuple):
+    if isinstance(status, dict):
+        value = status[first]
+    else:
+        try:
+            value = getattr(status, first)
+        except AttributeError:
+            raise KeyError(first)
+
+    for is_attr, key in rest:
+        if is_attr and not isinstance(value, dict):
+            value = getattr(value, key)
+        else:
+            value = value[key]
+    return value
+
+def _name_cache(status) -> Union[dict, None]:
+    try:
+        attrs = vars(status)
+    except TypeError:
+        return None
+    cache = attrs.get('_twitlib_names')
+    if cache is None:
+        cache = attrs.setdefault('_twitlib_names', {})
+    return cache
+
+# Directories known to exist, see makedirs()
+_made_dirs = set()
+
+def makedirs(path: str) -> str:
+    """
+    Create a directory and any missing parents, as os.makedirs() with
+    exist_ok=True. Created directories are remembered for the lifetime of
+    the process, so the directory of each output file costs a syscall only
+    the first time it is seen. Call forget_dirs() if directories may be
+    removed while running.
+
+    Return: The given path
+    """
+    if path and path not in _made_dirs:
+        os.makedirs(path, exist_ok=True)
+        _made_dirs.add(path)
+    return path
+
+def forget_dirs() -> None:
+    """Clear the directories remembered by makedirs()"""
+    _made_dirs.clear()
+
+# Twitter snowflake ids hold milliseconds since this epoch in the high bits
+SNOWFLAKE_EPOCH_MS = 1288834974657
+
+def shard_by_id(status) -> str:
+    """
+    Two directory levels named by the last four digits of the status id,
+    e.g. '.../56/34' for id 123456. The leading digits of snowflake ids
+    follow the creation time, so the trailing ones are used to spread
+    statuses evenly over 10000 directories.
+    """
+    digits = '%04i' % (status.id % 10000)
+    return os.path.join(digits[2:], digits[:2])
+
+def shard_by_date(status) -> str:
+    """
+    Directory levels named by the UTC creation date, e.g. '2020/01/31'.
+    The date is read from the snowflake id when `created_at` is not set.
+    """
+    if status.created_at:
+        seconds = status.created_at_in_seconds
+    else:
+        seconds = ((status.id >> 22) + SNOWFLAKE_EPOCH_MS) // 1000
+    return time.strftime(os.path.join('%Y', '%m', '%d'), time.gmtime(seconds))
+
+def shard_by_user(status) -> str:
+    """One directory per author, named by the user id"""
+    return str(status.user.id)
+
+SHARDS = {
+    'id': shard_by_id,
+    'date': shard_by_date,
+    'user': shard_by_user,
+}
+
+def check_shard(shard) -> None:
+    """
+    Raises ValueError if `shard` is not a valid argument for shard_dirname()
+    """
+    if shard is None or callable(shard) or shard in SHARDS:
+        return
+    elif isinstance(shard, str):
+        compile_template(shard)
+    else:
+        raise ValueError('shard must be None, a callable or one of %s, or a format string' % (tuple(SHARDS),))
+
+def shard_dirname(status, dirname: str, shard=None) -> str:
+    """
+    Gets the output directory for a status, so that large output trees
+    are split over many directories.
+
+    Args
+    ===
+        status : twitter.Status
+    Status to get the directory for
+
+        dirname : str
+    Root output directory
+
+        shard : str, callable or None
+    'id', 'date' or 'user' (see SHARDS), a format string expanded with the
+    status like a filename format, e.g. '{user.screen_name}', or a callable
+    taking a status and returning a relative path. None disables sharding.
+
+    Return: The directory within `dirname`, or `dirname` if `shard` is None
+    """
+    if shard is None:
+        return dirname
+    elif callable(shard):
+        subdir = shard(status)
+    elif shard in SHARDS:
+        subdir = SHARDS[shard](status)
+    else:
+        subdir = compile_template(shard).render(status)
+    return os.path.join(dirname, subdir) if dirname else subdir
+
+def join_all(threads: list, timeout: float = None) -> list:
+    """
+    Join threads against a shared deadline, rather than waiting up to
+    `timeout` for each thread in turn.
+
+    Return: Threads still alive after the deadline
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for thread in threads:
+        remaining = None if deadline is None else max(0, deadline - time.monotonic())
+        thread.join(remaining)
+    return [t for t in threads if t.is_alive()]
+
+_MASK = (1 << 64) - 1
+
+def hash_id(x: int) -> int:
+    """
+    splitmix64 finalizer, spreads sequential ids evenly over 64 bits.
+    Used to sample and index statuses by id.
+    """
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)